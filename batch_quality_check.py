@@ -0,0 +1,144 @@
+import os
+import re
+import time
+import argparse
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import pandas as pd
+import quality_check
+import html_report
+from qc_cache import TSHC_DIR, build_manifest
+
+
+# pair kinship file e.g. 000001_000002.king.xlsx
+KING_FILE = re.compile(r'^(\d{6})_(\d{6})\.king\.xlsx$')
+
+
+def find_tshc_dirs(root):
+    '''
+    Walk root and return a dict of worksheet number -> list of TSHC output folder paths.
+    The walk does not descend into TSHC output folders, their contents come from the cached
+    manifest of each folder (see qc_cache.build_manifest).
+    '''
+    tshc_dirs = {}
+    for dir_path, dir_names, file_names in os.walk(root):
+        for dir_name in list(dir_names):
+            run_info = TSHC_DIR.match(dir_name)
+            if run_info != None:
+                tshc_dirs.setdefault(run_info.group(2), []).append(os.path.join(dir_path, dir_name, ''))
+                dir_names.remove(dir_name)
+
+    return tshc_dirs
+
+
+def resolve_pair(ws_1, king_file, tshc_dirs):
+    '''
+    Return the TSHC output folder of the 2nd worksheet named by a <ws_1>_<ws_2>.king.xlsx file in
+    the ws_1 folder. This is the ws_2 folder with the same pipeline version as ws_1, or the only
+    ws_2 folder present. Returns None if the folder cannot be resolved.
+    '''
+    version = TSHC_DIR.match(os.path.basename(ws_1.rstrip('/'))).group(3)
+    king = KING_FILE.match(os.path.basename(king_file))
+    ws_2_dirs = tshc_dirs.get(king.group(2), [])
+    same_version = [ws_2 for ws_2 in ws_2_dirs if ws_2.rstrip('/').endswith(version)]
+
+    if len(same_version) == 1:
+        return same_version[0]
+    elif len(ws_2_dirs) == 1:
+        return ws_2_dirs[0]
+
+    return None
+
+
+def find_pairs(root):
+    '''
+    Find every worksheet pair under root. A pair is defined by the <ws_1>_<ws_2>.king.xlsx file
+    in the 1st worksheet's TSHC output folder (the same file get_inputs expects).
+    Returns a sorted list of (ws_1 path, ws_2 path) tuples and a list of pairs which could not be resolved.
+    '''
+    tshc_dirs = find_tshc_dirs(root)
+    pairs = []
+    unresolved = []
+
+    for ws_1_dirs in tshc_dirs.values():
+        for ws_1 in ws_1_dirs:
+            for king_file in build_manifest(ws_1).king_files:
+                ws_2 = resolve_pair(ws_1, king_file, tshc_dirs)
+                if ws_2 != None:
+                    pairs.append((ws_1, ws_2))
+                else:
+                    unresolved.append(os.path.basename(king_file))
+
+    return sorted(pairs), sorted(unresolved)
+
+
+def check_pair(ws_1, ws_2, out_dir, use_cache=True, db=None):
+    '''
+    Run quality_check.run_pair for a pair, isolating any error so it does not stop the batch.
+    Returns a dict describing the outcome of the pair.
+    '''
+    start = time.perf_counter()
+    try:
+        check_result_df, run_details_df = quality_check.run_pair(ws_1, ws_2, out_dir, use_cache=use_cache, db=db)
+        status = 'FAIL' if 'FAIL' in check_result_df['Result'].values else 'PASS'
+        error = ''
+    except Exception as e:
+        traceback.print_exc()
+        status = 'ERROR'
+        error = str(e)
+
+    return {'ws_1': ws_1, 'ws_2': ws_2, 'Status': status, 'Error': error,
+            'Seconds': round(time.perf_counter() - start, 2)}
+
+
+def run_batch(root, out_dir=None, workers=4, use_cache=True, db=None):
+    '''
+    Check every worksheet pair found under root on a process pool of at most workers processes.
+    Each pair is checked in a single task, so workbooks shared within a pair (e.g. the negative
+    report and the results reports) are opened and parsed once by that task, and each worker
+    compiles the rules of a panel once and shares them across all of its pairs (see qc_rules.load_rules).
+    If out_dir is given a dashboard of the pairs (quality_check_dashboard.html, see
+    html_report.render_dashboard) is also written to out_dir.
+    Returns a dataframe with one row per pair.
+    '''
+    pairs, unresolved = find_pairs(root)
+    for pair in unresolved:
+        print(f'Unable to find the TSHC output folder for both worksheets of {pair}')
+
+    print(f'Found {len(pairs)} worksheet pairs under {root}')
+    start = time.perf_counter()
+    results = []
+
+    with ProcessPoolExecutor(max_workers=workers) as ex:
+        futures = [ex.submit(check_pair, ws_1, ws_2, out_dir, use_cache, db) for ws_1, ws_2 in pairs]
+        for future in as_completed(futures):
+            results.append(future.result())
+
+    elapsed = time.perf_counter() - start
+    batch_df = pd.DataFrame(results, columns=['ws_1', 'ws_2', 'Status', 'Error', 'Seconds'])
+    batch_df = batch_df.sort_values(by=['ws_1', 'ws_2'])
+
+    pairs_per_min = len(pairs) / elapsed * 60 if elapsed > 0 else 0
+    print(batch_df.to_string(index=False))
+    print(f'Checked {len(pairs)} pairs in {elapsed:.1f}s ({pairs_per_min:.1f} pairs/minute) with {workers} workers: '
+          + ', '.join(f'{status} {count}' for status, count in batch_df['Status'].value_counts().items()))
+
+    if out_dir != None:
+        jsonl_paths = [os.path.join(out_dir, '_'.join(sorted(TSHC_DIR.match(os.path.basename(ws.rstrip('/'))).group(2) for ws in (row.ws_1, row.ws_2)))
+                                    + '_quality_checks.jsonl') for row in batch_df[batch_df['Status'] != 'ERROR'].itertuples()]
+        html_report.render_dashboard(jsonl_paths, os.path.join(out_dir, 'quality_check_dashboard.html'))
+
+    return batch_df
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-root', action='store', required=True, help='Path to a folder containing TSHC_<ws>_<version> output folders')
+    parser.add_argument('-out_dir', action='store', nargs='?', help='Specifing an output directory to store html reports')
+    parser.add_argument('-workers', action='store', type=int, default=4, help='Maximum number of pairs checked at once (default 4)')
+    parser.add_argument('-no_cache', '--no-cache', action='store_true', dest='no_cache', help='Re-run every check instead of using cached results')
+    parser.add_argument('-db', action='store', default=quality_check.DEFAULT_DB, help=f'Results database to add the results to (default {quality_check.DEFAULT_DB})')
+    parser.add_argument('-no_db', action='store_true', help='Do not add the results to the results database')
+    args = parser.parse_args()
+
+    run_batch(args.root, args.out_dir, args.workers, not args.no_cache, None if args.no_db else args.db)
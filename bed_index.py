@@ -0,0 +1,150 @@
+import os
+import hashlib
+import threading
+import numpy as np
+import pandas as pd
+from collections import namedtuple
+import qc_cache
+
+
+# Sorted, array-backed index of the intervals of a BED file. chroms holds the chromosome names
+# (without a chr prefix) and keys the chromosome code * 2**32 + end of each interval, sorted by key
+# then start, so the intervals ending at a position are found with np.searchsorted. starts/ends are
+# 0-based half open as in the BED file.
+BedIndex = namedtuple('BedIndex', ['path', 'chroms', 'keys', 'starts', 'ends', 'names'])
+
+_indexes = {}
+_index_lock = threading.Lock()
+
+
+def normalise_chroms(chroms):
+    '''
+    Chromosome names without a chr prefix e.g. chr1 -> 1, so BED files and reports match either way.
+    A numeric chromosome read as a float (e.g. 1.0 from a Chr column with a blank cell) is named as an int.
+    '''
+    names = [str(int(chrom)) if isinstance(chrom, float) and chrom.is_integer() else str(chrom) for chrom in chroms]
+
+    return pd.Series(names, dtype=str).str.replace(r'^chr', '', regex=True).values
+
+
+def interval_keys(chroms, chrom_codes, ends):
+    '''
+    Sort keys (chromosome code * 2**32 + end) of intervals. chrom_codes maps chromosome names to
+    codes; intervals on other chromosomes get the key -1.
+    '''
+    codes = pd.Series(normalise_chroms(chroms)).map(chrom_codes).fillna(-1).values.astype(np.int64)
+    keys = codes * 2 ** 32 + np.asarray(ends, dtype=np.int64)
+
+    return np.where(codes < 0, -1, keys)
+
+
+def build_index(path):
+    '''
+    Parse a BED file (chrom, start, end and optional name columns, track/browser/# lines ignored)
+    into a BedIndex sorted by chromosome, end and start. Duplicate intervals are dropped.
+    '''
+    bed_df = pd.read_csv(path, sep='\t', header=None, comment='#', dtype={0: str})
+    bed_df = bed_df[~bed_df[0].str.startswith(('track', 'browser'))]
+    if len(bed_df.columns) < 4:
+        bed_df[3] = ''
+
+    bed_df = bed_df[[0, 1, 2, 3]].drop_duplicates(subset=[0, 1, 2])
+    chroms = normalise_chroms(bed_df[0])
+    chrom_names = list(dict.fromkeys(chroms))
+    keys = interval_keys(chroms, {chrom: code for code, chrom in enumerate(chrom_names)}, bed_df[2].values)
+    starts = bed_df[1].values.astype(np.int64)
+    order = np.lexsort((starts, keys))
+
+    return BedIndex(path=path, chroms=np.array(chrom_names), keys=keys[order],
+                    starts=starts[order], ends=bed_df[2].values.astype(np.int64)[order],
+                    names=np.array(bed_df[3].fillna('').astype(str).tolist(), dtype=str)[order])
+
+
+def load_index(path):
+    '''
+    Return the BedIndex of a BED file. The index is built once per BED file: it is kept in memory
+    and saved to the cache folder (bed_index/<sha1 of path>.npz), so every process of a batch sharing
+    a BED file loads the arrays instead of parsing the BED file. The index is rebuilt if the size or
+    mtime of the BED file changes.
+    '''
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    version = np.array([stat.st_size, stat.st_mtime_ns], dtype=np.int64)
+
+    with _index_lock:
+        if path in _indexes and np.array_equal(_indexes[path][0], version):
+            return _indexes[path][1]
+
+    cache_file = os.path.join(qc_cache.CACHE_DIR, 'bed_index', hashlib.sha1(path.encode()).hexdigest() + '.npz')
+    index = None
+    try:
+        with np.load(cache_file, allow_pickle=False) as cached:
+            if np.array_equal(cached['version'], version):
+                index = BedIndex(path=path, **{field: cached[field] for field in BedIndex._fields[1:]})
+    except (OSError, KeyError, ValueError):
+        pass
+
+    if index == None:
+        index = build_index(path)
+        try:
+            os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+            tmp_file = f'{cache_file}.{os.getpid()}.tmp.npz'
+            np.savez(tmp_file, version=version, **{field: getattr(index, field) for field in BedIndex._fields[1:]})
+            os.replace(tmp_file, cache_file)
+        except OSError:
+            pass
+
+    with _index_lock:
+        _indexes[path] = (version, index)
+
+    return index
+
+
+def interval_labels(index, rows):
+    '''
+    Names of BED intervals e.g. BRCA1_exon2 17:41276034-41276132 (1-based coordinates).
+    '''
+    coordinates = [f'{index.chroms[key >> 32]}:{start + 1}-{end}' for key, start, end
+                   in zip(index.keys[rows], index.starts[rows], index.ends[rows])]
+
+    return [f'{name} {coordinate}'.strip() for name, coordinate in zip(index.names[rows], coordinates)]
+
+
+def join_intervals(index, chroms, starts, ends):
+    '''
+    Join intervals (e.g. the rows of a Coverage-exon tab) to the BED intervals. An interval matches
+    a BED interval with the same chromosome, end and start, where the start may be the BED start
+    (0-based) or the BED start + 1 (1-based); a 0-based match is preferred. The BED intervals with
+    the same chromosome and end as an interval are found with np.searchsorted on the sorted keys
+    and their starts compared, one position of the run of equal keys at a time (BED intervals
+    rarely share an end, so there are few positions).
+    Intervals with a blank or non-numeric start or end match no BED row, so they are extra.
+    Returns the BED rows with no matching interval (missing) and the intervals with no matching BED row (extra).
+    '''
+    if len(index.keys) == 0:
+        return np.arange(0), np.arange(len(ends))
+
+    starts = pd.to_numeric(pd.Series(starts), errors='coerce').values.astype(float)
+    ends = pd.to_numeric(pd.Series(ends), errors='coerce').values.astype(float)
+    valid = np.isfinite(starts) & np.isfinite(ends)
+    starts = np.where(valid, starts, -1).astype(np.int64)
+
+    chrom_codes = {chrom: code for code, chrom in enumerate(index.chroms)}
+    keys = np.where(valid, interval_keys(chroms, chrom_codes, np.where(valid, ends, 0).astype(np.int64)), -1)
+
+    first = np.searchsorted(index.keys, keys, side='left')
+    last = np.where(keys >= 0, np.searchsorted(index.keys, keys, side='right'), first)
+    rows = np.full(len(keys), -1, dtype=np.int64)
+
+    for offset in (0, 1):
+        for position in range(int((last - first).max(initial=0))):
+            candidates = first + position
+            in_run = (rows < 0) & (candidates < last)
+            candidates = np.where(in_run, candidates, 0)
+            rows = np.where(in_run & (index.starts[candidates] + offset == starts), candidates, rows)
+
+    matched = rows >= 0
+    found = np.zeros(len(index.keys), dtype=bool)
+    found[rows[matched]] = True
+
+    return np.flatnonzero(~found), np.flatnonzero(~matched)
@@ -0,0 +1,200 @@
+import os
+import argparse
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+import excel_reader
+import qc_cache
+import mock_tshc
+
+
+def make_workbook(path, rows, cols):
+    '''
+    Write a workbook shaped like the pipeline reports: a 'Check' tab with a string 'Result'
+    column and a 'Kinship' tab with a float 'Kinship' column, each padded with extra columns.
+    '''
+    padding = {f'Column {i}': np.random.rand(rows) for i in range(cols)}
+
+    check_df = pd.DataFrame({'Sample': [f'sample_{i}' for i in range(rows)],
+                             'Result': np.random.choice(['PASS', 'FAIL'], rows), **padding})
+    kinship_df = pd.DataFrame({'ID1': [f'sample_{i}' for i in range(rows)],
+                               'ID2': [f'sample_{i + 1}' for i in range(rows)],
+                               'Kinship': np.random.rand(rows) / 2, **padding})
+
+    with pd.ExcelWriter(path) as writer:
+        check_df.to_excel(writer, 'Check', index=False)
+        kinship_df.to_excel(writer, 'Kinship', index=False)
+
+
+def time_reader(reader, repeats):
+    '''
+    Best wall time over a number of repeats of reader() and the peak traced memory of one more
+    call. The times are taken with tracemalloc off, as tracing every allocation slows pandas and
+    the excel parsers several fold. The excel_reader cache is cleared before each call so every
+    call parses the file.
+    '''
+    times = []
+    for i in range(repeats):
+        excel_reader.clear_cache()
+        start = time.perf_counter()
+        reader()
+        times.append(time.perf_counter() - start)
+
+    excel_reader.clear_cache()
+    tracemalloc.start()
+    try:
+        reader()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return min(times), peak
+
+
+def bench_column_readers(path, repeats):
+    '''
+    Compare pd.read_excel (whole sheet), pd.read_excel (usecols) and excel_reader.read_column
+    for the single column reads used by fastq_bam_check and kinship_check.
+    '''
+    rows = []
+
+    for sheet, column in [('Check', 'Result'), ('Kinship', 'Kinship')]:
+        readers = {
+            'pd.read_excel': lambda: pd.read_excel(path, sheet)[column].values,
+            'pd.read_excel usecols': lambda: pd.read_excel(path, sheet, usecols=[column])[column].values,
+            'read_column': lambda: excel_reader.read_column(path, sheet, column),
+        }
+        for name, reader in readers.items():
+            best, peak = time_reader(reader, repeats)
+            rows.append({'Sheet': sheet, 'Reader': name,
+                         'Best time (ms)': round(best * 1000, 1),
+                         'Peak memory (KiB)': round(peak / 1024)})
+
+    return pd.DataFrame(rows, columns=['Sheet', 'Reader', 'Best time (ms)', 'Peak memory (KiB)'])
+
+
+def bench_checks(ws_1, ws_2, repeats):
+    '''
+    Time each check function of quality_check on its own for a mock pair. The excel_reader cache
+    is cleared before each repeat (see time_reader) so every check parses its workbooks.
+    '''
+    import quality_check
+    import qc_rules
+
+    xls_rep_1, xls_rep_2, neg_rep, fastq_bam_1, fastq_bam_2, kin_xls, vcf_dir_1, vcf_dir_2, cmd_log_1, cmd_log_2, panel = quality_check.get_inputs(ws_1, ws_2)
+    rules = qc_rules.load_rules(panel)
+    coverage_bed = quality_check.coverage_bed_path(xls_rep_1)
+    empty_df = pd.DataFrame(columns=['Worksheet', 'Check', 'Description', 'Result', 'Cached', 'Failures'])
+    details_df = pd.DataFrame(columns=['Worksheet', 'Pipeline version', 'Experiment name', 'Bed files', 'AB threshold'])
+
+    checks = {
+        'get_inputs': lambda: quality_check.get_inputs(ws_1, ws_2, use_cache=False),
+        'results_excel_check': lambda: quality_check.results_excel_check(xls_rep_1, rules, empty_df),
+        'vcf_dir_check': lambda: quality_check.vcf_dir_check(vcf_dir_1, rules, empty_df),
+        'fastq_bam_check': lambda: quality_check.fastq_bam_check(fastq_bam_1, rules, empty_df),
+        'neg_excel_check': lambda: quality_check.neg_excel_check(neg_rep, coverage_bed, rules, empty_df),
+        'kinship_check': lambda: quality_check.kinship_check(kin_xls, rules, empty_df),
+        'vcf_integrity_check': lambda: quality_check.vcf_integrity_check(vcf_dir_1, False, empty_df),
+        'vcf_integrity_check (records)': lambda: quality_check.vcf_integrity_check(vcf_dir_1, True, empty_df),
+        'run_details': lambda: quality_check.run_details(cmd_log_1, xls_rep_1, details_df),
+    }
+
+    rows = []
+    for name, check in checks.items():
+        best, peak = time_reader(check, repeats)
+        rows.append({'Check': name, 'Best time (ms)': round(best * 1000, 1),
+                     'Peak memory (KiB)': round(peak / 1024)})
+
+    return pd.DataFrame(rows, columns=['Check', 'Best time (ms)', 'Peak memory (KiB)'])
+
+
+def bench_pair(ws_1, ws_2, out_dir, repeats):
+    '''
+    Best wall time of quality_check.run_pair for a mock pair: uncached, with the result cache
+    filled by an earlier run, and with the checks run on a pool of 4 threads and 4 processes.
+    '''
+    import quality_check
+
+    runs = {
+        'uncached': dict(use_cache=False),
+        'cached': dict(use_cache=True),
+        'uncached, 4 threads': dict(use_cache=False, workers=4, pool='thread'),
+        'uncached, 4 processes': dict(use_cache=False, workers=4, pool='process'),
+    }
+
+    rows = []
+    for name, kwargs in runs.items():
+        # an untimed run fills the result cache (and the BED index) for the cached runs
+        quality_check.run_pair(ws_1, ws_2, out_dir, db=None, **kwargs)
+        times = []
+        for i in range(repeats):
+            start = time.perf_counter()
+            quality_check.run_pair(ws_1, ws_2, out_dir, db=None, **kwargs)
+            times.append(time.perf_counter() - start)
+        rows.append({'Run': name, 'Best time (ms)': round(min(times) * 1000, 1),
+                     'Mean time (ms)': round(np.mean(times) * 1000, 1)})
+
+    return pd.DataFrame(rows, columns=['Run', 'Best time (ms)', 'Mean time (ms)'])
+
+
+def bench_batch(root, out_dir, workers):
+    '''
+    Wall time and pairs per minute of batch_quality_check.run_batch over the mock pairs under root,
+    uncached and with the result cache filled by an earlier run.
+    '''
+    import batch_quality_check
+
+    rows = []
+    for name, use_cache in [('uncached', False), ('cached', True)]:
+        if use_cache:
+            # an untimed run fills the result cache, uncached runs do not store their results
+            batch_quality_check.run_batch(root, out_dir, workers, use_cache, None)
+        start = time.perf_counter()
+        batch_df = batch_quality_check.run_batch(root, out_dir, workers, use_cache, None)
+        elapsed = time.perf_counter() - start
+        rows.append({'Run': name, 'Pairs': len(batch_df), 'Workers': workers, 'Time (s)': round(elapsed, 2),
+                     'Pairs/minute': round(len(batch_df) / elapsed * 60, 1)})
+
+    return pd.DataFrame(rows, columns=['Run', 'Pairs', 'Workers', 'Time (s)', 'Pairs/minute'])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-suite', action='store', choices=['readers', 'checks', 'pair', 'batch', 'all'], default='readers',
+                        help='Benchmarks to run: the excel readers (default), each check, a full pair or a batch of pairs on mock TSHC data')
+    parser.add_argument('-rows', action='store', type=int, default=1209, help='Number of rows in each benchmark sheet')
+    parser.add_argument('-cols', action='store', type=int, default=12, help='Number of padding columns in each benchmark sheet')
+    parser.add_argument('-repeats', action='store', type=int, default=5, help='Number of timed repeats for each reader')
+    parser.add_argument('-samples', action='store', type=int, default=48, help='Samples per mock worksheet (default 48)')
+    parser.add_argument('-exons', action='store', type=int, default=1209, help='Exons in the mock coverage BED (default 1209)')
+    parser.add_argument('-pairs', action='store', type=int, default=8, help='Mock pairs in the batch benchmark (default 8)')
+    parser.add_argument('-workers', action='store', type=int, default=4, help='Workers of the batch benchmark (default 4)')
+    parser.add_argument('-data_dir', action='store', help='Folder for the mock TSHC data (default a temporary folder). Existing workbooks, VCFs and logs are overwritten, an existing coverage BED is kept.')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if args.suite in ('readers', 'all'):
+            xlsx = os.path.join(tmp_dir, 'benchmark.xlsx')
+            make_workbook(xlsx, args.rows, args.cols)
+            print(f'Benchmark workbook: {args.rows} rows x {args.cols + 3} columns, {os.path.getsize(xlsx)} bytes')
+            print(bench_column_readers(xlsx, args.repeats).to_string(index=False))
+
+        if args.suite != 'readers':
+            # the mock data, reports and caches are kept apart from the real ones
+            data_dir = args.data_dir or os.path.join(tmp_dir, 'data')
+            out_dir = os.path.join(tmp_dir, 'reports')
+            os.makedirs(out_dir)
+            qc_cache.CACHE_DIR = os.path.join(tmp_dir, 'cache')
+
+            num_pairs = args.pairs if args.suite in ('batch', 'all') else 1
+            pairs = mock_tshc.make_batch(data_dir, num_pairs, args.samples, args.exons, failures=list(mock_tshc.FAILURES))
+            print(f'Mock TSHC data: {num_pairs} pairs of {args.samples} samples, {args.exons} exons')
+
+            if args.suite in ('checks', 'all'):
+                print(bench_checks(*pairs[0], args.repeats).to_string(index=False))
+            if args.suite in ('pair', 'all'):
+                print(bench_pair(*pairs[0], out_dir, args.repeats).to_string(index=False))
+            if args.suite in ('batch', 'all'):
+                print(bench_batch(data_dir, out_dir, args.workers).to_string(index=False))
@@ -0,0 +1,81 @@
+import re
+import argparse
+from collections import namedtuple
+import qc_prefetch
+
+
+# The pipeline command of a worksheet in its commandline_usage_logfile. The sample sheet follows
+# the -s flag on the next line e.g.
+#   python TSHC_pipeline.py -s
+#   /network/sequenced/MiSeq_data/TSHC/shire_worksheet_numbered/000001/191212_M01234_0123_000000000-ABCDE/SampleSheet.csv -p TSHC
+SAMPLE_SHEET_FLAG = re.compile(r'(?:^|\s)-s\s*$')
+SAMPLE_SHEET = re.compile(r'^/network/sequenced/MiSeq_data/(\w{4,7})/(shire_worksheet_numbered|Validation)/'
+                          r'(?:200000-299999/)?(?:300000-399999/)?(\d{6})/(\d{6}_M\d{5}_\d{4}_\d{9}-\w{5})/SampleSheet\.csv(?=\s|$)')
+# a command line flag e.g. -s or --threads (not a negative number)
+FLAG = re.compile(r'^--?[A-Za-z]')
+
+# Pipeline command of a worksheet. line is the line number of the sample sheet, program the
+# command before the 1st flag and arguments each flag with its value (True for a flag without one).
+CommandLog = namedtuple('CommandLog', ['path', 'worksheet', 'line', 'command', 'program', 'arguments',
+                                       'sample_sheet', 'panel', 'run_folder', 'experiment_name'])
+
+
+def command_arguments(tokens):
+    '''
+    {flag: value} of a split command line, without the leading dashes. A flag followed by
+    another flag (or nothing) has the value True.
+    '''
+    arguments = {}
+    for i, token in enumerate(tokens):
+        if FLAG.match(token):
+            has_value = i + 1 < len(tokens) and not FLAG.match(tokens[i + 1])
+            arguments[token.lstrip('-')] = tokens[i + 1] if has_value else True
+
+    return arguments
+
+
+def log_lines(path):
+    '''
+    Stream the lines of a command log (from memory if it was prefetched, see qc_prefetch).
+    '''
+    source = qc_prefetch.source(path)
+    file = open(source, 'rb') if isinstance(source, str) else source
+
+    with file:
+        for line in file:
+            yield line.decode(errors='replace').rstrip('\r\n')
+
+
+def parse_command_log(path, worksheet):
+    '''
+    Find the pipeline command of a worksheet in its commandline_usage_logfile. The log is read one
+    line at a time and only a line following a -s flag is matched against the sample sheet pattern,
+    so memory is bounded and the scan stops at the first command for the worksheet.
+    Returns a CommandLog.
+    '''
+    previous = ''
+    for number, line in enumerate(log_lines(path), start=1):
+        sample_sheet = SAMPLE_SHEET.match(line) if SAMPLE_SHEET_FLAG.search(previous) else None
+
+        if sample_sheet != None and sample_sheet.group(3) == worksheet:
+            tokens = previous.split() + line.split()
+            flags = [i for i, token in enumerate(tokens) if FLAG.match(token)]
+
+            return CommandLog(path=path, worksheet=worksheet, line=number, command=' '.join(tokens),
+                              program=' '.join(tokens[:flags[0]]), arguments=command_arguments(tokens),
+                              sample_sheet=sample_sheet.group(0), panel=sample_sheet.group(1),
+                              run_folder=sample_sheet.group(2), experiment_name=sample_sheet.group(4))
+        previous = line
+
+    raise Exception('The experiment name is not present! check regex pattern.')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Print the pipeline command of a worksheet from its commandline_usage_logfile')
+    parser.add_argument('-cmd_log', action='store', required=True, help='Path to a <ws>.commandline_usage_logfile')
+    parser.add_argument('-worksheet', action='store', required=True, help='Worksheet number')
+    args = parser.parse_args()
+
+    command = parse_command_log(args.cmd_log, args.worksheet)
+    for field, value in command._asdict().items():
+        print(f'{field}: {value}')
@@ -0,0 +1,292 @@
+import os
+import re
+import zipfile
+import threading
+import numpy as np
+import pandas as pd
+import xml.etree.ElementTree as ET
+import qc_prefetch
+
+
+# Open workbooks and parsed sheets are held for the lifetime of the process so that
+# a workbook used by more than one check (e.g. the results report) is only opened once.
+_open_workbooks = {}
+_parsed_sheets = {}
+_counted_workbooks = set()
+# one lock per workbook so concurrent checks on different workbooks parse in parallel
+# while checks sharing a workbook wait for the first one to open and parse it
+_cache_lock = threading.Lock()
+_workbook_locks = {}
+parse_stats = {'workbooks': 0, 'bytes': 0, 'sheets': 0}
+
+# xlsx (OOXML) namespaces used by the streaming column reader
+XLSX_NS = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+REL_NS = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}'
+PKG_REL_NS = '{http://schemas.openxmlformats.org/package/2006/relationships}'
+
+# strings read as NaN by pd.read_excel (pandas default na_values)
+NA_STRINGS = {'', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND',
+              '1.#QNAN', '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'n/a', 'nan', 'null'}
+
+
+def _workbook_lock(path):
+    '''
+    Return the lock guarding the cache entries of a single workbook.
+    '''
+    with _cache_lock:
+        return _workbook_locks.setdefault(path, threading.Lock())
+
+
+def open_workbook(path):
+    '''
+    Return a pd.ExcelFile for path, opening the workbook on first use only. A prefetched
+    workbook is opened from memory (see qc_prefetch).
+    The size of each newly opened workbook is added to parse_stats.
+    '''
+    with _workbook_lock(path):
+        if path not in _open_workbooks:
+            _open_workbooks[path] = pd.ExcelFile(qc_prefetch.source(path))
+            _count_workbook(path)
+
+    return _open_workbooks[path]
+
+
+def _count_workbook(path):
+    '''
+    Add a workbook to parse_stats the first time it is read by either reader.
+    '''
+    with _cache_lock:
+        if path not in _counted_workbooks:
+            _counted_workbooks.add(path)
+            parse_stats['workbooks'] += 1
+            parse_stats['bytes'] += os.path.getsize(path)
+
+
+def read_sheet(path, sheet, columns):
+    '''
+    Parse the named columns of a single sheet from an excel workbook. Only the requested
+    columns are parsed (all columns if columns is None) and the resulting dataframe is cached,
+    so repeated requests for the same sheet and columns (e.g. from ws_1 and ws_2 sharing a
+    report) do not re-parse the file.
+    '''
+    key = (path, sheet, None if columns == None else tuple(columns))
+
+    xls = open_workbook(path)
+
+    with _workbook_lock(path):
+        if key not in _parsed_sheets:
+            _parsed_sheets[key] = pd.read_excel(xls, sheet, usecols=None if columns == None else list(columns))
+            with _cache_lock:
+                parse_stats['sheets'] += 1
+
+    return _parsed_sheets[key]
+
+
+def read_column(path, sheet, column):
+    '''
+    Read a single named column from a sheet of an xlsx workbook without building a dataframe
+    (see read_columns). Returns a numpy array of the column values (excluding the header).
+    '''
+    return read_columns(path, sheet, [column])[column]
+
+
+def read_columns(path, sheet, columns):
+    '''
+    Read columns of a sheet of an xlsx workbook, by name or 0-based position, without building a
+    dataframe. The sheet XML is streamed from the xlsx zip once for all the columns not already
+    cached and only the cells in those columns are kept. Shared strings are then resolved in a
+    second streaming pass which only stores the strings referenced by the header row and the
+    columns. Blank cells are returned as NaN. Each column is cached on its own, so a column read
+    by one check is reused by the next. A column missing from the sheet raises a KeyError.
+    Returns {column: numpy array of the column values (excluding the header)}.
+    '''
+    keys = {column: (path, sheet, (column,), 'column') for column in columns}
+
+    with _workbook_lock(path):
+        missing = [column for column, key in keys.items() if key not in _parsed_sheets]
+        if missing:
+            with zipfile.ZipFile(qc_prefetch.source(path)) as zf:
+                values = _stream_columns(zf, _sheet_xml_path(zf, sheet, path), missing)
+            for column in missing:
+                _parsed_sheets[keys[column]] = values[column]
+            _count_workbook(path)
+            with _cache_lock:
+                parse_stats['sheets'] += 1
+
+        return {column: _parsed_sheets[key] for column, key in keys.items()}
+
+
+def _sheet_xml_path(zf, sheet, path):
+    '''
+    Resolve a sheet name to its worksheet XML member using workbook.xml and its relationships.
+    '''
+    rel_id = None
+    for elem in ET.fromstring(zf.read('xl/workbook.xml')).iter(XLSX_NS + 'sheet'):
+        if elem.get('name') == sheet:
+            rel_id = elem.get(REL_NS + 'id')
+
+    if rel_id == None:
+        raise Exception('Sheet {} is not present in {}'.format(sheet, path))
+
+    for rel in ET.fromstring(zf.read('xl/_rels/workbook.xml.rels')).iter(PKG_REL_NS + 'Relationship'):
+        if rel.get('Id') == rel_id:
+            target = rel.get('Target')
+            return target.lstrip('/') if target.startswith('/') else 'xl/' + target
+
+    raise Exception('Sheet {} has no worksheet XML in {}'.format(sheet, path))
+
+
+def _cell_ref(cell, position):
+    '''
+    Column letters of a cell. The 'r' attribute is optional in OOXML so fall back to position.
+    '''
+    ref = cell.get('r')
+    if ref != None:
+        return re.match(r'[A-Z]+', ref).group(0)
+
+    return _column_letters(position)
+
+
+def _column_letters(position):
+    '''
+    Column letters of a 0-based column position e.g. 0 -> A, 26 -> AA.
+    '''
+    letters = ''
+    position += 1
+    while position:
+        position, rem = divmod(position - 1, 26)
+        letters = chr(65 + rem) + letters
+    return letters
+
+
+def _cell_raw(cell):
+    '''
+    (type, raw value) of a cell element. Inline strings are returned as type 'str'.
+    '''
+    cell_type = cell.get('t', 'n')
+    if cell_type == 'inlineStr':
+        return 'str', ''.join(t.text or '' for t in cell.iter(XLSX_NS + 't'))
+
+    value = cell.find(XLSX_NS + 'v')
+    return cell_type, None if value == None else value.text
+
+
+def _stream_columns(zf, sheet_xml, columns):
+    '''
+    Stream the worksheet XML row by row keeping only the header row and the target columns.
+    As with pd.read_excel (and so read_sheet), blank rows between the data rows are kept as NaN
+    whether or not the XML has an element for them (rows are numbered by their 'r' attribute), and
+    blank rows after the last data row are dropped, so the values line up with the rows of read_sheet.
+    '''
+    header = None
+    column_refs = {}
+    raw_rows = []
+    row_number = 0
+    # number of rows up to the last row with a value in any column
+    num_rows = 0
+
+    with zf.open(sheet_xml) as sheet_file:
+        for event, row in ET.iterparse(sheet_file):
+            if row.tag != XLSX_NS + 'row':
+                continue
+
+            previous_row = row_number
+            row_number = int(row.get('r')) if row.get('r') != None else row_number + 1
+            cells = {_cell_ref(cell, i): _cell_raw(cell) for i, cell in enumerate(row.iter(XLSX_NS + 'c'))}
+            row.clear()
+
+            if header == None:
+                header = cells
+                shared = _shared_strings(zf, {int(v) for t, v in header.values() if t == 's'})
+                names = {_convert(cell_type, value, shared): ref for ref, (cell_type, value) in header.items()}
+                for column in columns:
+                    column_refs[column] = _column_letters(column) if isinstance(column, int) else names.get(column)
+                    if column_refs[column] == None:
+                        raise KeyError('Column {} is not present in {}'.format(column, sheet_xml))
+            else:
+                raw_rows.extend([[('n', None)] * len(columns)] * (row_number - previous_row - 1))
+                raw_rows.append([cells.get(column_refs[column], ('n', None)) for column in columns])
+                if any(value != None for cell_type, value in cells.values()):
+                    num_rows = len(raw_rows)
+
+    raw_rows = raw_rows[:num_rows]
+    shared = _shared_strings(zf, {int(v) for raw_row in raw_rows for t, v in raw_row if t == 's' and v != None})
+
+    values = {}
+    for i, column in enumerate(columns):
+        column_values = [_convert(cell_type, value, shared) for cell_type, value in (raw_row[i] for raw_row in raw_rows)]
+        # as with pandas, a column of whole numbers is returned as int and a column where every
+        # value is numeric (e.g. 'inf' strings) as float
+        if column_values and all(type(value) == int for value in column_values):
+            values[column] = np.array(column_values, dtype=np.int64)
+            continue
+        try:
+            values[column] = np.array(column_values, dtype=float)
+        except ValueError:
+            values[column] = np.array(column_values, dtype=object)
+
+    return values
+
+
+def _shared_strings(zf, indices):
+    '''
+    Stream the shared strings table and return {index: string} for the requested indices only.
+    '''
+    strings = {}
+    if not indices or 'xl/sharedStrings.xml' not in zf.namelist():
+        return strings
+
+    last = max(indices)
+    with zf.open('xl/sharedStrings.xml') as ss_file:
+        index = 0
+        for event, elem in ET.iterparse(ss_file):
+            if elem.tag != XLSX_NS + 'si':
+                continue
+            if index in indices:
+                strings[index] = ''.join(t.text or '' for t in elem.iter(XLSX_NS + 't'))
+            elem.clear()
+            if index == last:
+                break
+            index += 1
+
+    return strings
+
+
+def _convert(cell_type, value, shared):
+    '''
+    Convert a raw cell value to the python value pandas would produce for it. Error cells
+    (e.g. #DIV/0!) are NaN.
+    '''
+    if value == None or cell_type == 'e':
+        return np.nan
+    if cell_type == 's':
+        value = shared[int(value)]
+    if cell_type == 'b':
+        return value == '1'
+    if cell_type in ('s', 'str'):
+        return np.nan if value in NA_STRINGS else value
+
+    # as with pandas, whole numbers are read as ints
+    value = float(value)
+    return int(value) if value.is_integer() else value
+
+
+def clear_cache():
+    '''
+    Close all open workbooks and drop any parsed sheets and parse statistics.
+    '''
+    for xls in _open_workbooks.values():
+        xls.close()
+
+    _open_workbooks.clear()
+    _parsed_sheets.clear()
+    _counted_workbooks.clear()
+    _workbook_locks.clear()
+    parse_stats.update({'workbooks': 0, 'bytes': 0, 'sheets': 0})
+
+
+def parse_summary():
+    '''
+    One line description of the workbooks, bytes and sheets parsed so far.
+    '''
+    return 'Parsed {sheets} sheets from {workbooks} workbooks ({bytes} bytes)'.format(**parse_stats)
@@ -0,0 +1,172 @@
+import os
+import re
+import time
+import gzip
+import zlib
+import argparse
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from excel_reader import read_sheet
+
+
+# Illumina FASTQ names e.g. 000001-01-D19-10001-AB-TSHC-001_S1_L001_R1_001.fastq.gz
+FASTQ_FILE = re.compile(r'^(.+?)_S\d+(?:_L\d{3})?_(R[12])_\d{3}\.f(?:ast)?q(?:\.gz)?$')
+CHUNK_SIZE = 4 * 1024 * 1024
+
+
+def find_fastqs(fastq_dir):
+    '''
+    Walk fastq_dir and return a dict of sample name -> {'R1': [paths], 'R2': [paths]} for each
+    Illumina named FASTQ(.gz) file.
+    '''
+    fastqs = {}
+    for dir_path, dir_names, file_names in os.walk(fastq_dir):
+        for file_name in sorted(file_names):
+            fastq = FASTQ_FILE.match(file_name)
+            if fastq != None:
+                sample, read = fastq.groups()
+                fastqs.setdefault(sample, {'R1': [], 'R2': []})[read].append(os.path.join(dir_path, file_name))
+
+    return fastqs
+
+
+def count_lines(path):
+    '''
+    Count the lines of a plain or gzipped file by streaming it in CHUNK_SIZE blocks of
+    (decompressed) data, so only one block is held in memory.
+    '''
+    with open(path, 'rb') as file:
+        gzipped = file.read(2) == b'\x1f\x8b'
+
+    lines = 0
+    last = b'\n'
+    with (gzip.open(path, 'rb') if gzipped else open(path, 'rb')) as file:
+        for block in iter(lambda: file.read(CHUNK_SIZE), b''):
+            lines += block.count(b'\n')
+            last = block[-1:]
+
+    # a final line without a newline
+    if last != b'\n':
+        lines += 1
+
+    return lines
+
+
+def count_reads(path):
+    '''
+    Count the reads (4 lines each) of a FASTQ(.gz). Returns the path, number of reads, the
+    compressed size of the file and an error (None if the file has a whole number of reads).
+    '''
+    try:
+        lines = count_lines(path)
+    except (OSError, EOFError, zlib.error) as e:
+        return path, None, os.path.getsize(path), f'Unreadable file: {e}'
+
+    error = None if lines % 4 == 0 else f'{lines} lines is not a whole number of reads'
+
+    return path, lines // 4, os.path.getsize(path), error
+
+
+def recount(fastqs, workers=None):
+    '''
+    Count the reads of every FASTQ in fastqs (from find_fastqs) on a process pool, largest files
+    first so the pool finishes together. Returns a df with one row per sample (R1 reads, R2 reads,
+    errors) and the throughput as a dict (files, bytes, reads, seconds, MB/s).
+    '''
+    paths = sorted((path for reads in fastqs.values() for read in reads.values() for path in read),
+                   key=os.path.getsize, reverse=True)
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as ex:
+        counts = {path: (reads, size, error) for path, reads, size, error in ex.map(count_reads, paths)}
+    seconds = time.perf_counter() - start
+
+    rows = []
+    for sample, reads in fastqs.items():
+        row = {'Sample': sample, 'R1 reads': 0, 'R2 reads': 0, 'Error': ''}
+        for read, read_paths in reads.items():
+            for path in read_paths:
+                num_reads, size, error = counts[path]
+                if error != None:
+                    row['Error'] = f'{os.path.basename(path)}: {error}'
+                else:
+                    row[f'{read} reads'] += num_reads
+        rows.append(row)
+
+    total_bytes = sum(size for reads, size, error in counts.values())
+    throughput = {'files': len(paths), 'bytes': total_bytes,
+                  'reads': sum(reads for reads, size, error in counts.values() if reads != None),
+                  'seconds': seconds, 'MB/s': total_bytes / seconds / 1e6 if seconds > 0 else 0}
+
+    return pd.DataFrame(rows, columns=['Sample', 'R1 reads', 'R2 reads', 'Error']), throughput
+
+
+def reported_reads(fastq_xls, reads_column=None):
+    '''
+    The sample names (1st column) and FASTQ read counts reported in the 'Check' tab of a
+    fastq-bam-check workbook. reads_column defaults to the 1st column with FASTQ in its name.
+    '''
+    check_df = read_sheet(fastq_xls, 'Check', None)
+
+    if reads_column == None:
+        fastq_columns = [column for column in check_df.columns if 'fastq' in str(column).lower()]
+        if len(fastq_columns) == 0:
+            raise Exception(f'No FASTQ read count column in the Check tab of {fastq_xls}!')
+        reads_column = fastq_columns[0]
+
+    return pd.DataFrame({'Sample': check_df.iloc[:, 0].astype(str),
+                         'Reported reads': pd.to_numeric(check_df[reads_column], errors='coerce')})
+
+
+def compare_reads(reported_df, recount_df):
+    '''
+    Compare the reported read count of each sample with the recount. A sample matches if the
+    reported count equals its R1 reads (read pairs) or its R1 + R2 reads, as the workbook may
+    count either. The recount of a sample is found by its FASTQ sample name, which may be a
+    prefix of the workbook name or the reverse.
+    Returns reported_df with R1 reads, R2 reads and a Mismatch reason ('' if the counts match).
+    '''
+    recounts = {row['Sample']: row for i, row in recount_df.iterrows()}
+
+    rows = []
+    for sample, reported in zip(reported_df['Sample'], reported_df['Reported reads']):
+        names = [name for name in recounts if name == sample] or \
+                [name for name in recounts if sample.startswith(name) or name.startswith(sample)]
+        row = {'Sample': sample, 'Reported reads': reported, 'R1 reads': np.nan, 'R2 reads': np.nan, 'Mismatch': ''}
+
+        if len(names) != 1:
+            row['Mismatch'] = 'No FASTQ files found' if len(names) == 0 else f'FASTQ files of {len(names)} samples match'
+        else:
+            recount = recounts[names[0]]
+            row['R1 reads'], row['R2 reads'] = recount['R1 reads'], recount['R2 reads']
+            if recount['Error'] != '':
+                row['Mismatch'] = recount['Error']
+            elif recount['R2 reads'] != 0 and recount['R1 reads'] != recount['R2 reads']:
+                row['Mismatch'] = f'R1 has {recount["R1 reads"]} reads, R2 has {recount["R2 reads"]}'
+            elif reported not in (recount['R1 reads'], recount['R1 reads'] + recount['R2 reads']):
+                row['Mismatch'] = f'{reported:.0f} reported, {recount["R1 reads"]} read pairs counted'
+        rows.append(row)
+
+    return pd.DataFrame(rows, columns=['Sample', 'Reported reads', 'R1 reads', 'R2 reads', 'Mismatch'])
+
+
+def throughput_summary(throughput):
+    '''
+    One line summary of a recount e.g. Recounted 1200000 reads in 96 FASTQs (2.1 GB) in 9.8s (214.3 MB/s)
+    '''
+    return (f'Recounted {throughput["reads"]} reads in {throughput["files"]} FASTQs '
+            f'({throughput["bytes"] / 1e9:.1f} GB) in {throughput["seconds"]:.1f}s ({throughput["MB/s"]:.1f} MB/s)')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Recount the FASTQ reads of a worksheet and compare them with the fastq-bam-check workbook')
+    parser.add_argument('-fastq_dir', action='store', required=True, help='Path to a folder containing the FASTQ(.gz) files of a worksheet')
+    parser.add_argument('-fastq_xls', action='store', required=True, help='Path to the <ws>-fastq-bam-check.xlsx workbook')
+    parser.add_argument('-reads_column', action='store', help='Column of the Check tab with the FASTQ read counts (default the 1st column containing FASTQ)')
+    parser.add_argument('-workers', action='store', type=int, help='Number of FASTQs counted at once (default the number of CPUs)')
+    args = parser.parse_args()
+
+    recount_df, throughput = recount(find_fastqs(args.fastq_dir), args.workers)
+    print(compare_reads(reported_reads(args.fastq_xls, args.reads_column), recount_df).to_string(index=False))
+    print(throughput_summary(throughput))
@@ -0,0 +1,166 @@
+import os
+import html
+import json
+import glob
+import time
+import argparse
+import numpy as np
+import pandas as pd
+
+
+CSS_STYLE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'css_style.css')
+
+_styles = {}
+
+
+def page_style(path=CSS_STYLE):
+    '''
+    The <style> block of the reports, read once per process.
+    '''
+    if path not in _styles:
+        with open(path) as file:
+            _styles[path] = file.read()
+
+    return _styles[path]
+
+
+def format_value(value):
+    '''
+    HTML text of a table cell. Missing values are left blank and floats are written without
+    trailing zeros (at most 6 decimal places).
+    '''
+    if value is None or (isinstance(value, (float, np.floating)) and np.isnan(value)):
+        return ''
+    if isinstance(value, (float, np.floating)):
+        return np.format_float_positional(value, precision=6, trim='-')
+
+    return html.escape(str(value))
+
+
+def write_cell(write, value):
+    '''
+    Write a <td>. PASS and FAIL cells get the PASS/FAIL class (colour coded by the style) and a
+    dict (e.g. the BED files of a worksheet) is written as a nested bed_table.
+    '''
+    if isinstance(value, dict):
+        write('<td><table class="bed_table">')
+        for key, item in value.items():
+            write(f'<tr><th>{format_value(key)}</th><td>{format_value(item)}</td></tr>')
+        write('</table></td>')
+    elif isinstance(value, str) and value in ('PASS', 'FAIL'):
+        write(f"<td class='{value}'>{value}</td>")
+    else:
+        write(f'<td>{format_value(value)}</td>')
+
+
+def write_table(write, df, links=None):
+    '''
+    Write a df as a <table>, one row at a time. links maps a column to a column of URLs, which
+    makes the cells of that column links.
+    '''
+    links = {} if links == None else links
+    columns = [column for column in df.columns if column not in links.values()]
+
+    write('<table border="1" class="dataframe"><thead><tr style="text-align: left;">')
+    for column in columns:
+        write(f'<th>{format_value(column)}</th>')
+    write('</tr></thead><tbody>')
+
+    for row in df.to_dict('records'):
+        write('<tr>')
+        for column in columns:
+            if column in links:
+                write(f'<td><a href="{html.escape(str(row[links[column]]))}">{format_value(row[column])}</a></td>')
+            else:
+                write_cell(write, row[column])
+        write('</tr>')
+    write('</tbody></table>')
+
+
+def write_page(write, title, sections, style=None):
+    '''
+    Write a complete HTML page: a <h1> title then each (heading, df) section as a <h2> and a table.
+    A section may instead be (heading, df, summary), which is written collapsed in a <details>
+    element, or (heading, df, None, links) with links as for write_table.
+    '''
+    write(f'<!DOCTYPE html><html><head>{page_style() if style == None else style}</head><body>')
+    write(f'<h1>{format_value(title)}</h1>')
+
+    for section in sections:
+        heading, df = section[:2]
+        summary = section[2] if len(section) > 2 else None
+        links = section[3] if len(section) > 3 else None
+        if summary != None:
+            write(f'<details><summary>{format_value(summary)}</summary>')
+        elif heading != None:
+            write(f'<h2>{format_value(heading)}</h2>')
+        write_table(write, df, links)
+        if summary != None:
+            write('</details>')
+
+    write('</body></html>')
+
+
+def render_page(title, sections, style=None):
+    '''
+    The HTML of a page (see write_page). The parts are joined once, so the render time grows
+    linearly with the number of table rows.
+    '''
+    parts = []
+    write_page(parts.append, title, sections, style)
+
+    return ''.join(parts)
+
+
+def pair_summary(jsonl_path):
+    '''
+    One dashboard row for the .jsonl results file of a pair: the pair result (FAIL if any check
+    failed), the failed checks and the number of failing samples.
+    '''
+    with open(jsonl_path) as file:
+        records = [json.loads(line) for line in file if line.strip()]
+
+    failed = [record for record in records if record['result'] == 'FAIL']
+    pair = records[0]['pair'] if records else os.path.basename(jsonl_path).replace('_quality_checks.jsonl', '')
+
+    return {'Pair': pair, 'ws_1': records[0]['ws_1'] if records else '', 'ws_2': records[0]['ws_2'] if records else '',
+            'Result': 'FAIL' if failed or not records else 'PASS', 'Checks': len(records),
+            'Failed checks': ', '.join(f'{record["check"]} ({record["worksheet"]})' for record in failed),
+            'Failing samples': sum(len(record.get('failures', [])) for record in failed),
+            'Cached': sum(record.get('cached', False) for record in records),
+            'Report URL': jsonl_path.replace('_quality_checks.jsonl', '_quality_checks.html')}
+
+
+def render_dashboard(jsonl_paths, out_path, title='Quality Check Dashboard'):
+    '''
+    Write a dashboard page with one row per pair (see pair_summary), failing pairs first, linking
+    to the report of each pair. The .jsonl files are read one at a time, so the dashboard of
+    hundreds of pairs is built in time and memory linear in the number of pairs.
+    Returns the dashboard df.
+    '''
+    start = time.perf_counter()
+    dashboard_df = pd.DataFrame([pair_summary(path) for path in jsonl_paths],
+                                columns=['Pair', 'ws_1', 'ws_2', 'Result', 'Checks', 'Failed checks', 'Failing samples', 'Cached', 'Report URL'])
+    dashboard_df = dashboard_df.sort_values(by=['Result', 'Pair'])
+
+    out_dir = os.path.dirname(os.path.abspath(out_path))
+    dashboard_df['Report URL'] = [os.path.relpath(os.path.abspath(path), out_dir) for path in dashboard_df['Report URL']]
+    counts = dashboard_df['Result'].value_counts()
+    overview_df = pd.DataFrame({'Pairs': [len(dashboard_df)], 'PASS': [counts.get('PASS', 0)], 'FAIL': [counts.get('FAIL', 0)]})
+
+    with open(out_path, 'w') as file:
+        write_page(file.write, title, [('Overview', overview_df), ('Pairs', dashboard_df, None, {'Pair': 'Report URL'})])
+
+    print(f'Dashboard of {len(dashboard_df)} pairs written to {out_path} in {time.perf_counter() - start:.2f}s')
+
+    return dashboard_df
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Write a dashboard of the quality check reports in a folder')
+    parser.add_argument('-reports_dir', action='store', required=True, help='Folder containing <ws_1>_<ws_2>_quality_checks.jsonl results files')
+    parser.add_argument('-out', action='store', help='Dashboard HTML file (default <reports_dir>/quality_check_dashboard.html)')
+    args = parser.parse_args()
+
+    out_path = args.out or os.path.join(args.reports_dir, 'quality_check_dashboard.html')
+    render_dashboard(sorted(glob.glob(os.path.join(args.reports_dir, '*_quality_checks.jsonl'))), out_path)
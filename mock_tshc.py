@@ -0,0 +1,222 @@
+import os
+import gzip
+import argparse
+import numpy as np
+import pandas as pd
+from vcf_integrity import BGZF_EOF
+
+
+VERSION = 'v0.5.2'
+# DNA number of the negative sample
+NEG_DNA = 'D00-00000'
+# failures which can be planted in a mock pair, with the check each one fails
+FAILURES = {
+    'contamination': 'VerifyBamId check',
+    'coverage': '20x coverage check',
+    'vcf_count': 'VCF file count check',
+    'fastq_bam': 'FASTQ-BAM check',
+    'neg_exons': 'Number of exons in negative sample',
+    'neg_contamination': 'Contamination of negative sample',
+    'kinship': 'Kinship check',
+}
+CHROMS = [str(chrom) for chrom in range(1, 23)] + ['X']
+
+
+def sample_names(ws, num_samples):
+    '''
+    Sample names of a worksheet e.g. 000001-01-D19-00101-AB-TSHC-001. The last sample is the
+    negative sample (000001-48-D00-00000-Neg-TSHC-001 for 48 samples).
+    '''
+    names = [f'{ws}-{i:02d}-D19-{(int(ws) * 100 + i) % 100000:05d}-AB-TSHC-001' for i in range(1, num_samples)]
+
+    return names + [f'{ws}-{num_samples:02d}-{NEG_DNA}-Neg-TSHC-001']
+
+
+def coverage_exons(num_exons):
+    '''
+    num_exons exons spread over the chromosomes, the same for a given number of exons.
+    Returns a df of Gene, Chr, Start and End (1-based starts, as in the Coverage-exon tab of
+    the negative sample report).
+    '''
+    rng = np.random.default_rng(num_exons)
+    chroms = np.sort(rng.choice(len(CHROMS), num_exons))
+    lengths = rng.integers(80, 400, num_exons)
+    starts = np.zeros(num_exons, dtype=np.int64)
+    for code in np.unique(chroms):
+        rows = np.flatnonzero(chroms == code)
+        starts[rows] = 10000 + np.cumsum(rng.integers(500, 20000, len(rows)))
+    genes = [f'GENE{row // 10 + 1}_exon{row % 10 + 1}' for row in range(num_exons)]
+
+    return pd.DataFrame({'Gene': genes, 'Chr': [CHROMS[code] for code in chroms], 'Start': starts + 1, 'End': starts + lengths})
+
+
+def make_bed(path, exons_df):
+    '''
+    Write the exons as a coverage BED (chr prefixed, 0-based starts). An existing BED is kept,
+    so the BED index cache stays valid between runs.
+    '''
+    if os.path.exists(path):
+        return
+
+    bed_df = pd.DataFrame({'chrom': 'chr' + exons_df['Chr'], 'start': exons_df['Start'] - 1,
+                           'end': exons_df['End'], 'name': exons_df['Gene']})
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    bed_df.to_csv(f'{path}.{os.getpid()}.tmp', sep='\t', header=False, index=False)
+    os.replace(f'{path}.{os.getpid()}.tmp', path)
+
+
+def make_vcf(path, sample, num_records, rng):
+    '''
+    Write a bgzip-style VCF (gzip members ending with the BGZF EOF block) with num_records SNV records.
+    '''
+    positions = np.sort(rng.choice(10 ** 7, num_records, replace=False)) + 1
+    chroms = np.sort(rng.choice(len(CHROMS), num_records))
+    genotypes = rng.choice(['0/1', '1/1'], num_records)
+    header = ('##fileformat=VCFv4.2\n##source=mock_tshc\n##FORMAT=<ID=GT,Number=1,Type=String,Description="Genotype">\n'
+              '##FORMAT=<ID=DP,Number=1,Type=Integer,Description="Read depth">\n'
+              f'#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\t{sample}\n')
+    records = ''.join(f'chr{CHROMS[chrom]}\t{pos}\t.\tA\tG\t50\tPASS\t.\tGT:DP\t{genotype}:{depth}\n'
+                      for chrom, pos, genotype, depth in zip(chroms, positions, genotypes, rng.integers(20, 500, num_records)))
+
+    with open(path, 'wb') as file:
+        file.write(gzip.compress((header + records).encode()) + BGZF_EOF)
+
+
+def make_worksheet(root, ws, pair_ws, bed_path, exons_df, num_samples=48, vcf_records=200, failures=(), neg=False, king=False, rng=None):
+    '''
+    Write the TSHC output folder of a worksheet (<root>/<ws>/TSHC_<ws>_<version>/) with the layout
+    get_inputs expects: the results report (Hyb-QC, VerifyBamId and config_parameters tabs), the
+    fastq-bam-check report, a VCF per sample and the commandline_usage_logfile. If neg is True the
+    negative sample report is written to this worksheet, and if king is True the kinship report of
+    the pair. failures lists the planted failures (see FAILURES) of this worksheet.
+    Returns the path of the TSHC output folder.
+    '''
+    rng = np.random.default_rng() if rng is None else rng
+    ws_dir = os.path.join(root, ws, f'TSHC_{ws}_{VERSION}', '')
+    excel_dir = os.path.join(ws_dir, f'excel_reports_TSHC_{ws}')
+    vcf_dir = os.path.join(ws_dir, f'vcfs_TSHC_{ws}')
+    os.makedirs(excel_dir, exist_ok=True)
+    os.makedirs(vcf_dir, exist_ok=True)
+
+    samples = sample_names(ws, num_samples)
+
+    # results report of the worksheet
+    coverage = rng.uniform(0.97, 0.995, num_samples)
+    if 'coverage' in failures:
+        coverage[0] = 0.91
+    contamination = rng.uniform(0.0, 1.5, num_samples)
+    if 'contamination' in failures:
+        contamination[0] = 4.2
+    hyb_qc_df = pd.DataFrame({'Sample': samples, 'MEAN_TARGET_COVERAGE': rng.uniform(200, 600, num_samples).round(1),
+                              'PCT_TARGET_BASES_10X': np.minimum(coverage + 0.01, 1), 'PCT_TARGET_BASES_20X': coverage,
+                              'PCT_TARGET_BASES_30X': coverage - 0.02, 'PCT_USABLE_BASES_ON_TARGET': rng.uniform(0.6, 0.8, num_samples)})
+    verify_bam_id_df = pd.DataFrame({'SEQ_ID': samples, 'RG': 'RG1', 'CHIP_ID': 'NA', '#SNPS': rng.integers(8000, 9000, num_samples),
+                                     '#READS': rng.integers(10 ** 6, 10 ** 7, num_samples), '%CONT': contamination.round(3)})
+    config_df = pd.DataFrame({'key': ['pipeline version', 'AB_threshold', 'target_regions', 'refined_target_regions', 'coverage_regions'],
+                              'variable': [VERSION, 0.2, '/data/bed/TSHC_target_v1.bed', '/data/bed/TSHC_refined_v1.bed', bed_path]})
+
+    results_xls = os.path.join(excel_dir, f'{samples[0]}_S1.{VERSION}-results.xlsx')
+    with pd.ExcelWriter(results_xls) as writer:
+        hyb_qc_df.to_excel(writer, 'Hyb-QC', index=False)
+        verify_bam_id_df.to_excel(writer, 'VerifyBamId', index=False)
+        config_df.to_excel(writer, 'config_parameters', index=False)
+
+    # fastq-bam-check report
+    fastq_reads = rng.integers(10 ** 6, 4 * 10 ** 6, num_samples)
+    bam_reads = fastq_reads * 2
+    if 'fastq_bam' in failures:
+        bam_reads[0] -= 1000
+    check_df = pd.DataFrame({'Sample': samples, 'FASTQ reads': fastq_reads, 'BAM reads': bam_reads,
+                             'Result': np.where(bam_reads == fastq_reads * 2, 'PASS', 'FAIL')})
+    with pd.ExcelWriter(os.path.join(excel_dir, f'{ws}-fastq-bam-check.xlsx')) as writer:
+        check_df.to_excel(writer, 'Check', index=False)
+
+    # negative sample report (Coverage-exon tab with an exon per coverage BED interval)
+    if neg:
+        neg_df = exons_df.assign(Mean=0.0, Max=0, Min=0)
+        if 'neg_contamination' in failures:
+            neg_df.loc[1, ['Mean', 'Max']] = [3.5, 12]
+        if 'neg_exons' in failures:
+            neg_df = neg_df.drop(index=0)
+        neg_xls = os.path.join(excel_dir, f'{samples[-1]}_S{num_samples}.{VERSION}-results.xlsx')
+        with pd.ExcelWriter(neg_xls) as writer:
+            neg_df.to_excel(writer, 'Coverage-exon', index=False)
+
+    # kinship report of the pair
+    if king:
+        pair_samples = samples[:-1] + sample_names(pair_ws, num_samples)[:-1]
+        id_1, id_2 = np.triu_indices(len(pair_samples), k=1)
+        kinship = rng.uniform(-0.05, 0.05, len(id_1)).round(4)
+        if 'kinship' in failures:
+            kinship[0] = 0.49
+        kinship_df = pd.DataFrame({'FID1': 'FAM', 'ID1': np.array(pair_samples)[id_1], 'FID2': 'FAM',
+                                   'ID2': np.array(pair_samples)[id_2], 'N_SNP': 5000, 'Kinship': kinship})
+        with pd.ExcelWriter(os.path.join(ws_dir, f'{ws}_{pair_ws}.king.xlsx')) as writer:
+            kinship_df.to_excel(writer, 'Kinship', index=False)
+
+    # a VCF per sample (one missing for a vcf_count failure)
+    for sample in samples[:-1] if 'vcf_count' in failures else samples:
+        make_vcf(os.path.join(vcf_dir, f'{sample}.vcf.gz'), sample, vcf_records, rng)
+
+    experiment = f'19{int(ws) % 12 + 1:02d}12_M0{int(ws) % 10000:04d}_{int(ws) % 10000:04d}_000000000-A{int(ws) % 10000:04d}'
+    with open(os.path.join(ws_dir, f'{ws}.commandline_usage_logfile'), 'w') as file:
+        file.write(f'Pipeline {VERSION} started\n'
+                   f'python /data/pipelines/TSHC/{VERSION}/TSHC_pipeline.py -s \n'
+                   f'/network/sequenced/MiSeq_data/TSHC/shire_worksheet_numbered/{ws}/{experiment}/SampleSheet.csv '
+                   f'-o /network/sequenced/MiSeq_data/TSHC/shire_worksheet_numbered/{ws}/{experiment}/ -p TSHC -t 16\n'
+                   f'Pipeline {VERSION} finished\n')
+
+    return ws_dir
+
+
+def make_pair(root, ws_1, ws_2, num_samples=48, num_exons=1209, vcf_records=200, failures=(), seed=0):
+    '''
+    Write the TSHC output folders of a worksheet pair and the coverage BED they use
+    (<root>/bed/TSHC_coverage_<exons>.bed). ws_1 holds the negative sample and kinship reports.
+    Worksheet failures (e.g. coverage) are planted in ws_1 only.
+    Returns the ws_1 and ws_2 folders.
+    '''
+    rng = np.random.default_rng(seed)
+    unknown = set(failures) - set(FAILURES)
+    if unknown:
+        raise Exception(f'Unknown failures {", ".join(sorted(unknown))}! Expected one of {", ".join(FAILURES)}.')
+
+    # the BED is written once and shared by every pair under root
+    bed_path = os.path.join(os.path.abspath(root), 'bed', f'TSHC_coverage_{num_exons}.bed')
+    exons_df = coverage_exons(num_exons)
+    make_bed(bed_path, exons_df)
+
+    ws_1_dir = make_worksheet(root, ws_1, ws_2, bed_path, exons_df, num_samples, vcf_records, failures, neg=True, king=True, rng=rng)
+    ws_2_dir = make_worksheet(root, ws_2, ws_1, bed_path, exons_df, num_samples, vcf_records, (), rng=rng)
+
+    return ws_1_dir, ws_2_dir
+
+
+def make_batch(root, num_pairs, num_samples=48, num_exons=1209, vcf_records=200, failures=(), seed=0):
+    '''
+    Write num_pairs worksheet pairs (000001/000002, 000003/000004, ...). The failures are planted
+    in every other pair starting with the first, so a batch has failing and passing pairs.
+    Returns a list of (ws_1, ws_2) folders.
+    '''
+    pairs = []
+    for pair in range(num_pairs):
+        ws_1, ws_2 = f'{pair * 2 + 1:06d}', f'{pair * 2 + 2:06d}'
+        pairs.append(make_pair(root, ws_1, ws_2, num_samples, num_exons, vcf_records,
+                               failures if pair % 2 == 0 else (), seed + pair))
+
+    return pairs
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Write mock TSHC output folders for testing and benchmarking')
+    parser.add_argument('-out_dir', action='store', required=True, help='Folder to write the mock TSHC output folders to')
+    parser.add_argument('-pairs', action='store', type=int, default=1, help='Number of worksheet pairs (default 1)')
+    parser.add_argument('-samples', action='store', type=int, default=48, help='Samples per worksheet including the negative sample (default 48)')
+    parser.add_argument('-exons', action='store', type=int, default=1209, help='Exons in the coverage BED (default 1209)')
+    parser.add_argument('-vcf_records', action='store', type=int, default=200, help='Records in each VCF (default 200)')
+    parser.add_argument('-fail', action='store', nargs='*', default=[], choices=list(FAILURES), help='Failures to plant in every other pair, starting with the first')
+    parser.add_argument('-seed', action='store', type=int, default=0, help='Random seed (default 0)')
+    args = parser.parse_args()
+
+    for ws_1, ws_2 in make_batch(args.out_dir, args.pairs, args.samples, args.exons, args.vcf_records, args.fail, args.seed):
+        print(f'{ws_1}\t{ws_2}')
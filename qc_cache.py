@@ -0,0 +1,394 @@
+import os
+import re
+import sys
+import json
+import fcntl
+import pickle
+import hashlib
+import inspect
+import threading
+from collections import namedtuple
+import qc_prefetch
+
+
+# On-disk caches are stored under ~/.cache/ngs_quality_check unless NGS_QC_CACHE_DIR is set
+CACHE_DIR = os.environ.get('NGS_QC_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'ngs_quality_check'))
+# The result cache is trimmed (least recently used first) to this size in bytes
+RESULT_CACHE_MAX_BYTES = int(os.environ.get('NGS_QC_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+# The result cache folder is rescanned after this many stores even if its tracked size is within the limit
+RESULT_CACHE_RESCAN_STORES = 1000
+
+TSHC_DIR = re.compile(r'^(\w{4,7})_(\d{6})_(v[\.]?\d\.\d\.\d)$')
+
+# Manifest of a single TSHC output folder. All file paths are absolute. dir_mtimes holds the
+# st_mtime_ns of the TSHC, excel_reports and vcfs folders at the time the manifest was built.
+Manifest = namedtuple('Manifest', ['ws_dir', 'panel', 'worksheet', 'version', 'excel_reports_dir',
+                                   'results_reports', 'neg_reports', 'fastq_bam_reports', 'vcf_dir',
+                                   'vcfs', 'cmd_log', 'king_files', 'dir_mtimes'])
+
+_manifests = {}
+_manifest_lock = threading.Lock()
+
+# sha1 of the sources of each module and the modules of this folder it uses (see code_version)
+_code_versions = {}
+_code_lock = threading.Lock()
+
+
+def _cache_file(kind, key):
+    '''
+    Path of the cache file for a key within a cache kind e.g. manifests/<sha1 of key>.json
+    '''
+    return os.path.join(CACHE_DIR, kind, hashlib.sha1(key.encode()).hexdigest() + '.json')
+
+
+def _write_json(path, data):
+    '''
+    Atomically write data as JSON. Caching is best effort, so an unwritable cache is ignored.
+    '''
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as file:
+            json.dump(data, file)
+        os.replace(tmp_path, path)
+    except OSError:
+        pass
+
+
+def _read_json(path):
+    '''
+    Read a JSON cache file, returning None if it is missing or unreadable.
+    '''
+    try:
+        with open(path) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+def _touch(path):
+    '''
+    Mark a cache file as recently used, so it is kept when the cache is trimmed (see evict_results).
+    '''
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+
+def _dir_mtimes(paths):
+    '''
+    st_mtime_ns of each directory (None if the directory does not exist).
+    '''
+    mtimes = {}
+    for path in paths:
+        try:
+            mtimes[path] = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            mtimes[path] = None
+
+    return mtimes
+
+
+def _scan(path):
+    '''
+    Sorted names of the entries in a directory (empty if the directory does not exist).
+    '''
+    try:
+        with os.scandir(path) as entries:
+            return sorted(entry.name for entry in entries)
+    except FileNotFoundError:
+        return []
+
+
+def build_manifest(ws_dir, use_cache=True):
+    '''
+    Classify the files of a TSHC output folder (TSHC_<ws>_<version>/) into a Manifest:
+        1) results_reports - excel reports in excel_reports_<panel>_<ws>/ (excluding Neg and fastq-bam-check)
+        2) neg_reports - excel reports for negative samples
+        3) fastq_bam_reports - fastq-bam comparison excel reports
+        4) vcfs - entries of vcfs_<panel>_<ws>/
+        5) cmd_log - <ws>.commandline_usage_logfile (None if not present)
+        6) king_files - <ws>_<ws>.king.xlsx kinship reports
+    Each folder is listed once with os.scandir. The manifest is cached in memory and on disk and
+    is reused until the mtime of the TSHC, excel_reports or vcfs folder changes, so repeat runs
+    only stat the three folders instead of listing them.
+    '''
+    ws_dir = os.path.join(os.path.abspath(ws_dir), '')
+    run_info = TSHC_DIR.match(os.path.basename(ws_dir.rstrip('/')))
+
+    if run_info == None:
+        raise Exception(f'{ws_dir} is not a TSHC output folder! Check regex pattern.')
+
+    panel, worksheet, version = run_info.groups()
+    excel_reports_dir = ws_dir + f'excel_reports_{panel}_{worksheet}/'
+    vcf_dir = ws_dir + f'vcfs_{panel}_{worksheet}/'
+
+    # mtimes are taken before the folders are listed so any later change invalidates the manifest
+    dir_mtimes = _dir_mtimes([ws_dir, excel_reports_dir, vcf_dir])
+    cache_file = _cache_file('manifests', ws_dir)
+
+    if use_cache:
+        with _manifest_lock:
+            manifest = _manifests.get(ws_dir)
+        if manifest == None:
+            cached = _read_json(cache_file)
+            manifest = Manifest(**cached) if cached != None else None
+            _touch(cache_file)
+        if manifest != None and manifest.dir_mtimes == dir_mtimes:
+            with _manifest_lock:
+                _manifests[ws_dir] = manifest
+            return manifest
+
+    ws_files = _scan(ws_dir)
+    excel_reports = _scan(excel_reports_dir)
+    cmd_log = f'{worksheet}.commandline_usage_logfile'
+
+    manifest = Manifest(
+        ws_dir=ws_dir,
+        panel=panel,
+        worksheet=worksheet,
+        version=version,
+        excel_reports_dir=excel_reports_dir,
+        results_reports=[excel_reports_dir + name for name in excel_reports if not re.search('Neg|-fastq-bam-check', name)],
+        neg_reports=[excel_reports_dir + name for name in excel_reports if 'Neg' in name],
+        fastq_bam_reports=[excel_reports_dir + name for name in excel_reports if 'fastq-bam-check' in name],
+        vcf_dir=vcf_dir,
+        vcfs=[vcf_dir + name for name in _scan(vcf_dir)],
+        cmd_log=ws_dir + cmd_log if cmd_log in ws_files else None,
+        king_files=[ws_dir + name for name in ws_files if re.match(rf'^{worksheet}_\d{{6}}\.king\.xlsx$', name)],
+        dir_mtimes=dir_mtimes,
+    )
+
+    with _manifest_lock:
+        _manifests[ws_dir] = manifest
+    if use_cache:
+        _write_json(cache_file, manifest._asdict())
+
+    return manifest
+
+
+def file_fingerprint(path):
+    '''
+    Content fingerprint of an input file: its size and the sha1 of its contents. The sha1 is
+    stored with the file size and mtime, and the file is only re-read when one of these changes.
+    A prefetched file is hashed from memory.
+    For a directory (e.g. the vcf folder) the fingerprint is its mtime, which changes whenever
+    a file is added or removed.
+    '''
+    fingerprint = stored_fingerprint(path)
+    if fingerprint != None:
+        return fingerprint
+
+    stat = os.stat(path)
+    sha1 = hashlib.sha1()
+    data = qc_prefetch.prefetched(path)
+    if data != None:
+        sha1.update(data)
+    else:
+        with open(path, 'rb') as file:
+            for block in iter(lambda: file.read(1024 * 1024), b''):
+                sha1.update(block)
+
+    _write_json(_cache_file('hashes', os.path.abspath(path)), {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha1': sha1.hexdigest()})
+
+    return f'{stat.st_size}:{sha1.hexdigest()}'
+
+
+def stored_fingerprint(path):
+    '''
+    Fingerprint of an input file (see file_fingerprint) without reading the file: from the stored
+    sha1, or None if the file has not been hashed since its size or mtime last changed.
+    '''
+    stat = os.stat(path)
+    if os.path.isdir(path):
+        return f'dir:{stat.st_mtime_ns}'
+
+    hash_file = _cache_file('hashes', os.path.abspath(path))
+    known = _read_json(hash_file)
+    if known != None and known['size'] == stat.st_size and known['mtime_ns'] == stat.st_mtime_ns:
+        _touch(hash_file)
+        return f'{stat.st_size}:{known["sha1"]}'
+
+    return None
+
+
+def module_dependencies(module):
+    '''
+    Source files of a module and of every module of this folder it uses, directly or through
+    another module of this folder (a module or a function/class imported from one).
+    '''
+    package_dir = os.path.dirname(os.path.abspath(__file__))
+    files = {}
+    pending = [module]
+    while pending:
+        module = pending.pop()
+        path = os.path.abspath(getattr(module, '__file__', None) or '')
+        if os.path.dirname(path) != package_dir or path in files:
+            continue
+        files[path] = module
+        for value in list(vars(module).values()):
+            used = value if inspect.ismodule(value) else sys.modules.get(getattr(value, '__module__', None) or '')
+            if used != None:
+                pending.append(used)
+
+    return sorted(files)
+
+
+def code_version(func):
+    '''
+    sha1 of the sources of the module of func and the modules of this folder it depends on (see
+    module_dependencies), so a change to a helper of a check (e.g. the excel reader or the command
+    log parser) invalidates its cached results. Computed once per module per process.
+    '''
+    module = sys.modules[func.__module__]
+    with _code_lock:
+        version = _code_versions.get(module.__name__)
+    if version != None:
+        return version
+
+    sha1 = hashlib.sha1()
+    for path in module_dependencies(module):
+        with open(path, 'rb') as file:
+            sha1.update(os.path.basename(path).encode())
+            sha1.update(file.read())
+    version = sha1.hexdigest()
+
+    with _code_lock:
+        _code_versions[module.__name__] = version
+
+    return version
+
+
+def result_key(func, thresholds, input_paths):
+    '''
+    Cache key of a check result: the check function name and source, the sources of the modules
+    it depends on (see code_version), its threshold values and the paths and fingerprints of its
+    input files (the checks take the worksheet number from the path). A result is only reused if
+    none of these changed.
+    '''
+    key = hashlib.sha1()
+    key.update(func.__name__.encode())
+    key.update(inspect.getsource(func).encode())
+    key.update(code_version(func).encode())
+    key.update(repr(tuple(thresholds)).encode())
+    for path in input_paths:
+        key.update(os.path.abspath(path).encode())
+        key.update(file_fingerprint(path).encode())
+
+    return key.hexdigest()
+
+
+def has_result(func, thresholds, input_paths):
+    '''
+    True if a result is cached for func and its inputs (see result_key), found without reading any
+    input file. A new or changed input (no stored fingerprint) is taken as a miss.
+    '''
+    try:
+        if any(stored_fingerprint(path) == None for path in input_paths):
+            return False
+    except OSError:
+        return False
+
+    return os.path.exists(os.path.join(CACHE_DIR, 'results', result_key(func, thresholds, input_paths) + '.pkl'))
+
+
+def load_result(key):
+    '''
+    Return a cached check result, or None if the key is not in the cache or the result cannot be
+    loaded, e.g. a truncated file or a result pickled by another version of pandas (which can
+    raise AttributeError, ImportError or TypeError). A hit marks the entry as recently used.
+    '''
+    path = os.path.join(CACHE_DIR, 'results', key + '.pkl')
+    try:
+        with open(path, 'rb') as file:
+            result = pickle.load(file)
+        os.utime(path)
+    except Exception:
+        return None
+
+    return result
+
+
+def store_result(key, result, max_bytes=RESULT_CACHE_MAX_BYTES):
+    '''
+    Add a check result to the cache. The size of the result cache is tracked in results/index.json,
+    so the results folder is only scanned to evict the least recently used results once the
+    tracked size is over max_bytes, or after every RESULT_CACHE_RESCAN_STORES stores.
+    '''
+    results_dir = os.path.join(CACHE_DIR, 'results')
+    path = os.path.join(results_dir, key + '.pkl')
+    try:
+        os.makedirs(results_dir, exist_ok=True)
+        tmp_path = os.path.join(results_dir, f'{key}.{os.getpid()}.tmp')
+        with open(tmp_path, 'wb') as file:
+            pickle.dump(result, file)
+        size = os.path.getsize(tmp_path)
+        try:
+            size -= os.path.getsize(path)
+        except FileNotFoundError:
+            pass
+        os.replace(tmp_path, path)
+
+        with open(os.path.join(results_dir, 'index.lock'), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            index = _read_json(os.path.join(results_dir, 'index.json'))
+            # a cache without an index (or with a damaged one) is scanned to find its size
+            if not isinstance(index, dict) or index.keys() != {'bytes', 'stores'}:
+                index = {'bytes': 0, 'stores': RESULT_CACHE_RESCAN_STORES}
+            index = {'bytes': index['bytes'] + size, 'stores': index['stores'] + 1}
+            if index['bytes'] > max_bytes or index['stores'] >= RESULT_CACHE_RESCAN_STORES:
+                index = {'bytes': evict_results(max_bytes), 'stores': 0}
+            _write_json(os.path.join(results_dir, 'index.json'), index)
+    except OSError:
+        return
+
+
+def evict_results(max_bytes=RESULT_CACHE_MAX_BYTES):
+    '''
+    Delete least recently used (oldest mtime) results until the result cache is within max_bytes.
+    Input hashes and folder manifests last used before the last result evicted are deleted too,
+    so entries for old worksheets do not build up. Returns the size of the results kept.
+    '''
+    entries = [entry for entry in _cache_entries('results') if entry[2].endswith('.pkl')]
+
+    total = sum(size for mtime, size, path in entries)
+    # mtime of the most recently used result evicted
+    evicted_mtime = None
+    for mtime, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+        evicted_mtime = mtime
+
+    if evicted_mtime != None:
+        for kind in ('hashes', 'manifests'):
+            for mtime, size, path in _cache_entries(kind):
+                if mtime <= evicted_mtime:
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+
+    return total
+
+
+def _cache_entries(kind):
+    '''
+    (st_mtime_ns, size, path) of each file of a cache kind (empty if the folder does not exist).
+    '''
+    entries = []
+    try:
+        with os.scandir(os.path.join(CACHE_DIR, kind)) as scan:
+            for entry in scan:
+                if entry.is_file():
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+    except FileNotFoundError:
+        pass
+
+    return entries
@@ -0,0 +1,62 @@
+import os
+import sys
+import json
+import socket
+import argparse
+import qc_cache
+
+
+# socket of the worker (see qc_worker.py) unless -socket is given
+DEFAULT_SOCKET = os.path.join(qc_cache.CACHE_DIR, 'qc_worker.sock')
+
+
+def submit(request, socket_path=DEFAULT_SOCKET, timeout=None):
+    '''
+    Send a request (a dict, see qc_worker.handle_request) to a running quality check worker and
+    return its response. Only the standard library is imported, so submitting a pair takes no
+    longer than the checks themselves.
+    '''
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(socket_path)
+        sock.sendall((json.dumps(request) + '\n').encode())
+        sock.shutdown(socket.SHUT_WR)
+        with sock.makefile('rb') as file:
+            line = file.readline()
+
+    if not line:
+        raise Exception(f'No response from the quality check worker on {socket_path}!')
+
+    return json.loads(line)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Submit a pair of worksheets to a running quality check worker (qc_worker.py)')
+    parser.add_argument('-ws_1', action='store', help='Full path to worksheet_1 TSHC folder')
+    parser.add_argument('-ws_2', action='store', help='Full path to worksheet_2 TSHC folder')
+    parser.add_argument('-out_dir', action='store', help='Folder to write the report to (default the two TSHC folders)')
+    parser.add_argument('-socket', action='store', default=DEFAULT_SOCKET, help=f'Unix socket of the worker (default {DEFAULT_SOCKET})')
+    parser.add_argument('-timeout', action='store', type=float, help='Seconds to wait for the response (default no limit)')
+    parser.add_argument('-no_cache', action='store_true', help='Run every check even if its result is cached')
+    parser.add_argument('-no_db', action='store_true', help='Do not record the run in the results database')
+    parser.add_argument('-ping', action='store_true', help='Check the worker is running')
+    args = parser.parse_args()
+
+    if args.ping:
+        request = {'command': 'ping'}
+    elif args.ws_1 == None or args.ws_2 == None:
+        parser.error('-ws_1 and -ws_2 are required unless -ping is given')
+    else:
+        # the worker resolves paths from its own folder and expects the TSHC folders to end with /
+        request = {'ws_1': os.path.join(os.path.abspath(args.ws_1), ''), 'ws_2': os.path.join(os.path.abspath(args.ws_2), ''),
+                   'out_dir': os.path.abspath(args.out_dir) if args.out_dir != None else None}
+        if args.no_cache:
+            request['use_cache'] = False
+        if args.no_db:
+            request['no_db'] = True
+
+    response = submit(request, args.socket, args.timeout)
+    print(json.dumps(response, indent=2))
+
+    # exit status for LIMS hooks: 0 PASS (or OK for -ping), 1 FAIL, 2 ERROR
+    sys.exit({'PASS': 0, 'OK': 0, 'FAIL': 1}.get(response['status'], 2))
@@ -0,0 +1,102 @@
+import io
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+# files larger than this are left on disk and read by their check as before
+PREFETCH_MAX_BYTES = int(os.environ.get('NGS_QC_PREFETCH_MAX_BYTES', 64 * 1024 * 1024))
+
+# Contents of the prefetched input files of the current pair, held until clear() is called
+_buffers = {}
+_buffer_lock = threading.Lock()
+prefetch_stats = {'files': 0, 'bytes': 0, 'seconds': 0.0}
+
+
+def _read_file(path):
+    '''
+    Contents of a file, or None if it is missing, not a file or larger than PREFETCH_MAX_BYTES.
+    '''
+    try:
+        if not os.path.isfile(path) or os.path.getsize(path) > PREFETCH_MAX_BYTES:
+            return None
+        with open(path, 'rb') as file:
+            return file.read()
+    except OSError:
+        return None
+
+
+def prefetch(paths, workers=8):
+    '''
+    Read the input files of a pair (workbooks, kinship report and command logs) into memory with
+    at most workers reads in flight, so the latency of the network filesystem is paid once for
+    all of the files rather than once per file as each check reaches it. The checks then read the
+    files from memory (see source). Missing files are skipped and left to the checks to report.
+    Files are re-read on every call, so a retried pair never sees an earlier copy of a file.
+    '''
+    paths = [path for path in dict.fromkeys(paths) if path != None]
+    if len(paths) == 0:
+        return
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(paths)))) as ex:
+        contents = list(ex.map(_read_file, paths))
+
+    with _buffer_lock:
+        for path, data in zip(paths, contents):
+            if data != None:
+                _buffers[path] = data
+                prefetch_stats['files'] += 1
+                prefetch_stats['bytes'] += len(data)
+            else:
+                _buffers.pop(path, None)
+        prefetch_stats['seconds'] += time.perf_counter() - start
+
+
+def read_bytes(path):
+    '''
+    Contents of a file, from memory if it was prefetched.
+    '''
+    with _buffer_lock:
+        data = _buffers.get(path)
+    if data != None:
+        return data
+
+    with open(path, 'rb') as file:
+        return file.read()
+
+
+def source(path):
+    '''
+    A file object of a prefetched file (for pd.ExcelFile, zipfile and pd.read_csv), or the path
+    itself if the file was not prefetched.
+    '''
+    with _buffer_lock:
+        data = _buffers.get(path)
+
+    return path if data == None else io.BytesIO(data)
+
+
+def prefetched(path):
+    '''
+    Contents of a prefetched file, or None if it was not prefetched.
+    '''
+    with _buffer_lock:
+        return _buffers.get(path)
+
+
+def clear():
+    '''
+    Drop the prefetched files and statistics.
+    '''
+    with _buffer_lock:
+        _buffers.clear()
+        prefetch_stats.update({'files': 0, 'bytes': 0, 'seconds': 0.0})
+
+
+def prefetch_summary():
+    '''
+    One line description of the files prefetched so far.
+    '''
+    return 'Prefetched {files} files ({bytes} bytes) in {seconds:.2f}s'.format(**prefetch_stats)
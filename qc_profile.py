@@ -0,0 +1,87 @@
+import os
+import json
+import time
+import resource
+import pandas as pd
+
+
+PROFILE_COLUMNS = ['Span', 'Cached', 'Wall (s)', 'CPU (s)', 'Bytes read', 'Peak RSS (MiB)', 'Files']
+
+
+def io_bytes():
+    '''
+    Bytes read by this process so far (rchar of /proc/self/io), or None where /proc is not available.
+    rchar counts every read() call of the process, including reads served from the page cache.
+    '''
+    try:
+        with open('/proc/self/io') as file:
+            for line in file:
+                if line.startswith('rchar:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+
+    return None
+
+
+def file_sizes(paths):
+    '''
+    {path: size in bytes} of the input files of a span. Folders (e.g. a vcfs folder, which
+    is only listed) are not included.
+    '''
+    return {path: os.path.getsize(path) for path in paths if os.path.isfile(path)}
+
+
+def profile_task(name, func, func_args, input_paths=()):
+    '''
+    Run func(*func_args) in a timing span. The span records the wall time, the CPU time of the
+    thread running it, the bytes read by the process during the span (all threads, so only exact
+    when tasks run one after another), the peak RSS of the process at the end of the span and the
+    size of each input file. Module level so tasks can be profiled in a thread or process pool.
+    Returns the result of func and the span.
+    '''
+    start_io = io_bytes()
+    start_cpu = time.thread_time()
+    start = time.perf_counter()
+
+    result = func(*func_args)
+
+    wall = time.perf_counter() - start
+    cpu = time.thread_time() - start_cpu
+    end_io = io_bytes()
+
+    span = {'Span': name, 'Cached': None, 'Wall (s)': round(wall, 4), 'CPU (s)': round(cpu, 4),
+            'Bytes read': None if start_io == None or end_io == None else end_io - start_io,
+            # ru_maxrss is in KiB on Linux
+            'Peak RSS (MiB)': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+            'Files': file_sizes(input_paths)}
+
+    return result, span
+
+
+def task_name(func, input_paths):
+    '''
+    Span name of a task e.g. results_excel_check 000001-01-D19-10001-AB-TSHC-001_S1.v0.5.2-results.xlsx
+    '''
+    if len(input_paths) == 0:
+        return func.__name__
+
+    return f'{func.__name__} {os.path.basename(input_paths[0].rstrip("/"))}'
+
+
+def profile_table(spans):
+    '''
+    The spans as a df, one row per span. The Files column lists each input file and its size.
+    '''
+    profile_df = pd.DataFrame(spans, columns=PROFILE_COLUMNS)
+    profile_df['Files'] = [', '.join(f'{os.path.basename(path)} ({size} bytes)' for path, size in files.items())
+                           for files in profile_df['Files']]
+
+    return profile_df
+
+
+def profile_json(pair, spans, total_wall):
+    '''
+    The spans of a pair as JSON, with the total wall time of the pair.
+    '''
+    return json.dumps({'pair': pair, 'wall': round(total_wall, 4), 'spans': spans}, indent=2, default=int)
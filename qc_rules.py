@@ -0,0 +1,322 @@
+import os
+import json
+import string
+import hashlib
+import operator
+import threading
+import numpy as np
+import pandas as pd
+from collections import namedtuple
+from excel_reader import read_sheet, read_columns
+import bed_index
+
+
+# Rule files are named <panel>.json and stored in rules/ next to this module unless NGS_QC_RULES_DIR is set
+RULES_DIR = os.environ.get('NGS_QC_RULES_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'rules'))
+
+# Inputs a rule can be evaluated on. All are excel reports except vcfs, the list of VCF files.
+SHEET_INPUTS = ('results', 'neg', 'fastq_bam', 'kinship')
+FILE_INPUTS = ('vcfs',)
+
+COMPARISONS = {'<': operator.lt, '<=': operator.le, '>': operator.gt, '>=': operator.ge,
+               '==': operator.eq, '!=': operator.ne}
+AGGREGATES = ('any', 'count', 'bed')
+
+
+def _contains(values, value):
+    '''
+    Rows whose value contains the text value (as a boolean array).
+    '''
+    return pd.Series(values).astype(str).str.contains(value, regex=False).values
+
+
+def _not_contains(values, value):
+    '''
+    Rows whose value does not contain the text value (as a boolean array).
+    '''
+    return ~_contains(values, value)
+
+
+FILTERS = dict(COMPARISONS, contains=_contains, not_contains=_not_contains)
+
+# A single compiled check. compare/filters hold the operator functions looked up from the rule
+# file so evaluating a rule is a handful of numpy operations on the sheet columns.
+Rule = namedtuple('Rule', ['name', 'description', 'input', 'sheet', 'column', 'filters', 'compare',
+                           'threshold', 'fail_non_finite', 'aggregate', 'label', 'bed_columns'])
+# The compiled rules of a panel. columns maps (input, sheet) to every column the rules read from
+# that sheet, so each sheet is read once for all of its rules. key changes whenever the rule file
+# or this module changes and is used in the result cache key of the checks. identity holds the
+# settings of the sample identity check (None if the rule file has no identity section).
+RuleSet = namedtuple('RuleSet', ['panel', 'path', 'key', 'rules', 'columns', 'identity'])
+
+_rule_sets = {}
+_rule_set_lock = threading.Lock()
+
+
+def rules_file(panel):
+    '''
+    Path of the rule file for a panel e.g. rules/TSHC.json
+    '''
+    return os.path.join(RULES_DIR, f'{panel}.json')
+
+
+def compile_rule(rule):
+    '''
+    Validate a single rule from a rule file and look up its comparison, filter and aggregate.
+    A rule has the keys:
+        name, description - shown in the report
+        input - results, neg, fastq_bam, kinship (excel reports) or vcfs (the VCF files)
+        sheet, column - the sheet and column of the excel report holding the value to check
+        filter - optional list of {column, op, value} row filters e.g. not_contains D00-00000
+        fail_if, threshold - comparison which FAILs a value e.g. '<' 0.96
+        fail_non_finite - optional, also FAIL nan and inf values
+        aggregate - any (FAIL if any row fails, the default), count (compare the number of rows) or
+                    bed (FAIL if the rows are not the intervals of the coverage BED, see evaluate_bed_rule)
+        label - optional name of a failing row e.g. '{ID1}/{ID2}' or '{0}' for the 1st column
+        bed_columns - the chromosome, start and end columns of the sheet for the bed aggregate
+    '''
+    name = rule.get('name')
+    if name == None:
+        raise Exception(f'Rule {rule} has no name!')
+    if rule.get('input') not in SHEET_INPUTS + FILE_INPUTS:
+        raise Exception(f'Rule {name}: input must be one of {", ".join(SHEET_INPUTS + FILE_INPUTS)}')
+    if rule.get('fail_if') not in COMPARISONS:
+        raise Exception(f'Rule {name}: fail_if must be one of {", ".join(COMPARISONS)}')
+    if rule.get('aggregate', 'any') not in AGGREGATES:
+        raise Exception(f'Rule {name}: aggregate must be one of {", ".join(AGGREGATES)}')
+    if 'threshold' not in rule:
+        raise Exception(f'Rule {name} has no threshold!')
+
+    if rule['input'] in FILE_INPUTS:
+        if rule.get('aggregate') != 'count' or 'filter' in rule:
+            raise Exception(f'Rule {name}: only an unfiltered count can be used on {rule["input"]}')
+    elif rule.get('sheet') == None or rule.get('column') == None:
+        raise Exception(f'Rule {name}: a sheet and column are required for {rule["input"]}')
+    elif rule.get('aggregate') == 'bed' and len(rule.get('bed_columns', [])) != 3:
+        raise Exception(f'Rule {name}: bed_columns (chromosome, start and end) are required for the bed aggregate')
+
+    filters = []
+    for row_filter in rule.get('filter', []):
+        if row_filter.get('op') not in FILTERS:
+            raise Exception(f'Rule {name}: filter op must be one of {", ".join(FILTERS)}')
+        filters.append((row_filter['column'], FILTERS[row_filter['op']], row_filter['value']))
+
+    return Rule(
+        name=name,
+        description=rule.get('description', ''),
+        input=rule['input'],
+        sheet=rule.get('sheet'),
+        column=rule.get('column'),
+        filters=tuple(filters),
+        compare=COMPARISONS[rule['fail_if']],
+        threshold=rule['threshold'],
+        fail_non_finite=rule.get('fail_non_finite', False),
+        aggregate=rule.get('aggregate', 'any'),
+        label=rule.get('label'),
+        bed_columns=tuple(rule.get('bed_columns', [])),
+    )
+
+
+def load_rules(panel):
+    '''
+    Compile the rule file of a panel into a RuleSet. The compiled rules are kept for the lifetime
+    of the process (until the rule file changes), so all pairs checked by a process, e.g. a batch
+    worker, share one RuleSet.
+    '''
+    path = rules_file(panel)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        raise Exception(f'No quality check rules for panel {panel}! Expected a rule file at {path}')
+
+    with _rule_set_lock:
+        if panel in _rule_sets and _rule_sets[panel][0] == mtime:
+            return _rule_sets[panel][1]
+
+    with open(path, 'rb') as file:
+        text = file.read()
+    with open(__file__, 'rb') as file:
+        engine = file.read()
+
+    definition = json.loads(text)
+    rules = tuple(compile_rule(rule) for rule in definition['checks'])
+
+    columns = {}
+    for rule in rules:
+        if rule.input in SHEET_INPUTS:
+            sheet_columns = columns.setdefault((rule.input, rule.sheet), [])
+            for column in [row_filter[0] for row_filter in rule.filters] + [rule.column]:
+                if column not in sheet_columns:
+                    sheet_columns.append(column)
+
+    rule_set = RuleSet(panel=panel, path=path, key=hashlib.sha1(text + engine).hexdigest(), rules=rules,
+                       columns={sheet: tuple(sheet_columns) for sheet, sheet_columns in columns.items()},
+                       identity=definition.get('identity'))
+
+    with _rule_set_lock:
+        _rule_sets[panel] = (mtime, rule_set)
+
+    return rule_set
+
+
+def expected_count(rule_set, input_name):
+    '''
+    The number of rows (or files) a count rule requires for an input, e.g. 48 VCFs.
+    None if the panel has no such rule.
+    '''
+    for rule in rule_set.rules:
+        if rule.input == input_name and rule.aggregate in ('count', 'bed') and rule.compare == operator.ne:
+            return rule.threshold
+
+    return None
+
+
+def row_labels(path, sheet, label, rows):
+    '''
+    Names of the given rows of a sheet from a label template e.g. '{Gene} {Chr}:{Start}-{End}'.
+    Fields are column names (matched ignoring case) or column positions. The whole sheet is only
+    read when a check fails. Rows are named by excel row number if a field is not a column.
+    '''
+    row_names = [f'Row {row + 2}' for row in rows]
+    if label == None:
+        return row_names
+
+    sheet_df = read_sheet(path, sheet, None)
+    columns = {str(column).lower(): column for column in sheet_df.columns}
+
+    labels = pd.Series('', index=rows)
+    for text, field, spec, conversion in string.Formatter().parse(label):
+        labels = labels + text
+        if field == None:
+            continue
+        if field.isdigit() and int(field) < len(sheet_df.columns):
+            values = sheet_df.iloc[:, int(field)]
+        elif field.lower() in columns:
+            values = sheet_df[columns[field.lower()]]
+        else:
+            return row_names
+        # a column of whole numbers with a blank cell is read as float, e.g. Start 17014.0
+        labels = labels + [str(int(value)) if isinstance(value, float) and value.is_integer() else str(value)
+                           for value in values.iloc[rows]]
+
+    return labels.tolist()
+
+
+def failing_rows(labels, values):
+    '''
+    The failing samples (or exons) of a check as a list of {'Sample': name, 'Value': value}
+    which is stored in the Failures column of the check_result_df and shown in the report.
+    '''
+    failures = []
+    for label, value in zip(labels, values):
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            value = str(value)
+        failures.append({'Sample': str(label), 'Value': value})
+
+    return failures
+
+
+def evaluate_bed_rule(rule, source, rows, bed):
+    '''
+    Join the rows of a sheet (e.g. the exons of the Coverage-exon tab) to the intervals of the
+    coverage BED file using its sorted interval index (see bed_index). FAIL if a BED interval is
+    missing from the sheet or the sheet has an extra interval; both are listed in the failures.
+    If the BED file is not available or the sheet has no bed_columns, the number of rows is
+    compared with the threshold instead. Returns the result, failures and a note for the description.
+    '''
+    sheet_df = read_sheet(source, rule.sheet, None)
+    columns = {str(column).lower(): column for column in sheet_df.columns}
+    bed_columns = [columns.get(column.lower()) for column in rule.bed_columns]
+
+    if bed == None or not os.path.isfile(bed):
+        note = f'coverage BED {os.path.basename(str(bed))} not found, {rule.threshold} rows expected'
+    elif None in bed_columns:
+        note = f'no {"/".join(rule.bed_columns)} columns in the {rule.sheet} tab, {rule.threshold} rows expected'
+    else:
+        index = bed_index.load_index(bed)
+        interval_df = sheet_df.iloc[rows]
+        missing, extra = bed_index.join_intervals(index, *(interval_df[column].values for column in bed_columns))
+        failures = [{'Sample': label, 'Value': 'missing'} for label in bed_index.interval_labels(index, missing)]
+        failures += [{'Sample': label, 'Value': 'extra'} for label in row_labels(source, rule.sheet, rule.label, rows[extra])]
+        return ('FAIL' if len(failures) != 0 else 'PASS'), failures, f'{len(index.keys)} exons in {os.path.basename(bed)}'
+
+    failed = rule.compare(len(rows), rule.threshold)
+
+    return ('FAIL' if failed else 'PASS'), [], note
+
+
+def evaluate_rule(rule, source, sheet_columns, bed=None):
+    '''
+    Evaluate a single rule. For excel inputs sheet_columns holds the sheet's columns as numpy
+    arrays, for file inputs source is the list of files. bed is the coverage BED used by the bed aggregate.
+    Returns the PASS/FAIL result, the failures and a note added to the description ('' for none).
+    '''
+    if rule.input in FILE_INPUTS:
+        values = np.arange(len(source))
+    else:
+        values = sheet_columns[rule.column]
+
+    # keep the rows matching every filter
+    rows = np.ones(len(values), dtype=bool)
+    for column, op, value in rule.filters:
+        rows &= np.asarray(op(sheet_columns[column], value), dtype=bool)
+    rows = np.flatnonzero(rows)
+
+    if rule.aggregate == 'count':
+        failed = rule.compare(len(rows), rule.threshold)
+        return ('FAIL' if failed else 'PASS'), [], ''
+    elif rule.aggregate == 'bed':
+        return evaluate_bed_rule(rule, source, rows, bed)
+
+    values = values[rows]
+    if not isinstance(rule.threshold, str):
+        values = pd.to_numeric(pd.Series(values), errors='coerce').values.astype(float)
+
+    with np.errstate(invalid='ignore'):
+        failed = np.asarray(rule.compare(values, rule.threshold), dtype=bool)
+        if rule.fail_non_finite:
+            failed |= ~np.isfinite(values)
+
+    if not failed.any():
+        return 'PASS', [], ''
+
+    labels = row_labels(source, rule.sheet, rule.label, rows[failed])
+
+    return 'FAIL', failing_rows(labels, values[failed]), ''
+
+
+def add_row(df, row):
+    '''
+    Return df with a row added from a dict of column values, as DataFrame.append did before it was
+    removed in pandas 2. Columns of df missing from the row are NaN.
+    '''
+    row_df = pd.DataFrame([row], columns=list(df.columns) + [column for column in row if column not in df.columns])
+
+    return row_df if len(df) == 0 else pd.concat([df, row_df], ignore_index=True, sort=False)
+
+
+def evaluate(rule_set, input_name, source, worksheet_name, check_result_df, bed=None):
+    '''
+    Run every rule of a RuleSet for one input (an excel report path, or the list of VCF files)
+    and add a row for each check to the check_result_df, in rule file order.
+    The columns of each sheet are read in one pass for all of its rules. bed is the coverage BED file of the worksheet.
+    '''
+    sheet_columns = {}
+    for (rule_input, sheet), columns in rule_set.columns.items():
+        if rule_input == input_name:
+            sheet_columns[sheet] = read_columns(source, sheet, columns)
+
+    for rule in rule_set.rules:
+        if rule.input != input_name:
+            continue
+
+        result, failures, note = evaluate_rule(rule, source, sheet_columns.get(rule.sheet), bed)
+        check_result_df = add_row(check_result_df, {'Check': rule.name,
+                                                    'Description': f'{rule.description} ({note})' if note != '' else rule.description,
+                                                    'Result': result,
+                                                    'Worksheet': worksheet_name,
+                                                    'Failures': failures})
+
+    return check_result_df
@@ -0,0 +1,214 @@
+import os
+import re
+import json
+import sqlite3
+import argparse
+import datetime
+import pandas as pd
+
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    pair TEXT NOT NULL,
+    panel TEXT NOT NULL,
+    qc_date TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS worksheets (
+    run_id INTEGER NOT NULL REFERENCES runs(run_id),
+    worksheet TEXT NOT NULL,
+    panel TEXT NOT NULL,
+    run_date TEXT,
+    pipeline_version TEXT,
+    experiment_name TEXT,
+    ab_threshold TEXT,
+    target_bed TEXT,
+    refined_bed TEXT,
+    coverage_bed TEXT,
+    sample_sheet TEXT,
+    pipeline_args TEXT
+);
+CREATE TABLE IF NOT EXISTS check_results (
+    run_id INTEGER NOT NULL REFERENCES runs(run_id),
+    worksheet TEXT NOT NULL,
+    panel TEXT NOT NULL,
+    run_date TEXT,
+    check_name TEXT NOT NULL,
+    result TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sample_metrics (
+    run_id INTEGER NOT NULL REFERENCES runs(run_id),
+    worksheet TEXT NOT NULL,
+    panel TEXT NOT NULL,
+    run_date TEXT,
+    sample TEXT,
+    metric TEXT NOT NULL,
+    value REAL
+);
+CREATE INDEX IF NOT EXISTS worksheets_worksheet ON worksheets(worksheet);
+CREATE INDEX IF NOT EXISTS worksheets_panel_date ON worksheets(panel, run_date);
+CREATE INDEX IF NOT EXISTS check_results_worksheet ON check_results(worksheet);
+CREATE INDEX IF NOT EXISTS check_results_panel_date ON check_results(panel, run_date);
+CREATE INDEX IF NOT EXISTS sample_metrics_run_metric ON sample_metrics(run_id, metric);
+CREATE INDEX IF NOT EXISTS sample_metrics_worksheet ON sample_metrics(worksheet);
+CREATE INDEX IF NOT EXISTS sample_metrics_panel_date ON sample_metrics(panel, run_date);
+'''
+
+
+def connect(db):
+    '''
+    Open (and create if needed) the results database. A long timeout lets batch workers
+    write to the same database one after another.
+    '''
+    if os.path.dirname(db) != '':
+        os.makedirs(os.path.dirname(db), exist_ok=True)
+    conn = sqlite3.connect(db, timeout=60)
+    conn.executescript(SCHEMA)
+
+    # databases created before the pipeline command was recorded
+    columns = [row[1] for row in conn.execute('PRAGMA table_info(worksheets)')]
+    for column in ('sample_sheet', 'pipeline_args'):
+        if column not in columns:
+            conn.execute(f'ALTER TABLE worksheets ADD COLUMN {column} TEXT')
+
+    return conn
+
+
+def experiment_date(experiment_name):
+    '''
+    Sequencing date (YYYY-MM-DD) from the YYMMDD prefix of a MiSeq experiment name e.g. 191212_M01234_...
+    '''
+    date = re.match(r'(\d{2})(\d{2})(\d{2})_', str(experiment_name))
+    if date == None:
+        return None
+
+    return '20{}-{}-{}'.format(*date.groups())
+
+
+def write_run(db, panel, check_result_df, run_details_df, beds, metrics_df, commands=None):
+    '''
+    Record a quality check run in the results database:
+        1) run details for each worksheet (pipeline version, experiment name, AB threshold, BED files,
+           and the sample sheet and pipeline arguments (JSON) if commands is given)
+        2) the PASS/FAIL result of each check
+        3) the per-sample metrics behind the checks (metrics_df columns Worksheet, Sample, Metric, Value)
+    beds is a dict of worksheet -> {'Target bed', 'Refined bed', 'Coverage bed'} and commands a dict
+    of worksheet -> pipeline command (see command_log.CommandLog).
+    Each table stores the panel and sequencing date so trend queries only use the indexes.
+    '''
+    run_dates = {row['Worksheet']: experiment_date(row['Experiment name']) for i, row in run_details_df.iterrows()}
+    commands = {} if commands == None else commands
+    worksheets = sorted(run_dates)
+    pair = '_'.join(worksheets)
+    # pair level results (e.g. kinship) use the date of the 1st worksheet
+    run_dates[pair] = run_dates[worksheets[0]]
+
+    conn = connect(db)
+    with conn:
+        run_id = conn.execute('INSERT INTO runs (pair, panel, qc_date) VALUES (?, ?, ?)',
+                              (pair, panel, datetime.datetime.now().isoformat(timespec='seconds'))).lastrowid
+
+        conn.executemany('INSERT INTO worksheets (run_id, worksheet, panel, run_date, pipeline_version, experiment_name, '
+                         'ab_threshold, target_bed, refined_bed, coverage_bed, sample_sheet, pipeline_args) '
+                         'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', [
+            (run_id, row['Worksheet'], panel, run_dates[row['Worksheet']], str(row['Pipeline version']),
+             str(row['Experiment name']), str(row['AB threshold']), beds[row['Worksheet']]['Target bed'],
+             beds[row['Worksheet']]['Refined bed'], beds[row['Worksheet']]['Coverage bed'],
+             commands.get(row['Worksheet'], {}).get('sample_sheet'),
+             json.dumps(commands[row['Worksheet']]['arguments']) if row['Worksheet'] in commands else None)
+            for i, row in run_details_df.iterrows()])
+
+        conn.executemany('INSERT INTO check_results VALUES (?, ?, ?, ?, ?, ?)', [
+            (run_id, row['Worksheet'], panel, run_dates.get(row['Worksheet']), row['Check'], row['Result'])
+            for i, row in check_result_df.iterrows()])
+
+        conn.executemany('INSERT INTO sample_metrics VALUES (?, ?, ?, ?, ?, ?, ?)', [
+            (run_id, worksheet, panel, run_dates.get(worksheet), str(sample), metric, float(value))
+            for worksheet, sample, metric, value in metrics_df[['Worksheet', 'Sample', 'Metric', 'Value']].itertuples(index=False)])
+    conn.close()
+
+    return run_id
+
+
+LATEST_RUNS = '''
+SELECT worksheet, MAX(run_id) AS run_id, MAX(run_date) AS run_date
+FROM worksheets
+WHERE (:panel IS NULL OR panel = :panel)
+GROUP BY worksheet
+ORDER BY run_date DESC, worksheet DESC
+LIMIT :last
+'''
+
+
+def metric_values(db, metric, last=200, panel=None):
+    '''
+    All values of a per-sample metric (e.g. PCT_TARGET_BASES_20X) from the latest run of each of
+    the last worksheets (by sequencing date).
+    '''
+    query = f'''
+    WITH latest AS ({LATEST_RUNS})
+    SELECT m.worksheet AS Worksheet, m.run_date AS "Run date", m.sample AS Sample, m.value AS Value
+    FROM sample_metrics m
+    WHERE m.metric = :metric AND m.run_id IN (SELECT run_id FROM latest)
+    '''
+    conn = connect(db)
+    values_df = pd.read_sql_query(query, conn, params={'metric': metric, 'last': last, 'panel': panel})
+    conn.close()
+
+    return values_df
+
+
+def metric_distribution(db, metric, last=200, panel=None):
+    '''
+    Distribution (count, min, 5th percentile, median, mean, max) of a per-sample metric for each
+    of the last worksheets, plus an overall row.
+    '''
+    values_df = metric_values(db, metric, last, panel)
+    stats = ['count', 'min', lambda v: v.quantile(0.05), 'median', 'mean', 'max']
+    names = ['Samples', 'Min', '5th percentile', 'Median', 'Mean', 'Max']
+
+    distribution_df = values_df.groupby(['Run date', 'Worksheet'])['Value'].agg(stats)
+    distribution_df.columns = names
+    distribution_df = distribution_df.sort_index(ascending=False).reset_index()
+
+    overall = values_df['Value'].agg(stats)
+    overall.index = names
+    distribution_df = pd.concat([distribution_df, pd.DataFrame([dict(overall, **{'Run date': '', 'Worksheet': 'All'})])], ignore_index=True)
+
+    return distribution_df
+
+
+def check_failures(db, last=200, panel=None):
+    '''
+    Number of PASS and FAIL results for each check over the latest run of each of the last worksheets.
+    '''
+    query = f'''
+    WITH latest AS ({LATEST_RUNS})
+    SELECT check_name AS "Check",
+           SUM(result = 'PASS') AS PASS,
+           SUM(result = 'FAIL') AS FAIL
+    FROM check_results
+    WHERE run_id IN (SELECT run_id FROM latest)
+    GROUP BY check_name
+    ORDER BY check_name
+    '''
+    conn = connect(db)
+    failures_df = pd.read_sql_query(query, conn, params={'last': last, 'panel': panel})
+    conn.close()
+
+    return failures_df
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Query the quality check results database')
+    parser.add_argument('-db', action='store', required=True, help='Path to the results database')
+    parser.add_argument('-metric', action='store', help='Per-sample metric to summarise e.g. PCT_TARGET_BASES_20X, %%CONT or Kinship')
+    parser.add_argument('-checks', action='store_true', help='Summarise PASS/FAIL counts of each check')
+    parser.add_argument('-last', action='store', type=int, default=200, help='Number of most recent worksheets to include (default 200)')
+    parser.add_argument('-panel', action='store', help='Only include worksheets from this panel')
+    args = parser.parse_args()
+
+    if args.metric != None:
+        print(metric_distribution(args.db, args.metric, args.last, args.panel).to_string(index=False))
+    if args.checks:
+        print(check_failures(args.db, args.last, args.panel).to_string(index=False))
@@ -0,0 +1,131 @@
+import os
+import sys
+import json
+import time
+import signal
+import argparse
+import traceback
+import contextlib
+import socketserver
+import quality_check
+import qc_cache
+import qc_rules
+
+
+# socket of the worker unless -socket is given
+DEFAULT_SOCKET = os.path.join(qc_cache.CACHE_DIR, 'qc_worker.sock')
+
+# run_pair arguments a request may set, in addition to ws_1, ws_2 and out_dir
+REQUEST_OPTIONS = ('workers', 'pool', 'use_cache', 'deep_vcf', 'vcf_records', 'recount_fastqs', 'fastq_dirs',
+                   'bed_dir', 'identity', 'identity_snps', 'profile', 'prefetch_workers')
+
+
+def handle_request(request):
+    '''
+    Run the checks for one request: a dict with ws_1, ws_2 and optionally out_dir, db (or no_db)
+    and any of REQUEST_OPTIONS. {"command": "ping"} checks the worker is up.
+    Output of the checks goes to stderr so stdout only carries responses.
+    Returns the response: the pair status (PASS, FAIL or ERROR), the error message, the result
+    of each check, the report paths and the seconds taken.
+    '''
+    start = time.perf_counter()
+    if request.get('command') == 'ping':
+        return {'status': 'OK', 'pid': os.getpid()}
+
+    try:
+        unknown = set(request) - {'ws_1', 'ws_2', 'out_dir', 'db', 'no_db'} - set(REQUEST_OPTIONS)
+        if unknown:
+            raise Exception(f'Unknown request keys {", ".join(sorted(unknown))}!')
+
+        options = {key: request[key] for key in REQUEST_OPTIONS if key in request}
+        db = None if request.get('no_db') else request.get('db', quality_check.DEFAULT_DB)
+
+        with contextlib.redirect_stdout(sys.stderr):
+            check_result_df, run_details_df = quality_check.run_pair(request['ws_1'], request['ws_2'], request.get('out_dir'), db=db, **options)
+
+        report_name = '_'.join(run_details_df['Worksheet'].values.tolist()) + '_quality_checks.html'
+        report_dirs = [request['out_dir']] if request.get('out_dir') != None else [request['ws_1'], request['ws_2']]
+        response = {'status': 'FAIL' if 'FAIL' in check_result_df['Result'].values else 'PASS', 'error': '',
+                    'checks': [{'worksheet': check.Worksheet, 'check': check.Check, 'result': check.Result}
+                               for check in check_result_df.itertuples(index=False)],
+                    'reports': [os.path.join(report_dir, report_name) for report_dir in report_dirs]}
+    except Exception as e:
+        traceback.print_exc()
+        response = {'status': 'ERROR', 'error': str(e), 'checks': [], 'reports': []}
+
+    response['seconds'] = round(time.perf_counter() - start, 3)
+
+    return response
+
+
+def handle_line(line):
+    '''
+    The JSON response line for a JSON request line.
+    '''
+    try:
+        request = json.loads(line)
+    except ValueError as e:
+        return json.dumps({'status': 'ERROR', 'error': f'Request is not JSON: {e}', 'checks': [], 'reports': []})
+
+    return json.dumps(handle_request(request))
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    '''
+    Reads JSON requests from a client connection, one per line, and writes a JSON response line for each.
+    '''
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            self.wfile.write((handle_line(line.decode()) + '\n').encode())
+            self.wfile.flush()
+
+
+def serve_socket(socket_path):
+    '''
+    Serve requests on a Unix socket until interrupted or terminated. Requests are run one at a time in this
+    process, so pandas is imported once and the compiled rules, BED indexes and TSHC folder
+    manifests stay in memory between requests. The socket is only accessible to this user.
+    '''
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+    os.makedirs(os.path.dirname(os.path.abspath(socket_path)), exist_ok=True)
+
+    # stop on SIGTERM as on Ctrl-C, so the socket is removed
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+
+    with socketserver.UnixStreamServer(socket_path, RequestHandler) as server:
+        os.chmod(socket_path, 0o600)
+        print(f'Quality check worker {os.getpid()} listening on {socket_path}', file=sys.stderr)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            os.remove(socket_path)
+
+
+def serve_stdin():
+    '''
+    Serve JSON requests read from stdin, one per line, writing a JSON response line to stdout for each.
+    '''
+    for line in sys.stdin:
+        if line.strip():
+            print(handle_line(line), flush=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Long running quality check worker which serves JSON requests {"ws_1", "ws_2", "out_dir"}')
+    parser.add_argument('-socket', action='store', default=DEFAULT_SOCKET, help=f'Unix socket to listen on (default {DEFAULT_SOCKET})')
+    parser.add_argument('-stdin', action='store_true', help='Read requests from stdin and write responses to stdout instead of listening on a socket')
+    parser.add_argument('-panels', action='store', nargs='*', default=['TSHC'], help='Panel rules to compile at start up (default TSHC)')
+    args = parser.parse_args()
+
+    for panel in args.panels:
+        qc_rules.load_rules(panel)
+
+    if args.stdin:
+        serve_stdin()
+    else:
+        serve_socket(args.socket)
@@ -1,21 +1,30 @@
 import os
 import pandas as pd
 import argparse
-import sys
 import re
-import numpy as np
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from excel_reader import read_sheet, read_columns, parse_summary, clear_cache
+import qc_cache
+import qc_store
+import qc_rules
+import vcf_integrity
+import fastq_recount
+import sample_identity
+import qc_profile
+import qc_prefetch
+import command_log
+import html_report
+from qc_cache import build_manifest
 
 
+# results database used by the command line unless -db/-no_db is given
+DEFAULT_DB = os.path.join(qc_cache.CACHE_DIR, 'qc_results.sqlite')
 
-parser = argparse.ArgumentParser()
-parser.add_argument('-ws_1', action='store', required=True, help='Path to worksheet 1 output files include TSHC_<ws>_version dir')
-parser.add_argument('-ws_2', action='store', required=True, help='Path to worksheet 2 output files include TSHC_<ws>_version dir')
-parser.add_argument('-out_dir', action='store', nargs='?', help='Specifing an output directory to store html reports')
-args = parser.parse_args()
 
 
-
-def get_inputs(ws_1, ws_2):
+def get_inputs(ws_1, ws_2, use_cache=True):
     '''
     All TSHC runs are conducted in pairs. The get_inputs function defines the
     following variables for a paired set of outputs:
@@ -29,7 +38,8 @@ def get_inputs(ws_1, ws_2):
         9) cmd_log_1 - command run text file (1st w/s in pair)
         10) cmd_log_2 - command run text file (2nd w/s pair)
         11) Panel - Name of panel
-
+    The TSHC folders are listed through qc_cache.build_manifest, which reuses a cached manifest
+    of each folder unless use_cache is False.
     '''
 
     ws_1_run_info = re.search(r'\/(\w{4,7})_(\d{6})_(v[\.]?\d\.\d\.\d)\/', ws_1)    
@@ -50,288 +60,349 @@ def get_inputs(ws_1, ws_2):
     else:
         raise Exception('Panels from ws_1 and ws_2 do not match!')
 
-    # defining excel inputs
-    ws_1_excel_reports = ws_1 + 'excel_reports_{}_{}/'.format(ws_1_panel, ws_1_name)
-    ws_1_list = pd.DataFrame(os.listdir(ws_1_excel_reports), columns=['sample_name'])
-    ws_2_excel_reports = ws_2 + 'excel_reports_{}_{}/'.format(ws_2_panel, ws_2_name)
-    ws_2_list = pd.DataFrame(os.listdir(ws_2_excel_reports), columns=['sample_name'])
+    # classify the files of each TSHC output folder (cached until the folders change)
+    manifest_1 = build_manifest(ws_1, use_cache)
+    manifest_2 = build_manifest(ws_2, use_cache)
 
-    xls_rep_1 = ws_1_list[~ws_1_list['sample_name'].str.contains('Neg|-fastq-bam-check')]
-    xls_rep_2 = ws_2_list[~ws_2_list['sample_name'].str.contains('Neg|-fastq-bam-check')]
-    neg_rep_1 = ws_1_list[ws_1_list['sample_name'].str.contains('Neg')]
-    neg_rep_2 = ws_2_list[ws_2_list['sample_name'].str.contains('Neg')]
-    fastq_xls_1 = ws_1_list[ws_1_list['sample_name'].str.contains('fastq-bam-check')]
-    fastq_xls_2 = ws_2_list[ws_2_list['sample_name'].str.contains('fastq-bam-check')]
+    for manifest in (manifest_1, manifest_2):
+        for folder in (manifest.ws_dir, manifest.excel_reports_dir):
+            if manifest.dir_mtimes[folder] == None:
+                raise FileNotFoundError(f'{folder} not found!')
+        if len(manifest.results_reports) == 0:
+            raise Exception(f'Error the results excel report is not present in {manifest.excel_reports_dir}!')
+        if len(manifest.fastq_bam_reports) == 0:
+            raise Exception(f'Error the fastq-bam-check excel report is not present in {manifest.excel_reports_dir}!')
 
-    xls_rep_1 = ws_1_excel_reports + xls_rep_1.values[0][0]
-    xls_rep_2 = ws_2_excel_reports + xls_rep_2.values[0][0]
+    xls_rep_1 = manifest_1.results_reports[0]
+    xls_rep_2 = manifest_2.results_reports[0]
 
     #determine which ws contains the negative sample
-    if len(neg_rep_1) != 0:
-        neg_rep = ws_1_excel_reports + neg_rep_1.values[0][0]
-    elif len(neg_rep_2) != 0:
-        neg_rep = ws_2_excel_reports + neg_rep_2.values[0][0]
+    if len(manifest_1.neg_reports) != 0:
+        neg_rep = manifest_1.neg_reports[0]
+    elif len(manifest_2.neg_reports) != 0:
+        neg_rep = manifest_2.neg_reports[0]
     else:
         raise Exception('Error the negative sample is not present!')
 
     # get fastq-bam-check file names 
-    fastq_bam_1 = ws_1_excel_reports + fastq_xls_1.values[0][0]
-    fastq_bam_2 = ws_2_excel_reports + fastq_xls_2.values[0][0]
+    fastq_bam_1 = manifest_1.fastq_bam_reports[0]
+    fastq_bam_2 = manifest_2.fastq_bam_reports[0]
 
     # defining vcf directory path 
-    vcf_dir_1 = ws_1 + 'vcfs_{}_{}/'.format(ws_1_panel, ws_1_name)
-    vcf_dir_2 = ws_2 + 'vcfs_{}_{}/'.format(ws_2_panel, ws_2_name)
+    vcf_dir_1 = manifest_1.vcf_dir
+    vcf_dir_2 = manifest_2.vcf_dir
 
     # defining cmd_log and kin
-    cmd_log_1 = ws_1 + '{}.commandline_usage_logfile'.format(ws_1_name)
-    cmd_log_2 = ws_2 + '{}.commandline_usage_logfile'.format(ws_2_name)
-    kin_xls = ws_1 + '{}_{}.king.xlsx'.format(ws_1_name, ws_2_name)
+    cmd_log_1 = manifest_1.ws_dir + '{}.commandline_usage_logfile'.format(ws_1_name)
+    cmd_log_2 = manifest_2.ws_dir + '{}.commandline_usage_logfile'.format(ws_2_name)
+    kin_xls = manifest_1.ws_dir + '{}_{}.king.xlsx'.format(ws_1_name, ws_2_name)
     
 
     return xls_rep_1, xls_rep_2, neg_rep, fastq_bam_1, fastq_bam_2, kin_xls, vcf_dir_1, vcf_dir_2, cmd_log_1, cmd_log_2, panel
 
 
 
-def results_excel_check(res, check_result_df):
+def results_excel_check(res, rules, check_result_df):
     '''
-    2 independent checks are completed on each excel report generated by the pipeline:
+    The checks of the panel rules on each excel report generated by the pipeline e.g. for TSHC:
         a) 20x coverage check- Column V of the 'Hyb-QC' tab. PASS if all samples >96% (excludes D00-00000)
         b) VerifyBamId check- Coulmn I of the 'VerifyBamId' tab. PASS if all samples < 3% 
-    A description of the checks and a PASS/FAIL result for a given check are then added to the check_result_df
+    A description of the checks, a PASS/FAIL result and the failing samples for a given check are then added to the check_result_df
     '''
-
-    xls = pd.ExcelFile(res)
-    hybqc_df = pd.read_excel(xls, 'Hyb-QC')
-    verify_bam_id_df = pd.read_excel(xls, 'VerifyBamId')
-    
     work_num = os.path.basename(res)
     worksheet_name = re.search(r'\d{6}', work_num)[0]
-    
-    # list of all % coverage at 20x (excluding control) 
-    coverage_list = hybqc_df[~hybqc_df['Sample'].str.contains('D00-00000')]['PCT_TARGET_BASES_20X'].values
-    coverage_check = '20x coverage check'
-    coverage_check_des = 'A check to determine if 96% of all target bases in each sample are covered at 20X or greater'
-    coverage_result = 'PASS'
-
-    for value in coverage_list:
-        if value < 0.96:
-            coverage_result = 'FAIL'
-            
-    #list all VerifyBamId results (inc control)
-    verify_bam_list = verify_bam_id_df['%CONT'].values
-    verify_bam_check = 'VerifyBamId check'
-    verify_bam_check_des = 'A check to determine if all samples in a worksheet have contamination < 3%'
-    verify_bam_result = 'PASS'
-    for value in verify_bam_list:
-        if value >= 3:
-            verify_bam_result = 'FAIL'
-    
-    check_result_df = check_result_df.append({'Check': verify_bam_check,
-                            'Description': verify_bam_check_des,
-                            'Result': verify_bam_result, 'Worksheet': worksheet_name}, ignore_index=True)
-    
-    check_result_df = check_result_df.append({'Check': coverage_check,
-                            'Description': coverage_check_des,
-                            'Result': coverage_result, 'Worksheet':worksheet_name}, ignore_index=True)
-    
-    return check_result_df
+
+    return qc_rules.evaluate(rules, 'results', res, worksheet_name, check_result_df)
     
     
-def neg_excel_check(neg_xls, check_result_df):
+def neg_excel_check(neg_xls, coverage_bed, rules, check_result_df):
     '''
-    2 independent checks on the negative sample excel report produced by the pipeline run (1 per pair):
-        a) Numer of exons- In the 'Coverage-exon' tab 1204 exons should be present
+    The checks of the panel rules on the negative sample excel report produced by the pipeline run (1 per pair) e.g. for TSHC:
+        a) Numer of exons- The exons in the 'Coverage-exon' tab should be the exons of the coverage BED
+           (1209 exons for TSHC, the number of rows is checked if the BED file is not available)
         b) Max number of reads in negative- In column M of the 'Coverage-exon' no max should be > 0
 
-    A description of the checks and a PASS/FAIL result for a given check are then added to the check_result_df
+    A description of the checks, a PASS/FAIL result and the missing, extra and contaminated exons are then added to the check_result_df
     '''
-    
     work_num = os.path.basename(neg_xls)
     worksheet_name = re.search(r'\d{6}', work_num)[0]
-    
-    xls = pd.ExcelFile(neg_xls)
-    neg_exon_df = pd.read_excel(xls, 'Coverage-exon')
 
-    # number of exons check
-    num_exons_check = 'Number of exons in negative sample'
-    num_exons_check_des = 'A check to determine if 1209 exons are present in the negative control (Coverage-exon tab)'
-    
-    if len(neg_exon_df) == 1209:
-        num_exons_check_result = 'PASS'
-    else:
-        num_exons_check_result = 'FAIL'
-    
-    cov_neg_exons_check = 'Contamination of negative sample'
-    cov_neg_exons_check_des = 'A check to determine if the max read depth of the negative sample is equal to 0'
-    max_neg_coverage = neg_exon_df['Max'].values
+    return qc_rules.evaluate(rules, 'neg', neg_xls, worksheet_name, check_result_df, bed=coverage_bed)
 
-    over_1x = []
-    for depth in set(max_neg_coverage):
-        if depth >= 1:
-            over_1x.append(depth)
-
-    if len(over_1x) >= 1:
-        cov_neg_exons_check_result = 'FAIL'
-    else:
-        cov_neg_exons_check_result = 'PASS'
 
 
-    check_result_df = check_result_df.append({'Check': num_exons_check,
-                                                'Description': num_exons_check_des,
-                                                'Result': num_exons_check_result,
-                                                'Worksheet': worksheet_name}, ignore_index=True)
+def kinship_check(kin_xls, rules, check_result_df):
+    '''
+    A check to determine if any sample the kinship.xls file has a kinship value over the panel threshold (0.48 for TSHC)
+    A description of the check, a PASS/FAIL result and the failing sample pairs are then added to the check_result_df
+    '''
+    worksheet_name = re.search(r'\/(\d{6}_\d{6}).king.xlsx.*', kin_xls).group(1)
 
-    check_result_df = check_result_df.append({'Check': cov_neg_exons_check,
-                                                'Description': cov_neg_exons_check_des,
-                                                'Result': cov_neg_exons_check_result,
-                                                'Worksheet': worksheet_name}, ignore_index=True)
-    
-    return check_result_df
+    return qc_rules.evaluate(rules, 'kinship', kin_xls, worksheet_name, check_result_df)
 
 
 
-def kinship_check(kin_xls, check_result_df):
+def vcf_dir_check(vcf_dir, rules, check_result_df):
     '''
-    A check to determine if any sample the kinship.xls file has a kinship values of 0.48 or greater
+    A check to see if the expected number of VCF files (48 for TSHC) have been generated
     A description of the check and a PASS/FAIL result for the check is then added to the check_result_df
     '''
-    worksheet_name = re.search(r'\/(\d{6}_\d{6}).king.xlsx.*', kin_xls).group(1)
+    worksheet_name = str(re.search(r'\/vcfs_\w{4}_(\d{6})\/', vcf_dir).group(1))
 
-    kinship_check = 'Kinship check'
-    kinship_check_des = 'A check to determine if any sample in the worksheet pair has a kinship value of 0.48 or higher'
-    
-    xls = pd.ExcelFile(kin_xls)
-    kinship_df = pd.read_excel(xls, 'Kinship')
-    
-    kinship_values = kinship_df['Kinship'].values
-    
-    if max(kinship_values) >= 0.48:
-        kinship_check_result = 'FAIL'
-    else:
-        kinship_check_result = 'PASS'
-    
-    # Additional step to set fail for any kinship result containing inf and nan values 
-    for kin in kinship_values:
-        if np.isnan(kin) == True or np.isinf(kin) == True:
-            kinship_check_result = 'FAIL'
-    
-    check_result_df = check_result_df.append({'Check': kinship_check,
-                                                'Description': kinship_check_des,
-                                                'Result': kinship_check_result,
-                                                'Worksheet': worksheet_name}, ignore_index=True)
-    
-    return check_result_df
+    # vcf listing from the manifest of the TSHC folder containing vcf_dir
+    vcfs = build_manifest(os.path.dirname(vcf_dir.rstrip('/'))).vcfs
 
+    return qc_rules.evaluate(rules, 'vcfs', vcfs, worksheet_name, check_result_df)
 
 
-def vcf_dir_check(vcf_dir, check_result_df):
+def vcf_integrity_check(vcf_dir, records, check_result_df):
     '''
-    A check to see if 48 VCF files have been generated
-    A description of the check and a PASS/FAIL result for the check is then added to the check_result_df
+    Optional deep check of each VCF in vcf_dir (see vcf_integrity.check_vcf): the file is not empty,
+    is not truncated (BGZF EOF block or final newline, read from the file tail only) and has a well
+    formed header. If records is True the records of each VCF are also counted, which reads every file.
+    A description of the check, a PASS/FAIL result and the failing VCFs are then added to the check_result_df
     '''
-
     worksheet_name = str(re.search(r'\/vcfs_\w{4}_(\d{6})\/', vcf_dir).group(1))
-    vcf_dir_check = 'VCF file count check'
-    vcf_dir_check_des = 'A check to determine if 48 VCFs have been generated'
-    
-    if len(os.listdir(vcf_dir)) == 48:
-        vcf_dir_check_result = 'PASS'
-    else:
-        vcf_dir_check_result = 'FAIL'
-    
-    check_result_df = check_result_df.append({'Check': vcf_dir_check,
-                                                'Description': vcf_dir_check_des,
-                                                'Result': vcf_dir_check_result,
-                                                'Worksheet': worksheet_name}, ignore_index=True)
-    
+    vcf_integrity_check = 'VCF integrity check'
+    vcf_integrity_check_des = 'A check to determine if each VCF is complete (not empty or truncated) with a well formed header'
+
+    vcfs = build_manifest(os.path.dirname(vcf_dir.rstrip('/'))).vcfs
+    vcf_results = vcf_integrity.check_vcfs(vcfs, records)
+
+    failures = [{'Sample': vcf['File'], 'Value': vcf['Error']} for vcf in vcf_results if vcf['Result'] == 'FAIL']
+    vcf_integrity_check_result = 'FAIL' if len(failures) != 0 else 'PASS'
+
+    if records:
+        record_counts = [vcf['Records'] for vcf in vcf_results if vcf['Records'] != None]
+        if len(record_counts) != 0:
+            vcf_integrity_check_des += f' ({sum(record_counts)} records, {min(record_counts)} to {max(record_counts)} per VCF)'
+
+    check_result_df = qc_rules.add_row(check_result_df, {'Check': vcf_integrity_check,
+                                                           'Description': vcf_integrity_check_des,
+                                                           'Result': vcf_integrity_check_result,
+                                                           'Worksheet': worksheet_name,
+                                                           'Failures': failures})
+
     return check_result_df
 
 
-def fastq_bam_check(fastq_xls, check_result_df):
+def fastq_bam_check(fastq_xls, rules, check_result_df):
     '''
     A check to determine that the expected number of reads are present in each FASTQ and BAM file
-    A description of the check and a PASS/FAIL result for the check is then added to the check_result_df
+    A description of the check, a PASS/FAIL result and the failing samples are then added to the check_result_df
     '''
-    
     work_num = os.path.basename(fastq_xls)
     worksheet_name = re.search(r'\d{6}', work_num)[0]
-    
 
-    fastq_bam_check = 'FASTQ-BAM check'
-    fastq_bam_check_des = 'A check to determine that the expected number of reads are present in each FASTQ and BAM file'
-    xls = pd.ExcelFile(fastq_xls)
-    fastq_bam_df = pd.read_excel(xls, 'Check')
-    fastq_bam = set(fastq_bam_df['Result'].values)
+    return qc_rules.evaluate(rules, 'fastq_bam', fastq_xls, worksheet_name, check_result_df)
 
-    if 'FAIL' in fastq_bam:
-        fastq_bam_check_result = 'FAIL'
-    else:
-        fastq_bam_check_result = 'PASS'
-    
-    check_result_df = check_result_df.append({'Check': fastq_bam_check,
-                                                'Description': fastq_bam_check_des,
-                                                'Result': fastq_bam_check_result,
-                                                'Worksheet': worksheet_name}, ignore_index=True)
+
+def fastq_recount_check(fastq_xls, fastq_dir, check_result_df):
+    '''
+    Optional check which recounts the reads in each sample's FASTQ(.gz) files under fastq_dir on a
+    process pool (see fastq_recount) and compares them with the read counts reported in the
+    fastq-bam-check workbook. The recount throughput is added to the description and printed.
+    A description of the check, a PASS/FAIL result and the mismatched samples are then added to the check_result_df
+    '''
+    work_num = os.path.basename(fastq_xls)
+    worksheet_name = re.search(r'\d{6}', work_num)[0]
+    fastq_recount_check = 'FASTQ recount check'
+
+    recount_df, throughput = fastq_recount.recount(fastq_recount.find_fastqs(fastq_dir))
+    compare_df = fastq_recount.compare_reads(fastq_recount.reported_reads(fastq_xls), recount_df)
+    summary = fastq_recount.throughput_summary(throughput)
+    print(f'{worksheet_name}: {summary}')
+
+    fastq_recount_check_des = f'A check to determine that the reads in each FASTQ file match the fastq-bam-check report. {summary}'
+    mismatch_df = compare_df[compare_df['Mismatch'] != '']
+    fastq_recount_check_result = 'FAIL' if len(mismatch_df) != 0 else 'PASS'
+
+    check_result_df = qc_rules.add_row(check_result_df, {'Check': fastq_recount_check,
+                                                           'Description': fastq_recount_check_des,
+                                                           'Result': fastq_recount_check_result,
+                                                           'Worksheet': worksheet_name,
+                                                           'Failures': [{'Sample': sample, 'Value': mismatch} for sample, mismatch
+                                                                        in zip(mismatch_df['Sample'], mismatch_df['Mismatch'])]})
 
     return check_result_df
 
-def generate_html_output(check_result_df, run_details_df, panel, bed_1, bed_2):
+
+def sample_identity_check(vcf_dir_1, vcf_dir_2, identity, snp_file, check_result_df):
     '''
-    Creating a static HTML file to display the results to the Clinical Scientist reviewing the quality check report.
-    This function calls the format_bed_files function to add in bed file information.
-    This process involves changes directly to the html. TODO find replacement method to edit html.
+    Optional check which genotypes a fixed SNP set in the VCFs of both worksheets and compares the
+    samples with the samples of the last worksheets checked (see sample_identity.check_identity).
+    A sample matching a different DNA number or not matching its own DNA number is a possible swap.
+    identity holds the thresholds from the identity section of the panel rules.
+    A description of the check, a PASS/FAIL result and the possible swaps are then added to the check_result_df
     '''
+    worksheet_1 = str(re.search(r'\/vcfs_\w{4}_(\d{6})\/', vcf_dir_1).group(1))
+    worksheet_2 = str(re.search(r'\/vcfs_\w{4}_(\d{6})\/', vcf_dir_2).group(1))
+    sample_identity_check = 'Sample identity check'
+
+    worksheet_vcfs = {worksheet: build_manifest(os.path.dirname(vcf_dir.rstrip('/'))).vcfs
+                      for worksheet, vcf_dir in ((worksheet_1, vcf_dir_1), (worksheet_2, vcf_dir_2))}
+    matches_df, num_history = sample_identity.check_identity(worksheet_vcfs, snp_file,
+                                                             last_worksheets=identity.get('last_worksheets', 200),
+                                                             min_concordance=identity.get('min_concordance', 0.9),
+                                                             min_sites=identity.get('min_sites', 20),
+                                                             exclude=identity.get('exclude'))
+
+    sample_identity_check_des = (f'A check to determine if each sample matches its DNA number in this worksheet pair and '
+                                 f'the last {identity.get("last_worksheets", 200)} worksheets ({num_history} samples compared)')
+    sample_identity_check_result = 'FAIL' if len(matches_df) != 0 else 'PASS'
+
+    check_result_df = qc_rules.add_row(check_result_df, {'Check': sample_identity_check,
+                                                           'Description': sample_identity_check_des,
+                                                           'Result': sample_identity_check_result,
+                                                           'Worksheet': f'{worksheet_1}_{worksheet_2}',
+                                                           'Failures': [{'Sample': row['Sample'],
+                                                                         'Value': f'{row["Problem"]}: {row["Other sample"]} ({row["Other worksheet"]}) '
+                                                                                  f'concordance {row["Concordance"]} over {row["Sites"]} SNPs'}
+                                                                        for row in matches_df.to_dict('records')]})
 
-    with open('css_style.css') as file:
-        style = file.read()
-    run_details = run_details_df.to_html(index=False, justify='left')
-    run_details = format_bed_files(run_details, bed_1, bed_2)
-    check_details = check_result_df.to_html(index=False, justify='left')
+    return check_result_df
+
+
+def identity_snp_file(rules, snp_file=None):
+    '''
+    Path to the SNP set of the sample identity check: snp_file if given, otherwise the snps file
+    of the identity section of the panel rules (relative to the rules folder) if it names one.
+    '''
+    if rules.identity == None:
+        raise Exception(f'No identity section in {rules.path}! Add one to run the sample identity check.')
+
+    if snp_file == None:
+        if rules.identity.get('snps') == None:
+            raise Exception(f'No SNP set for the sample identity check! Give one with -identity_snps or add snps to the identity section of {rules.path}.')
+        snp_file = os.path.join(os.path.dirname(rules.path), rules.identity['snps'])
+    if not os.path.isfile(snp_file):
+        raise Exception(f'SNP file {snp_file} not found! The sample identity check needs the panel SNP set.')
 
-    report_head = f'<h1>{panel} Quality Report</h1>'
-    run_sub = '<h2>Run details<h2/>'
-    check_sub = '<h2>Checks<h2/>'
-    html = f'<!DOCTYPE html><html><head>{style}</head><body>{report_head}{run_sub}{run_details}{check_sub}{check_details}</body></hml>'
+    return snp_file
 
-    # Add class to PASS/FAIL to colour code
-    html = re.sub(r"<td>PASS</td>",r"<td class='PASS'>PASS</td>", html)
-    html = re.sub(r"<td>FAIL</td>",r"<td class='FAIL'>FAIL</td>", html)
 
+def sample_metrics(res):
+    '''
+    The per-sample values behind the results_excel_check, for the results database:
+        a) PCT_TARGET_BASES_20X from the 'Hyb-QC' tab (inc control)
+        b) %CONT from the 'VerifyBamId' tab (sample name from the 1st column)
+    Only these columns are streamed, and the columns read by the checks are reused from the excel_reader cache.
+    Returns a df with Worksheet, Sample, Metric and Value columns.
+    '''
+    worksheet_name = re.search(r'\d{6}', os.path.basename(res))[0]
+
+    coverage = read_columns(res, 'Hyb-QC', ['Sample', 'PCT_TARGET_BASES_20X'])
+    contamination = read_columns(res, 'VerifyBamId', [0, '%CONT'])
+
+    coverage_df = pd.DataFrame({'Sample': coverage['Sample'], 'Metric': 'PCT_TARGET_BASES_20X',
+                                'Value': coverage['PCT_TARGET_BASES_20X']})
+    contamination_df = pd.DataFrame({'Sample': contamination[0], 'Metric': '%CONT', 'Value': contamination['%CONT']})
+
+    metrics_df = pd.concat([coverage_df, contamination_df], ignore_index=True, sort=False)
+    metrics_df.insert(0, 'Worksheet', worksheet_name)
+
+    return metrics_df
+
+
+def kinship_metrics(kin_xls):
+    '''
+    The kinship value of each sample pair in the kinship.xls file, for the results database.
+    Sample pairs are named ID1/ID2 (or the 1st and 2nd columns if the ID columns are not present).
+    Only these columns are streamed, and the Kinship column read by kinship_check is reused from the excel_reader cache.
+    Returns a df with Worksheet, Sample, Metric and Value columns.
+    '''
+    worksheet_name = re.search(r'\/(\d{6}_\d{6}).king.xlsx.*', kin_xls).group(1)
+
+    try:
+        kinship = read_columns(kin_xls, 'Kinship', ['ID1', 'ID2', 'Kinship'])
+        id_1, id_2 = kinship['ID1'], kinship['ID2']
+    except KeyError:
+        kinship = read_columns(kin_xls, 'Kinship', [0, 1, 'Kinship'])
+        id_1, id_2 = kinship[0], kinship[1]
+
+    return pd.DataFrame({'Worksheet': worksheet_name, 'Sample': [f'{id1}/{id2}' for id1, id2 in zip(id_1, id_2)],
+                         'Metric': 'Kinship', 'Value': kinship['Kinship']})
+
+
+def generate_html_output(check_result_df, run_details_df, panel, profile_df=None):
+    '''
+    Creating a static HTML file to display the results to the Clinical Scientist reviewing the quality check report.
+    The page is written in a single pass by html_report.render_page: the run details (with the BED
+    files of each worksheet as a nested table), the checks and the failing samples of each FAIL result.
+    If a profile_df is given (see qc_profile) it is added as a collapsed Profile table.
+    '''
+    sections = [('Run details', run_details_df), ('Checks', check_result_df.drop(columns=['Failures']))]
+
+    # Table of the samples (or exons) behind each FAIL result
+    failures_df = failures_table(check_result_df)
+    if len(failures_df) != 0:
+        sections.append(('Failing samples', failures_df))
+
+    if profile_df is not None:
+        sections.append(('Profile', profile_df, f'Profile ({len(profile_df)} spans, {profile_df["Wall (s)"].sum():.2f} s)'))
+
+    html = html_report.render_page(f'{panel} Quality Report', sections)
     file_name = "_".join(run_details_df['Worksheet'].values.tolist()) + '_quality_checks.html'
 
     return file_name, html
 
 
-def format_bed_files(run_html, bed_1, bed_2):
+def failures_table(check_result_df):
     '''
-    Adding the bed file html table to the run html table. The bed file information is passed as 
-    a list for each worksheet in the pair. [ws_1_html, search_term]. The html contains bed file
-    information for the worksheet e.g. target bed, refined bed and coverage bed... This is then
-    substituted into the html by searching for the ws search term e.g. 000001_bed_files.
+    One row (Worksheet, Check, Sample / exon, Value) for each failing sample in the Failures column.
     '''
+    rows = [{'Worksheet': check.Worksheet, 'Check': check.Check, 'Sample / exon': failure['Sample'], 'Value': failure['Value']}
+            for check in check_result_df.itertuples(index=False) for failure in check.Failures]
 
-    bed_1_html = bed_1[0]
-    bed_1_search = bed_1[1]
-    bed_2_html = bed_2[0]
-    bed_2_search = bed_2[1]
-    run_html = re.sub(f'{bed_1_search}', f'{bed_1_html}', run_html)
-    run_html = re.sub(f'{bed_2_search}', f'{bed_2_html}', run_html)
+    return pd.DataFrame(rows, columns=['Worksheet', 'Check', 'Sample / exon', 'Value'])
 
-    # rename dataframe bed_table to bed_table... css classes cannot have spaces
-    run_html = re.sub('<td><table border="1" class="dataframe bed_table">', '<td><table border="1" class="bed_table">', run_html)
 
-    return run_html
+def generate_jsonl_output(check_result_df, ws_1_name, ws_2_name):
+    '''
+    A machine readable copy of the check results: one JSON record per line for each check,
+    keyed by the pair, worksheet and check name. ws_role records whether the worksheet is the
+    1st (ws_1) or 2nd (ws_2) worksheet of the pair, or the pair itself (kinship check).
+    failures lists the failing samples (or exons) and their values.
+    '''
+    pair = '_'.join(sorted([ws_1_name, ws_2_name]))
+    roles = {ws_1_name: 'ws_1', ws_2_name: 'ws_2', pair: 'pair'}
+
+    records = []
+    for check in check_result_df.itertuples(index=False):
+        records.append(json.dumps({'pair': pair, 'ws_1': ws_1_name, 'ws_2': ws_2_name,
+                                   'worksheet': check.Worksheet, 'ws_role': roles.get(check.Worksheet),
+                                   'check': check.Check, 'result': check.Result, 'cached': check.Cached == 'Yes',
+                                   'failures': check.Failures}))
+
+    file_name = f'{pair}_quality_checks.jsonl'
+
+    return file_name, '\n'.join(records) + '\n'
+
+
+def coverage_bed_path(xls_rep, bed_dir=None):
+    '''
+    Path of the coverage BED (coverage_regions in the 'config_parameters' tab of an excel report).
+    If bed_dir is given the BED file is looked up by name in bed_dir instead.
+    '''
+    config_df = read_sheet(xls_rep, 'config_parameters', ['key', 'variable'])
+    coverage_bed = str(config_df[config_df['key']=='coverage_regions']['variable'].values[0])
+
+    if bed_dir != None:
+        return os.path.join(bed_dir, coverage_bed.split('/')[-1])
+
+    return coverage_bed
+
 
 def run_details(cmd,xls_rep,run_details_df):
     '''
     Collect the following run details from the commandline_usage_logfile and excel report
-        1) CMD log file- Worksheet number and experiment name
+        1) CMD log file- Worksheet number, experiment name and pipeline arguments (see command_log.parse_command_log)
         2) excel report- Worksheet number, AB threshold, pipeline version and BED files
     Add run details to run details_df
+    The Bed files column holds the target, refined and coverage BED file names of the worksheet.
+    Returns the run_details_df and the pipeline command (a dict of the command_log.CommandLog
+    fields), which is cached with the run details.
     '''
-    bed_files = []
-    bed_df = pd.DataFrame(columns=['Target bed', 'Refined bed', 'Coverage bed'])
-
     # get ws names for the cmd file and
     cmd_ws = re.search(r'(\d{6})\.commandline_usage_logfile', cmd)
     xls_ws = re.search(r'(\d{6})-\d{2}-D\d{2}-\d{5}-\w{2,3}-\w+-\d{3}_S\d+\.v\d\.\d\.\d-results\.xlsx', xls_rep)
@@ -350,97 +421,282 @@ def run_details(cmd,xls_rep,run_details_df):
 
     worksheet = cmd_ws
 
-    # get experiment name from command output
-    with open(cmd, 'r') as file:
-        cmd_text = file.read()
-    search_term = r'-s\s\n\/network\/sequenced\/MiSeq_data\/\w{4,7}\/(shire_worksheet_numbered|Validation)\/(?:200000-299999\/)?(?:300000-399999\/)?' + re.escape(worksheet) + r'\/(\d{6}_M\d{5}_\d{4}_\d{9}-\w{5})\/SampleSheet.csv'
-
-    experiment_name = re.search(search_term, cmd_text).group(2)
-    
-    if experiment_name == None:
-        raise Exception('The experiment name is not present! check regex pattern.')
+    # get experiment name and pipeline arguments from the command log
+    command = command_log.parse_command_log(cmd, worksheet)
+    experiment_name = command.experiment_name
 
     # get pipeline version, bed file names and AB threshold
-    xls = pd.ExcelFile(xls_rep)
-    config_df = pd.read_excel(xls, 'config_parameters')
+    config_df = read_sheet(xls_rep, 'config_parameters', ['key', 'variable'])
     allele_balance = config_df[config_df['key']=='AB_threshold']['variable'].values[0]
     pipe_version = config_df[config_df['key']=='pipeline version']['variable'].values[0]
     target_bed = config_df[config_df['key']=='target_regions']['variable'].values[0].split('/')[-1]
     refined_target_bed = config_df[config_df['key']=='refined_target_regions']['variable'].values[0].split('/')[-1]
     coverage_bed = config_df[config_df['key']=='coverage_regions']['variable'].values[0].split('/')[-1]
 
-    bed_file_table = f'{worksheet}_bed_files'
+    bed_files = {'Target bed': target_bed, 'Refined bed': refined_target_bed, 'Coverage bed': coverage_bed}
+
+    run_details_df = qc_rules.add_row(run_details_df, {'Worksheet': worksheet,
+                                                       'Pipeline version': pipe_version,
+                                                       'Experiment name': experiment_name,
+                                                       'Bed files': bed_files,
+                                                       'AB threshold': allele_balance
+                                                       })
 
-    bed_df = bed_df.append({
-        'Target bed': target_bed,
-        'Refined bed': refined_target_bed,
-        'Coverage bed': coverage_bed
-        }, ignore_index=True)
+    return run_details_df, command._asdict()
 
-    bed_df = bed_df.transpose()
-    bed_html = bed_df.to_html(justify='left', header=None, escape=True, classes='bed_table', border=0)
 
-    bed = [bed_html, bed_file_table]
+def run_tasks(tasks, workers=1, pool='thread'):
+    '''
+    Run a list of independent (function, args) tasks and return their results in task order.
+    With workers=1 the tasks are run one after another in this process. Otherwise they are
+    submitted to a thread or process pool of the given size, so the checks overlap their
+    network file I/O and excel parsing. Results are always returned in the order the tasks
+    were given so the merged check_result_df/run_details_df are stable between runs.
+    '''
+    if workers <= 1:
+        return [func(*func_args) for func, func_args in tasks]
 
-    with open('bed_test.html', 'w') as file:
-        file.write(bed_html)
-    # bed_files = ", ".join(bed_files)
+    executor = ThreadPoolExecutor if pool == 'thread' else ProcessPoolExecutor
+    with executor(max_workers=workers) as ex:
+        futures = [ex.submit(func, *func_args) for func, func_args in tasks]
+        return [future.result() for future in futures]
 
 
-    run_details_df = run_details_df.append({'Worksheet': worksheet,
-                                            'Pipeline version': pipe_version,
-                                            'Experiment name': experiment_name,
-                                            'Bed files': bed_file_table,
-                                            'AB threshold': allele_balance
-                                            }, ignore_index=True)
+def run_cached_task(func, func_args, input_paths, use_cache=True, thresholds=()):
+    '''
+    Run func(*func_args), reusing a cached result if the function, its thresholds (the key of
+    the panel rules for checks) and the contents of its input files are unchanged since the
+    result was cached (see qc_cache.result_key).
+    Returns the result and whether it came from the cache.
+    '''
+    if not use_cache:
+        return func(*func_args), False
 
-    return run_details_df, bed
+    key = qc_cache.result_key(func, thresholds, input_paths)
+    result = qc_cache.load_result(key)
+    # results are dataframes, so compare by identity
+    if result is not None:
+        return result, True
 
+    result = func(*func_args)
+    qc_cache.store_result(key, result)
 
-xls_rep_1, xls_rep_2, neg_rep, fastq_bam_1, fastq_bam_2, kin_xls, vcf_dir_1, vcf_dir_2, cmd_log_1, cmd_log_2, panel = get_inputs(args.ws_1, args.ws_2)
+    return result, False
 
-pd.set_option('display.max_colwidth', -1)
-check_result_df = pd.DataFrame(columns=[ 'Worksheet','Check', 'Description','Result'])
-run_details_df = pd.DataFrame(columns=['Worksheet', 'Pipeline version', 'Experiment name', 'Bed files', 'AB threshold'])
 
-# ws_1 checks
-check_result_df = results_excel_check(xls_rep_1, check_result_df)
-check_result_df = vcf_dir_check(vcf_dir_1, check_result_df)
-check_result_df = fastq_bam_check(fastq_bam_1, check_result_df)
+def run_pair(ws_1, ws_2, out_dir=None, workers=1, pool='thread', use_cache=True, db=None, rules=None,
+             deep_vcf=False, vcf_records=False, recount_fastqs=False, fastq_dirs=None, bed_dir=None,
+             identity=False, identity_snps=None, profile=False, prefetch_workers=8):
+    '''
+    Run all quality checks for a pair of TSHC output folders and write the HTML report (to out_dir,
+    or to both TSHC output folders). The options match the quality_check.py arguments (see README);
+    db None skips the results database and rules overrides the panel rules with a compiled RuleSet.
+    Parsed workbooks and prefetched files are released once the pair is done, even on an error.
+    Returns the check_result_df and run_details_df for the pair.
+    '''
+    try:
+        return _run_pair(ws_1, ws_2, out_dir, workers, pool, use_cache, db, rules, deep_vcf, vcf_records, recount_fastqs,
+                         fastq_dirs, bed_dir, identity, identity_snps, profile, prefetch_workers)
+    finally:
+        clear_cache()
+        qc_prefetch.clear()
 
 
-# ws_2 checks
-check_result_df = results_excel_check(xls_rep_2, check_result_df)
-check_result_df = vcf_dir_check(vcf_dir_2, check_result_df)
-check_result_df = fastq_bam_check(fastq_bam_2, check_result_df)
+def _run_pair(ws_1, ws_2, out_dir, workers, pool, use_cache, db, rules, deep_vcf, vcf_records, recount_fastqs,
+              fastq_dirs, bed_dir, identity, identity_snps, profile, prefetch_workers):
+    '''
+    The checks and reports of run_pair, which releases the workbooks and prefetched files afterwards.
+    '''
+    start = time.perf_counter()
+    spans = []
+    if profile:
+        inputs, span = qc_profile.profile_task('get_inputs', get_inputs, (ws_1, ws_2, use_cache))
+        spans.append(span)
+    else:
+        inputs = get_inputs(ws_1, ws_2, use_cache)
+    xls_rep_1, xls_rep_2, neg_rep, fastq_bam_1, fastq_bam_2, kin_xls, vcf_dir_1, vcf_dir_2, cmd_log_1, cmd_log_2, panel = inputs
+
+    if rules == None:
+        rules = qc_rules.load_rules(panel)
+    if identity:
+        identity_snps = identity_snp_file(rules, identity_snps)
+
+    # coverage BED of the worksheet with the negative sample, cached so a cached run parses no workbooks
+    neg_xls_rep = xls_rep_1 if os.path.dirname(neg_rep) == os.path.dirname(xls_rep_1) else xls_rep_2
+    coverage_bed, cached = run_cached_task(coverage_bed_path, (neg_xls_rep, bed_dir), [neg_xls_rep], use_cache, (bed_dir,))
+    neg_inputs = [neg_rep, coverage_bed] if os.path.isfile(coverage_bed) else [neg_rep]
+
+    check_result_df = pd.DataFrame(columns=[ 'Worksheet','Check', 'Description','Result', 'Cached', 'Failures'])
+    run_details_df = pd.DataFrame(columns=['Worksheet', 'Pipeline version', 'Experiment name', 'Bed files', 'AB threshold'])
+
+    # each check adds its results to an empty df so the checks are independent tasks
+    # (function, args, input files)
+    check_tasks = [
+        # ws_1 checks
+        (results_excel_check, (xls_rep_1, rules, check_result_df), [xls_rep_1]),
+        (vcf_dir_check, (vcf_dir_1, rules, check_result_df), [vcf_dir_1]),
+        (fastq_bam_check, (fastq_bam_1, rules, check_result_df), [fastq_bam_1]),
+        # ws_2 checks
+        (results_excel_check, (xls_rep_2, rules, check_result_df), [xls_rep_2]),
+        (vcf_dir_check, (vcf_dir_2, rules, check_result_df), [vcf_dir_2]),
+        (fastq_bam_check, (fastq_bam_2, rules, check_result_df), [fastq_bam_2]),
+        # pair checks
+        (neg_excel_check, (neg_rep, coverage_bed, rules, check_result_df), neg_inputs),
+        (kinship_check, (kin_xls, rules, check_result_df), [kin_xls]),
+    ]
+    if deep_vcf or vcf_records:
+        check_tasks += [
+            (vcf_integrity_check, (vcf_dir_1, vcf_records, check_result_df), [vcf_dir_1]),
+            (vcf_integrity_check, (vcf_dir_2, vcf_records, check_result_df), [vcf_dir_2]),
+        ]
+    if recount_fastqs:
+        fastq_dir_1, fastq_dir_2 = fastq_dirs if fastq_dirs != None else (ws_1, ws_2)
+        check_tasks += [
+            (fastq_recount_check, (fastq_bam_1, fastq_dir_1, check_result_df), [fastq_bam_1]),
+            (fastq_recount_check, (fastq_bam_2, fastq_dir_2, check_result_df), [fastq_bam_2]),
+        ]
+    if identity:
+        check_tasks += [
+            (sample_identity_check, (vcf_dir_1, vcf_dir_2, rules.identity, identity_snps, check_result_df), [vcf_dir_1, vcf_dir_2, identity_snps]),
+        ]
+    details_tasks = [
+        (run_details, (cmd_log_1, xls_rep_1, run_details_df), [cmd_log_1, xls_rep_1]),
+        (run_details, (cmd_log_2, xls_rep_2, run_details_df), [cmd_log_2, xls_rep_2]),
+    ]
+
+    # per-sample metrics are only collected for the results database
+    metric_tasks = []
+    if db != None:
+        metric_tasks = [
+            (sample_metrics, (xls_rep_1,), [xls_rep_1]),
+            (sample_metrics, (xls_rep_2,), [xls_rep_2]),
+            (kinship_metrics, (kin_xls,), [kin_xls]),
+        ]
+
+    # check results are only reused while the panel rules are unchanged
+    # (function, args, input files, use cache, thresholds) as taken by run_cached_task
+    cached_tasks = [(func, func_args, input_paths, use_cache and func not in (vcf_integrity_check, fastq_recount_check, sample_identity_check), (rules.key,))
+                    for func, func_args, input_paths in check_tasks]
+    cached_tasks += [(func, func_args, input_paths, use_cache, ()) for func, func_args, input_paths in details_tasks + metric_tasks]
+    tasks = [(run_cached_task, cached_task) for cached_task in cached_tasks]
+
+    # read the input files of the tasks without a cached result into memory at once, so a cached
+    # run reads none of them (the vcfs folders were listed by get_inputs, see qc_cache.build_manifest)
+    if prefetch_workers > 0:
+        prefetch_inputs = {xls_rep_1, xls_rep_2, neg_rep, fastq_bam_1, fastq_bam_2, kin_xls, cmd_log_1, cmd_log_2}
+        prefetch_paths = [path for func, func_args, input_paths, task_use_cache, thresholds in cached_tasks
+                          if not (task_use_cache and qc_cache.has_result(func, thresholds, input_paths))
+                          for path in input_paths if path in prefetch_inputs]
+        if profile:
+            result, span = qc_profile.profile_task('prefetch', qc_prefetch.prefetch, (prefetch_paths, prefetch_workers), prefetch_paths)
+            spans.append(span)
+        else:
+            qc_prefetch.prefetch(prefetch_paths, prefetch_workers)
+
+    if profile:
+        # each task returns its result and its span
+        task_inputs = [input_paths for func, func_args, input_paths in check_tasks + details_tasks + metric_tasks]
+        tasks = [(qc_profile.profile_task, (qc_profile.task_name(task_args[0], input_paths), func, task_args, input_paths))
+                 for (func, task_args), input_paths in zip(tasks, task_inputs)]
+        task_results = []
+        for (result, cached), span in run_tasks(tasks, workers, pool):
+            span['Cached'] = cached
+            spans.append(span)
+            task_results.append((result, cached))
+    else:
+        task_results = run_tasks(tasks, workers, pool)
+    check_results = [result.assign(Cached='Yes' if cached else 'No') for result, cached in task_results[:len(check_tasks)]]
+    (details_1, command_1), (details_2, command_2) = [result for result, cached in task_results[len(check_tasks):len(check_tasks) + len(details_tasks)]]
+    metric_results = [result for result, cached in task_results[len(check_tasks) + len(details_tasks):]]
+
+    num_cached = sum(cached for result, cached in task_results)
+    if num_cached:
+        print(f'{num_cached} of {len(task_results)} results loaded from the result cache')
+
+    # merge task results in task order
+    check_result_df = pd.concat([check_result_df] + check_results, ignore_index=True, sort=False)
+    run_details_df = pd.concat([run_details_df, details_1, details_2], ignore_index=True, sort=False)
+
+    # sort
+    check_result_df = check_result_df.sort_values(by=['Worksheet'])
+    run_details_df = run_details_df.sort_values(by=['Worksheet'])
+
+    if db != None:
+        beds = {row['Worksheet']: row['Bed files'] for row in run_details_df.to_dict('records')}
+        commands = {details_1['Worksheet'].values[0]: command_1, details_2['Worksheet'].values[0]: command_2}
+        metrics_df = pd.concat(metric_results, ignore_index=True, sort=False)
+        qc_store.write_run(db, panel, check_result_df, run_details_df, beds, metrics_df, commands)
+
+    #create static html output and the machine readable results
+    if profile:
+        # the report includes every span except its own, which is only in the JSON
+        (name, html_output), span = qc_profile.profile_task('generate_html_output', generate_html_output,
+                                                            (check_result_df, run_details_df, panel, qc_profile.profile_table(spans)))
+        spans.append(span)
+    else:
+        name, html_output = generate_html_output(check_result_df, run_details_df, panel)
+    jsonl_name, jsonl_report = generate_jsonl_output(check_result_df, details_1['Worksheet'].values[0], details_2['Worksheet'].values[0])
+    # workbooks parsed in a process pool are counted in the worker processes
+    if workers <= 1 or pool == 'thread':
+        print(parse_summary())
+    if prefetch_workers > 0:
+        print(qc_prefetch.prefetch_summary())
+
+    # write html report and results to both results directories
+    if out_dir == None:
+        report_dirs = [ws_1, ws_2]
+    else:
+        print(f'Saving html reports to {out_dir}')
+        report_dirs = [out_dir]
 
-# pair checks
-check_result_df = neg_excel_check(neg_rep, check_result_df)
-check_result_df = kinship_check(kin_xls, check_result_df)
+    for report_dir in report_dirs:
+        with open(os.path.join(report_dir, name), 'w') as file:
+            file.write(html_output)
+        with open(os.path.join(report_dir, jsonl_name), 'w') as file:
+            file.write(jsonl_report)
 
-# run details
-run_details_df, bed_1 = run_details(cmd_log_1, xls_rep_1, run_details_df)
-run_details_df, bed_2 = run_details(cmd_log_2, xls_rep_2, run_details_df)
+    if profile:
+        pair = jsonl_name.replace('_quality_checks.jsonl', '')
+        print(qc_profile.profile_table(spans).drop(columns=['Files']).to_string(index=False))
+        for report_dir in report_dirs:
+            with open(os.path.join(report_dir, f'{pair}_profile.json'), 'w') as file:
+                file.write(qc_profile.profile_json(pair, spans, time.perf_counter() - start))
 
-# sort
-check_result_df = check_result_df.sort_values(by=['Worksheet'])
-run_details_df = run_details_df.sort_values(by=['Worksheet'])
-#create static html output
-name, html_report = generate_html_output(check_result_df,run_details_df, panel, bed_1, bed_2)
+    return check_result_df, run_details_df
 
-# write html report to both results directories
-ws_1_out = args.ws_1
-ws_2_out = args.ws_2
 
-if args.out_dir == None:
-    os.chdir(ws_1_out)
-    with open(name, 'w') as file:
-        file.write(html_report)
-    os.chdir(ws_2_out)
-    with open(name, 'w') as file:
-        file.write(html_report)
-else:
-    print(f'Saving html reports to {args.out_dir}')
-    os.chdir(args.out_dir)
-    with open(name, 'w') as file:
-        file.write(html_report)
\ No newline at end of file
+def main(argv=None):
+    '''
+    Command line entry point. Parses the arguments (sys.argv by default) and runs the checks for one pair.
+    '''
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-ws_1', action='store', required=True, help='Path to worksheet 1 output files include TSHC_<ws>_version dir')
+    parser.add_argument('-ws_2', action='store', required=True, help='Path to worksheet 2 output files include TSHC_<ws>_version dir')
+    parser.add_argument('-out_dir', action='store', nargs='?', help='Specifing an output directory to store html reports')
+    parser.add_argument('-workers', action='store', type=int, default=1, help='Number of checks to run concurrently (default 1, run checks one after another)')
+    parser.add_argument('-pool', action='store', choices=['thread', 'process'], default='thread', help='Pool used when -workers > 1')
+    parser.add_argument('-no_cache', '--no-cache', action='store_true', dest='no_cache', help='Re-run every check and re-list the TSHC folders instead of using cached results')
+    parser.add_argument('-deep_vcf', action='store_true', help='Also check each VCF is complete (tail and header only)')
+    parser.add_argument('-vcf_records', action='store_true', help='Count the records of each VCF in the VCF integrity check (implies -deep_vcf, reads every VCF)')
+    parser.add_argument('-fastq_recount', action='store_true', help='Recount the reads in the FASTQs of each worksheet and compare them with the fastq-bam-check report')
+    parser.add_argument('-fastq_dir_1', action='store', help='Folder containing the FASTQs of worksheet 1 (default the ws_1 folder)')
+    parser.add_argument('-fastq_dir_2', action='store', help='Folder containing the FASTQs of worksheet 2 (default the ws_2 folder)')
+    parser.add_argument('-identity', action='store_true', help='Check the samples against earlier worksheets for sample swaps using the panel SNP set')
+    parser.add_argument('-identity_snps', action='store', help='SNP set of the sample identity check (default the snps file in the panel rules, if any)')
+    parser.add_argument('-bed_dir', action='store', help='Folder containing the coverage BED files (default the path in the excel report)')
+    parser.add_argument('-prefetch', action='store', type=int, default=8, help='Number of input files of checks without a cached result read into memory at once before the checks run (default 8, 0 to read each file when its check runs)')
+    parser.add_argument('-profile', '--profile', action='store_true', dest='profile', help='Time each step and add the timings to the report and <pair>_profile.json')
+    parser.add_argument('-db', action='store', default=DEFAULT_DB, help=f'Results database to add the results to (default {DEFAULT_DB})')
+    parser.add_argument('-no_db', action='store_true', help='Do not add the results to the results database')
+    args = parser.parse_args(argv)
+
+    db = None if args.no_db else args.db
+    run_pair(args.ws_1, args.ws_2, args.out_dir, args.workers, args.pool, not args.no_cache, db,
+             deep_vcf=args.deep_vcf, vcf_records=args.vcf_records, recount_fastqs=args.fastq_recount,
+             fastq_dirs=(args.fastq_dir_1 or args.ws_1, args.fastq_dir_2 or args.ws_2), bed_dir=args.bed_dir,
+             identity=args.identity, identity_snps=args.identity_snps, profile=args.profile,
+             prefetch_workers=args.prefetch)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,268 @@
+import os
+import re
+import gzip
+import fcntl
+import hashlib
+import argparse
+import numpy as np
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+import qc_cache
+
+
+# number of set bits in each byte value, used to count bits of the packed genotypes
+POPCOUNT = np.array([bin(value).count('1') for value in range(256)], dtype=np.uint16)
+# DNA number of a sample e.g. 000001-01-D19-10001-AB-TSHC-001 -> D19-10001
+DNA_NUMBER = re.compile(r'D\d{2}-\d{5}')
+# bytes of packed genotypes compared in one block (bounds the memory used by the comparison)
+BLOCK_BYTES = 64 * 1024 * 1024
+
+
+def load_snps(path):
+    '''
+    Read the fixed SNP set (tab separated chromosome and position, 1-based, further columns ignored).
+    Returns a dict of (chromosome without chr prefix, position) -> column in the genotype matrix
+    and the sha1 of the SNP file, which names the genotype store of this SNP set.
+    '''
+    with open(path, 'rb') as file:
+        text = file.read()
+
+    snps = {}
+    for line in text.decode().splitlines():
+        fields = line.split('\t')
+        if line.startswith('#') or len(fields) < 2 or not fields[1].strip().isdigit():
+            continue
+        snps.setdefault((re.sub(r'^chr', '', fields[0]), int(fields[1])), len(snps))
+
+    if len(snps) == 0:
+        raise Exception(f'No SNPs in {path}! Expected tab separated chromosome and position columns.')
+
+    return snps, hashlib.sha1(text).hexdigest()
+
+
+def sample_genotypes(vcf, snps):
+    '''
+    Genotype of a single sample VCF at each SNP: the number of alt alleles (0, 1 or 2) or -1 for a
+    no call (./.). SNPs without a record in the VCF are taken as homozygous reference, as the VCFs
+    only list variant sites, but a SNP is only compared where one of the samples has an alt allele
+    (see concordance). The VCF is streamed and only records at a SNP are split into fields.
+    '''
+    genotypes = np.zeros(len(snps), dtype=np.int8)
+
+    with open(vcf, 'rb') as file:
+        gzipped = file.read(2) == b'\x1f\x8b'
+
+    with (gzip.open(vcf, 'rt') if gzipped else open(vcf, 'r')) as file:
+        for line in file:
+            if line.startswith('#'):
+                continue
+            chrom, pos, rest = line.split('\t', 2)
+            column = snps.get((chrom[3:] if chrom.startswith('chr') else chrom, int(pos)))
+            if column == None:
+                continue
+
+            fields = rest.rstrip('\n').split('\t')
+            if len(fields) < 8:
+                continue
+            gt = dict(zip(fields[6].split(':'), fields[7].split(':'))).get('GT', '.')
+            alleles = re.split(r'[/|]', gt)
+            if '.' in alleles:
+                genotypes[column] = -1
+            else:
+                genotypes[column] = min(sum(allele != '0' for allele in alleles), 2)
+
+    return genotypes
+
+
+def pack_genotypes(genotypes):
+    '''
+    Pack a (samples, SNPs) genotype matrix into 3 bit-planes per sample: called, >= 1 alt allele
+    and 2 alt alleles. Returns a uint8 array of shape (samples, 3, ceil(SNPs / 8)).
+    '''
+    genotypes = np.asarray(genotypes)
+    planes = np.stack([genotypes >= 0, genotypes >= 1, genotypes == 2], axis=1)
+
+    return np.packbits(planes, axis=2)
+
+
+def concordance(new, history, block_bytes=BLOCK_BYTES):
+    '''
+    Pairwise genotype concordance of each new sample against each historical sample, using the
+    packed bit-planes. For each pair the informative SNPs are counted: SNPs called in both samples
+    where at least one of them has an alt allele. A SNP without a record in either VCF is no
+    evidence of identity (it may be outside the sequenced regions), so samples with no variants
+    at the SNP set are not compared. A SNP is discordant if either alt bit differs. The historical
+    samples are compared in blocks with numpy broadcasting, so no per-sample python loop is needed.
+    Returns the concordance (n_new, n_history) and the number of informative SNPs.
+    '''
+    concordant = np.zeros((len(new), len(history)), dtype=np.float32)
+    sites = np.zeros((len(new), len(history)), dtype=np.int32)
+    block_size = max(1, block_bytes // max(1, new[:, 0, :].size))
+
+    for start in range(0, len(history), block_size):
+        block = np.asarray(history[start:start + block_size])
+        informative = new[:, None, 0, :] & block[None, :, 0, :] & (new[:, None, 1, :] | block[None, :, 1, :])
+        differ = ((new[:, None, 1, :] ^ block[None, :, 1, :]) | (new[:, None, 2, :] ^ block[None, :, 2, :])) & informative
+
+        both = POPCOUNT[informative].sum(axis=2)
+        mismatches = POPCOUNT[differ].sum(axis=2)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            concordant[:, start:start + block_size] = np.where(both > 0, 1 - mismatches / both, np.nan)
+        sites[:, start:start + block_size] = both
+
+    return concordant, sites
+
+
+def store_dir(snp_sha1):
+    '''
+    Folder of the genotype store of a SNP set: identity/<sha1 of the SNP file> in the cache folder.
+    It holds genotypes.bin (packed rows appended for each sample) and samples.tsv (worksheet and
+    sample of each row, in the same order).
+    '''
+    return os.path.join(qc_cache.CACHE_DIR, 'identity', snp_sha1)
+
+
+def read_store(path, num_snps):
+    '''
+    The samples (Worksheet, Sample) and packed genotypes of a genotype store. The genotypes are
+    memory-mapped, so only the rows compared are read from disk.
+    '''
+    row_shape = (3, (num_snps + 7) // 8)
+    try:
+        samples_df = pd.read_csv(os.path.join(path, 'samples.tsv'), sep='\t', names=['Worksheet', 'Sample'], dtype=str)
+    except (FileNotFoundError, pd.errors.EmptyDataError):
+        return pd.DataFrame(columns=['Worksheet', 'Sample']), np.zeros((0,) + row_shape, dtype=np.uint8)
+
+    # only the rows listed in samples.tsv, a writer may be appending the next rows
+    genotypes = np.memmap(os.path.join(path, 'genotypes.bin'), dtype=np.uint8, mode='r',
+                          shape=(len(samples_df),) + row_shape)
+
+    return samples_df, genotypes
+
+
+def append_store(path, worksheet, samples, packed):
+    '''
+    Add the packed genotypes of a worksheet's samples to a genotype store. Worksheets already in
+    the store are not added again. The store is locked while rows are appended so batch workers
+    can add worksheets at the same time.
+    '''
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, 'store.lock'), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+
+        samples_file = os.path.join(path, 'samples.tsv')
+        if os.path.exists(samples_file):
+            with open(samples_file) as file:
+                if any(line.split('\t')[0] == worksheet for line in file):
+                    return False
+
+        with open(os.path.join(path, 'genotypes.bin'), 'ab') as file:
+            file.write(np.ascontiguousarray(packed, dtype=np.uint8).tobytes())
+        with open(samples_file, 'a') as file:
+            file.writelines(f'{worksheet}\t{sample}\n' for sample in samples)
+
+    return True
+
+
+def vcf_sample(vcf):
+    '''
+    Sample name of a VCF file e.g. 000001-01-D19-10001-AB-TSHC-001.vcf.gz -> 000001-01-D19-10001-AB-TSHC-001
+    '''
+    return re.sub(r'(\.(vcf|gz|bgz))+$', '', os.path.basename(vcf))
+
+
+def identity_matches(new_df, new_packed, history_df, history_packed, min_concordance=0.9, min_sites=20):
+    '''
+    Compare the new samples with the historical samples and each other and return the identity problems:
+        1) a sample matching (concordance >= min_concordance) a sample with a different DNA number
+           (possible swap or duplicate sample)
+        2) a sample not matching an earlier sample with the same DNA number (possible swap)
+    Only pairs with at least min_sites informative SNPs (see concordance) are compared, and only
+    samples with a DNA number in their name.
+    Returns a df of Sample, Other sample, Other worksheet, Concordance, Sites and Problem.
+    '''
+    compare_df = pd.concat([history_df, new_df], ignore_index=True, sort=False)
+    compare_packed = np.concatenate([np.asarray(history_packed), new_packed])
+    concordant, sites = concordance(new_packed, compare_packed)
+
+    # DNA numbers as integer codes (-1 if the sample name has no DNA number)
+    dna_codes = pd.factorize(compare_df['Sample'].str.extract(f'({DNA_NUMBER.pattern})', expand=False))[0]
+    new_codes = dna_codes[len(history_df):]
+    both_dna = (new_codes[:, None] >= 0) & (dna_codes[None, :] >= 0)
+    same_dna = both_dna & (new_codes[:, None] == dna_codes[None, :])
+
+    # a sample is not compared with itself
+    self_pairs = np.zeros(concordant.shape, dtype=bool)
+    self_pairs[np.arange(len(new_df)), len(history_df) + np.arange(len(new_df))] = True
+
+    compared = (sites >= min_sites) & ~self_pairs
+    with np.errstate(invalid='ignore'):
+        matched = concordant >= min_concordance
+    problems = {
+        'Matches a different DNA number': compared & matched & both_dna & ~same_dna,
+        'Does not match the same DNA number': compared & ~matched & same_dna,
+    }
+
+    rows = []
+    for problem, mask in problems.items():
+        for new, other in zip(*np.nonzero(mask)):
+            # report each pair of new samples once
+            if other >= len(history_df) and other - len(history_df) < new:
+                continue
+            rows.append({'Sample': new_df['Sample'].values[new], 'Other sample': compare_df['Sample'].values[other],
+                         'Other worksheet': compare_df['Worksheet'].values[other],
+                         'Concordance': round(float(concordant[new, other]), 3), 'Sites': int(sites[new, other]),
+                         'Problem': problem})
+
+    return pd.DataFrame(rows, columns=['Sample', 'Other sample', 'Other worksheet', 'Concordance', 'Sites', 'Problem'])
+
+
+def check_identity(worksheet_vcfs, snp_file, last_worksheets=200, min_concordance=0.9, min_sites=20, exclude=None, workers=16):
+    '''
+    Genotype the SNP set in each sample VCF of the given worksheets ({worksheet: [vcf paths]}),
+    compare them with the samples of the last_worksheets worksheets in the genotype store and with
+    each other (see identity_matches), then add the new worksheets to the store.
+    Samples with exclude in their name (e.g. the D00-00000 negative control) are skipped.
+    Returns the identity problems df and the number of historical samples compared.
+    '''
+    snps, snp_sha1 = load_snps(snp_file)
+    path = store_dir(snp_sha1)
+
+    new_rows = [(worksheet, vcf) for worksheet, vcfs in worksheet_vcfs.items() for vcf in vcfs
+                if vcf.endswith(('.vcf', '.vcf.gz')) and (exclude == None or exclude not in vcf_sample(vcf))]
+    new_df = pd.DataFrame({'Worksheet': [worksheet for worksheet, vcf in new_rows],
+                           'Sample': [vcf_sample(vcf) for worksheet, vcf in new_rows]})
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        genotypes = list(ex.map(lambda row: sample_genotypes(row[1], snps), new_rows))
+    new_packed = pack_genotypes(np.array(genotypes, dtype=np.int8).reshape(len(new_rows), len(snps)))
+
+    # samples of the last worksheets added to the store, excluding a re-run of these worksheets
+    store_df, store_packed = read_store(path, len(snps))
+    earlier = ~store_df['Worksheet'].isin(list(worksheet_vcfs)).values
+    recent = list(dict.fromkeys(store_df['Worksheet'].values[earlier][::-1]))[:last_worksheets]
+    history_rows = np.flatnonzero(earlier & store_df['Worksheet'].isin(recent).values)
+    history_df = store_df.iloc[history_rows].reset_index(drop=True)
+    history_packed = store_packed[history_rows]
+
+    matches_df = identity_matches(new_df, new_packed, history_df, history_packed, min_concordance, min_sites)
+
+    for worksheet in worksheet_vcfs:
+        rows = (new_df['Worksheet'] == worksheet).values
+        append_store(path, worksheet, new_df['Sample'].values[rows], new_packed[rows])
+
+    return matches_df, len(history_df)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Check the samples of a worksheet against earlier worksheets using a fixed SNP set')
+    parser.add_argument('-vcf_dir', action='store', required=True, help='Path to a vcfs_<panel>_<ws> folder')
+    parser.add_argument('-worksheet', action='store', required=True, help='Worksheet number')
+    parser.add_argument('-snps', action='store', required=True, help='Tab separated file of the SNP set (chromosome, position)')
+    parser.add_argument('-last', action='store', type=int, default=200, help='Number of earlier worksheets to compare with (default 200)')
+    parser.add_argument('-exclude', action='store', default='D00-00000', help='Skip samples with this in their name (default D00-00000)')
+    args = parser.parse_args()
+
+    vcfs = sorted(os.path.join(args.vcf_dir, name) for name in os.listdir(args.vcf_dir))
+    matches_df, num_history = check_identity({args.worksheet: vcfs}, args.snps, args.last, exclude=args.exclude)
+    print(f'Compared with {num_history} samples')
+    print(matches_df.to_string(index=False))
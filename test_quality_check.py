@@ -1,18 +1,30 @@
 import os
 import argparse
 import pandas as pd
-import re
+import io
+import traceback
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
 from natsort import natsorted
-
-parser = argparse.ArgumentParser()
-parser.add_argument('-ws_dir', action='store', required=True)
-parser.add_argument('-out_dir', action='store', required=True)
-parser.add_argument('-pairing', action='store', required=True)
-args = parser.parse_args()
-
-pair_xls = args.pairing
-ws_dir = args.ws_dir
-out_dir = args.out_dir
+import quality_check
+import html_report
+
+
+# summary column of each check, in the order of table 1 of the README
+CHECK_COLUMNS = {
+	'ws_1 VerifyBamId check': 'Check 1',
+	'ws_1 20x coverage check': 'Check 2',
+	'ws_1 VCF file count check': 'Check 3',
+	'ws_1 FASTQ-BAM check': 'Check 4',
+	'Number of exons in negative sample': 'Check 5',
+	'Contamination of negative sample': 'Check 6',
+	'Kinship check': 'Check 7',
+	'ws_2 VerifyBamId check': 'Check 8',
+	'ws_2 20x coverage check': 'Check 9',
+	'ws_2 VCF file count check': 'Check 10',
+	'ws_2 FASTQ-BAM check': 'Check 11',
+}
+WORKSHEET_CHECKS = ['VerifyBamId check', '20x coverage check', 'VCF file count check', 'FASTQ-BAM check']
 
 def sort_pairing(inp_xls):
 	'''
@@ -33,7 +45,8 @@ def sort_pairing(inp_xls):
 
 def run_quality_check(ws_1, ws_2, out_dir, base):
 	'''
-	Run command for quality_check.py script including specifying an output directory.
+	Run quality_check.run_pair for a test pair in this process, including specifying an output directory.
+	An error in one test pair is printed and does not stop the remaining pairs.
 	'''
 
 	ws_1_num = ws_1
@@ -44,10 +57,12 @@ def run_quality_check(ws_1, ws_2, out_dir, base):
 	ws_1 = base + f'{ws_1}/' + f'{panel}_{ws_1_num}_{version}/'
 	ws_2 = base + f'{ws_2}/' + f'{panel}_{ws_2_num}_{version}/'
 
-	command = f'python quality_check.py -ws_1 {ws_1} -ws_2 {ws_2} -out_dir {out_dir}'
-
-	print(command)
-	os.system(command)
+	print(f'Running quality checks for -ws_1 {ws_1} -ws_2 {ws_2} -out_dir {out_dir}')
+	try:
+		quality_check.run_pair(ws_1, ws_2, out_dir)
+	except Exception:
+		traceback.print_exc()
+		return
 
 	print(f'HTML report for worksheets {ws_1_num}_{ws_2_num} is available!')
 
@@ -58,72 +73,74 @@ def generate_html_output(summary_df, style):
 	A summary html file is generated to summarise the PASS/FAIL composition of the test inputs.
 
 	'''
-	heading = '<h1>Test Run Summary<h1/><h3>Results<h3/>'
-	summary_table = summary_df.to_html(index=False, justify='left')
-
-	# Add class to PASS/FAIL to colour code
-	summary_table = re.sub(r"<td>PASS</td>",r"<td class='PASS'>PASS</td>", summary_table)
-	summary_table = re.sub(r"<td>FAIL</td>",r"<td class='FAIL'>FAIL</td>", summary_table)
-
-	html = f'<!DOCTYPE html><html><head>{style}</head><body>{heading}{summary_table}</body></hml>'
+	html = html_report.render_page('Test Run Summary', [('Results', summary_df)], style)
 	file_name = 'test_check_summary.html'
 
 	with open(file_name, 'w') as file:
 		file.write(html)
 
-ws_pairs = sort_pairing(pair_xls)
-worksheet_dirs = os.listdir(ws_dir)
-with open('css_style.css') as file:
-  style = file.read()
-
-
-# Iterate through ws pairs and run_quality_check() for each pair
-for k,v in ws_pairs.items():
-	ws_1 = v[0]
-	ws_2 = v[1]
-
-	if ws_1 in worksheet_dirs and ws_2 in worksheet_dirs:
-		run_quality_check(ws_1, ws_2, out_dir, ws_dir)
-
-
-os.chdir(out_dir)
-file_list = os.listdir()
-file_list = natsorted(file_list)
-
-# create df to store test summary results
-summary_df = pd.DataFrame(columns=['Test case','Worksheet pair','Check 1', 'Check 2', 
-									'Check 3', 'Check 4', 'Check 5','Check 6', 
-									'Check 7', 'Check 8', 'Check 9', 'Check 10',
-									'Check 11'])
-
-test_case = 1
-
-
-# Test cases are all numbered to start with 0000
-for file in file_list:
-	if '0000' not in file:
-		continue
-	with open(file , 'r') as file:
-		html = file.read()
-		html_tables = pd.read_html(file)
-
-		# Gets kinship work sheet pair names
-		pair = html_tables[2][6:7]['Worksheet'].values[0]
-		results =  html_tables[2]['Result'].values.tolist()
-		summary_df = summary_df.append({'Test case': test_case,
-										'Worksheet pair': pair, 
-										'Check 1': results[0],
-										'Check 2': results[1], 
-										'Check 3': results[2],
-										'Check 4': results[3],
-										'Check 5': results[4],
-										'Check 6': results[5], 
-										'Check 7': results[6],
-										'Check 8': results[7],
-										'Check 9': results[8],
-										'Check 10': results[9],
-										'Check 11': results[10]}, ignore_index=True)
-	test_case += 1
-
-# Create a html report summarizing PASS/FAIL composition of test cases
-generate_html_output(summary_df, style)
+def summarise_reports(out_dir, style):
+	'''
+	Collect the PASS/FAIL results from the quality_check.py results file (.jsonl) of each test case
+	in out_dir into summary_df and write the summary html report. The records from all test cases
+	are read in one pass and placed in the summary columns by worksheet role and check name.
+	'''
+	os.chdir(out_dir)
+	file_list = os.listdir()
+	file_list = natsorted(file_list)
+
+	# Test cases are all numbered to start with 0000
+	lines = []
+	for file_name in file_list:
+		if '0000' in file_name and file_name.endswith('_quality_checks.jsonl'):
+			with open(file_name, 'r') as file:
+				lines.extend(file)
+
+	if len(lines) == 0:
+		summary_df = pd.DataFrame(columns=['Test case', 'Worksheet pair'] + list(CHECK_COLUMNS.values()))
+	else:
+		records_df = pd.read_json(io.StringIO(''.join(lines)), lines=True, dtype=False)
+
+		# worksheet checks are identified by worksheet role, pair and negative checks by name only
+		per_worksheet = records_df['check'].isin(WORKSHEET_CHECKS)
+		records_df['column'] = np.where(per_worksheet, records_df['ws_role'] + ' ' + records_df['check'], records_df['check'])
+		records_df['column'] = records_df['column'].map(CHECK_COLUMNS)
+
+		summary_df = records_df.pivot_table(index='pair', columns='column', values='result', aggfunc='first')
+		summary_df = summary_df.reindex(index=natsorted(summary_df.index), columns=list(CHECK_COLUMNS.values()))
+		summary_df = summary_df.rename_axis(index='Worksheet pair', columns=None).reset_index()
+		summary_df.insert(0, 'Test case', range(1, len(summary_df) + 1))
+
+	# Create a html report summarizing PASS/FAIL composition of test cases
+	generate_html_output(summary_df, style)
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser()
+	parser.add_argument('-ws_dir', action='store', required=True)
+	parser.add_argument('-out_dir', action='store', required=True)
+	parser.add_argument('-pairing', action='store', required=True)
+	parser.add_argument('-workers', action='store', type=int, default=1, help='Number of test pairs to run at once in a process pool (default 1)')
+	args = parser.parse_args()
+
+	pair_xls = args.pairing
+	ws_dir = args.ws_dir
+	out_dir = args.out_dir
+
+	ws_pairs = sort_pairing(pair_xls)
+	worksheet_dirs = os.listdir(ws_dir)
+	style = html_report.page_style()
+
+	# Iterate through ws pairs and run_quality_check() for each pair in this process (or a process pool)
+	test_pairs = [(v[0], v[1]) for k,v in ws_pairs.items() if v[0] in worksheet_dirs and v[1] in worksheet_dirs]
+
+	if args.workers <= 1:
+		for ws_1, ws_2 in test_pairs:
+			run_quality_check(ws_1, ws_2, out_dir, ws_dir)
+	else:
+		with ProcessPoolExecutor(max_workers=args.workers) as ex:
+			futures = [ex.submit(run_quality_check, ws_1, ws_2, out_dir, ws_dir) for ws_1, ws_2 in test_pairs]
+			for future in futures:
+				future.result()
+
+	summarise_reports(out_dir, style)
@@ -0,0 +1,71 @@
+import numpy as np
+import bed_index
+import qc_cache
+
+
+def write_bed(tmp_path, lines):
+    path = tmp_path / 'coverage.bed'
+    path.write_text(''.join(f'{line}\n' for line in lines))
+
+    return str(path)
+
+
+def test_intervals_sharing_an_end_both_match(tmp_path):
+    index = bed_index.build_index(write_bed(tmp_path, ['chr1\t100\t200\tA_exon1', 'chr1\t150\t200\tA_exon1b', 'chr1\t300\t400\tA_exon2']))
+
+    missing, extra = bed_index.join_intervals(index, ['chr1', 'chr1', 'chr1'], [100, 150, 300], [200, 200, 400])
+
+    assert len(missing) == 0 and len(extra) == 0
+
+
+def test_one_based_starts_match(tmp_path):
+    index = bed_index.build_index(write_bed(tmp_path, ['chr1\t100\t200', 'chr1\t150\t200', 'chr2\t10\t20']))
+
+    missing, extra = bed_index.join_intervals(index, ['1', '1', '2'], [151, 101, 11], [200, 200, 20])
+
+    assert len(missing) == 0 and len(extra) == 0
+
+
+def test_zero_based_match_is_preferred(tmp_path):
+    # 101-200 is the 0-based start of the 2nd interval and the 1-based start of the 1st
+    index = bed_index.build_index(write_bed(tmp_path, ['chr1\t100\t200', 'chr1\t101\t200']))
+
+    missing, extra = bed_index.join_intervals(index, ['1', '1'], [100, 101], [200, 200])
+
+    assert len(missing) == 0 and len(extra) == 0
+
+
+def test_missing_and_extra_intervals(tmp_path, monkeypatch):
+    monkeypatch.setattr(qc_cache, 'CACHE_DIR', str(tmp_path / 'cache'))
+    index = bed_index.load_index(write_bed(tmp_path, ['chr1\t100\t200\tA', 'chr1\t150\t200\tB', 'chr3\t5\t50\tC']))
+
+    missing, extra = bed_index.join_intervals(index, ['1', '1', 'X'], [100, 160, 5], [200, 200, 50])
+
+    assert bed_index.interval_labels(index, missing) == ['B 1:151-200', 'C 3:6-50']
+    assert extra.tolist() == [1, 2]
+    # the index saved to the cache folder joins the same way
+    bed_index._indexes.clear()
+    cached = bed_index.load_index(index.path)
+    assert [np.array_equal(a, b) for a, b in zip(cached[1:], index[1:])] == [True] * 5
+
+
+def test_blank_and_non_numeric_coordinates_are_extra(tmp_path):
+    index = bed_index.build_index(write_bed(tmp_path, ['chr1\t100\t200\tA', 'chr1\t300\t400\tB']))
+
+    missing, extra = bed_index.join_intervals(index, ['1', '1', '1', '1'], [100, np.nan, 300, 'n/a'],
+                                              np.array([200, 250, np.nan, 400], dtype=object))
+
+    assert bed_index.interval_labels(index, missing) == ['B 1:301-400']
+    assert extra.tolist() == [1, 2, 3]
+
+
+def test_float_chromosomes_match(tmp_path):
+    index = bed_index.build_index(write_bed(tmp_path, ['chr1\t100\t200', 'chrX\t10\t20', 'chr2\t5\t50']))
+
+    # a numeric Chr column with a blank cell is read as float
+    missing, extra = bed_index.join_intervals(index, np.array([1.0, np.nan, 2.0]), [100, 10, 5], [200, 20, 50])
+    assert bed_index.interval_labels(index, missing) == ['X:11-20']
+    assert extra.tolist() == [1]
+
+    missing, extra = bed_index.join_intervals(index, np.array([1, 'X', 2], dtype=object), [100, 10, 5], [200, 20, 50])
+    assert len(missing) == 0 and len(extra) == 0
@@ -0,0 +1,85 @@
+import json
+import sqlite3
+import pandas as pd
+import pytest
+import command_log
+import qc_store
+
+
+def sample_sheet(worksheet, experiment='191212_M01234_0123_000000000-ABCDE'):
+    return f'/network/sequenced/MiSeq_data/TSHC/shire_worksheet_numbered/{worksheet}/{experiment}/SampleSheet.csv'
+
+
+def write_log(tmp_path, lines):
+    path = tmp_path / '000001.commandline_usage_logfile'
+    path.write_text(''.join(f'{line}\n' for line in lines))
+
+    return str(path)
+
+
+def test_sample_sheet_on_the_line_after_the_flag(tmp_path):
+    path = write_log(tmp_path, ['python TSHC_pipeline.py -s', f'{sample_sheet("000001")} -p TSHC'])
+
+    command = command_log.parse_command_log(path, '000001')
+
+    assert command.line == 2
+    assert command.sample_sheet == sample_sheet('000001')
+    assert command.experiment_name == '191212_M01234_0123_000000000-ABCDE'
+    assert (command.panel, command.run_folder) == ('TSHC', 'shire_worksheet_numbered')
+    assert command.command == f'python TSHC_pipeline.py -s {sample_sheet("000001")} -p TSHC'
+
+
+def test_other_worksheets_before_the_target(tmp_path):
+    path = write_log(tmp_path, [
+        'python TSHC_pipeline.py -s',
+        f'{sample_sheet("000002", "191210_M01234_0122_000000000-AAAAA")} -p TSHC',
+        # a sample sheet not following a -s flag is not a command
+        sample_sheet('000001', '191201_M01234_0100_000000000-BBBBB'),
+        'python TSHC_pipeline.py -s',
+        f'{sample_sheet("000001")} -p TSHC',
+        'python TSHC_pipeline.py -s',
+        f'{sample_sheet("000001", "191213_M01234_0124_000000000-CCCCC")} -p TSHC',
+    ])
+
+    command = command_log.parse_command_log(path, '000001')
+
+    # the first command for the worksheet is used
+    assert command.line == 5
+    assert command.experiment_name == '191212_M01234_0123_000000000-ABCDE'
+
+
+def test_missing_worksheet(tmp_path):
+    path = write_log(tmp_path, ['python TSHC_pipeline.py -s', f'{sample_sheet("000002")} -p TSHC', 'python TSHC_pipeline.py -s'])
+
+    with pytest.raises(Exception, match='The experiment name is not present'):
+        command_log.parse_command_log(path, '000001')
+
+
+def test_arguments(tmp_path):
+    path = write_log(tmp_path, ['nohup python TSHC_pipeline.py --threads 8 -v -s',
+                                f'{sample_sheet("000001")} -p TSHC -offset -1 -keep'])
+
+    command = command_log.parse_command_log(path, '000001')
+
+    assert command.program == 'nohup python TSHC_pipeline.py'
+    assert command.arguments == {'threads': '8', 'v': True, 's': sample_sheet('000001'), 'p': 'TSHC',
+                                 'offset': '-1', 'keep': True}
+
+
+def test_arguments_stored_as_pipeline_args(tmp_path):
+    path = write_log(tmp_path, ['python TSHC_pipeline.py -s', f'{sample_sheet("000001")} -p TSHC'])
+    command = command_log.parse_command_log(path, '000001')
+    run_details_df = pd.DataFrame({'Worksheet': ['000001'], 'Pipeline version': ['v0.5.2'],
+                                   'Experiment name': [command.experiment_name], 'AB threshold': [0.2]})
+    beds = {'000001': {'Target bed': 'a.bed', 'Refined bed': 'b.bed', 'Coverage bed': 'c.bed'}}
+    metrics_df = pd.DataFrame(columns=['Worksheet', 'Sample', 'Metric', 'Value'])
+    check_result_df = pd.DataFrame({'Worksheet': ['000001'], 'Check': ['A'], 'Result': ['PASS']})
+    db = str(tmp_path / 'qc.sqlite')
+
+    qc_store.write_run(db, 'TSHC', check_result_df, run_details_df, beds, metrics_df, {'000001': command._asdict()})
+
+    sample_sheet_path, pipeline_args, run_date = sqlite3.connect(db).execute(
+        'SELECT sample_sheet, pipeline_args, run_date FROM worksheets').fetchone()
+    assert sample_sheet_path == sample_sheet('000001')
+    assert json.loads(pipeline_args) == {'s': sample_sheet('000001'), 'p': 'TSHC'}
+    assert run_date == '2019-12-12'
@@ -0,0 +1,132 @@
+import zipfile
+import numpy as np
+import pandas as pd
+import pytest
+import excel_reader
+
+
+CONTENT_TYPES = '''<?xml version="1.0" encoding="UTF-8"?>
+<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">
+<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>
+<Default Extension="xml" ContentType="application/xml"/>
+<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>
+<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>
+<Override PartName="/xl/sharedStrings.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sharedStrings+xml"/>
+</Types>'''
+ROOT_RELS = '''<?xml version="1.0" encoding="UTF-8"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>
+</Relationships>'''
+WORKBOOK = '''<?xml version="1.0" encoding="UTF-8"?>
+<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">
+<sheets><sheet name="Kinship" sheetId="1" r:id="rId1"/></sheets>
+</workbook>'''
+WORKBOOK_RELS = '''<?xml version="1.0" encoding="UTF-8"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>
+<Relationship Id="rId2" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/sharedStrings" Target="sharedStrings.xml"/>
+</Relationships>'''
+SHARED_STRINGS = '''<?xml version="1.0" encoding="UTF-8"?>
+<sst xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">
+<si><t>ID1</t></si><si><t>ID2</t></si><si><t>Kinship</t></si><si><t>Flag</t></si><si><t>a</t></si><si><t>b</t></si><si><t>NA</t></si>
+</sst>'''
+
+
+def write_workbook(path, rows):
+    '''
+    Write a single sheet xlsx from the <row> elements of the sheet.
+    '''
+    sheet = ('<?xml version="1.0" encoding="UTF-8"?>'
+             '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+             + ''.join(rows) + '</sheetData></worksheet>')
+    with zipfile.ZipFile(path, 'w') as zf:
+        zf.writestr('[Content_Types].xml', CONTENT_TYPES)
+        zf.writestr('_rels/.rels', ROOT_RELS)
+        zf.writestr('xl/workbook.xml', WORKBOOK)
+        zf.writestr('xl/_rels/workbook.xml.rels', WORKBOOK_RELS)
+        zf.writestr('xl/sharedStrings.xml', SHARED_STRINGS)
+        zf.writestr('xl/worksheets/sheet1.xml', sheet)
+
+    return str(path)
+
+
+HEADER = '<row r="1"><c r="A1" t="s"><v>0</v></c><c r="B1" t="s"><v>1</v></c><c r="C1" t="s"><v>2</v></c><c r="D1" t="s"><v>3</v></c></row>'
+ROWS = [
+    HEADER,
+    '<row r="2"><c r="A2" t="s"><v>4</v></c><c r="B2" t="s"><v>5</v></c><c r="C2"><v>0.1</v></c><c r="D2" t="b"><v>1</v></c></row>',
+    # row 3 has no element, row 4 has no cells
+    '<row r="4"/>',
+    '<row r="5"><c r="A5" t="inlineStr"><is><t>c</t></is></c><c r="B5" t="inlineStr"><is><t>d</t></is></c><c r="C5"><v>0.49</v></c><c r="D5" t="b"><v>0</v></c></row>',
+    # blank cells, an error cell and an NA string
+    '<row r="6"><c r="A6" s="1"/><c r="B6" t="s"><v>6</v></c><c r="C6" t="e"><v>#DIV/0!</v></c></row>',
+    '<row r="7"><c r="A7" t="inlineStr"><is><t>e</t></is></c><c r="B7" t="str"><v>f</v></c><c r="C7" t="e"><v>#N/A</v></c><c r="D7" t="b"><v>1</v></c></row>',
+    # blank rows after the last data row, one only holding a styled cell
+    '<row r="9"/>',
+    '<row r="10"><c r="E10" s="1"/></row>',
+]
+
+
+@pytest.fixture(autouse=True)
+def clear_reader_cache():
+    yield
+    excel_reader.clear_cache()
+
+
+@pytest.mark.parametrize('column', ['ID1', 'ID2', 'Kinship', 'Flag'])
+def test_read_column_matches_read_excel(tmp_path, column):
+    path = write_workbook(tmp_path / 'kinship.xlsx', ROWS)
+
+    expected = pd.read_excel(path, 'Kinship')[column].values
+    values = excel_reader.read_column(path, 'Kinship', column)
+
+    assert len(values) == len(expected) == 6
+    assert pd.isna(values).tolist() == pd.isna(expected).tolist()
+    assert [value for value in values if not pd.isna(value)] == [value for value in expected if not pd.isna(value)]
+
+
+def test_read_column_rows_line_up_with_read_sheet(tmp_path):
+    path = write_workbook(tmp_path / 'kinship.xlsx', ROWS)
+
+    sheet_df = excel_reader.read_sheet(path, 'Kinship', ['ID1', 'ID2', 'Kinship'])
+    kinship = excel_reader.read_column(path, 'Kinship', 'Kinship')
+
+    failing = np.flatnonzero(kinship >= 0.48)
+    assert sheet_df['ID1'].values[failing].tolist() == ['c']
+    assert sheet_df['ID2'].values[failing].tolist() == ['d']
+
+
+def test_rows_without_r_attribute(tmp_path):
+    rows = [row.replace(' r="', ' x="') for row in ROWS[:2] + ROWS[3:6]]
+    path = write_workbook(tmp_path / 'kinship.xlsx', rows)
+
+    assert excel_reader.read_column(path, 'Kinship', 'Kinship').tolist()[:2] == [0.1, 0.49]
+
+
+def test_missing_column(tmp_path):
+    path = write_workbook(tmp_path / 'kinship.xlsx', ROWS)
+
+    with pytest.raises(Exception, match='Column Sex is not present'):
+        excel_reader.read_column(path, 'Kinship', 'Sex')
+
+
+def test_read_columns_by_name_and_position(tmp_path):
+    path = write_workbook(tmp_path / 'kinship.xlsx', ROWS)
+
+    columns = excel_reader.read_columns(path, 'Kinship', [0, 'ID2', 'Kinship'])
+    sheet_df = pd.read_excel(path, 'Kinship')
+
+    assert list(columns) == [0, 'ID2', 'Kinship']
+    for column, expected in zip(columns.values(), (sheet_df['ID1'], sheet_df['ID2'], sheet_df['Kinship'])):
+        assert pd.isna(column).tolist() == pd.isna(expected).tolist()
+    # the columns are cached on their own, so read_column reuses them
+    assert excel_reader.read_column(path, 'Kinship', 'Kinship') is columns['Kinship']
+
+
+def test_read_columns_whole_numbers(tmp_path):
+    rows = [HEADER] + [f'<row r="{row}"><c r="A{row}"><v>{row}</v></c><c r="C{row}"><v>{row / 4}</v></c></row>' for row in range(2, 6)]
+    path = write_workbook(tmp_path / 'kinship.xlsx', rows)
+
+    columns = excel_reader.read_columns(path, 'Kinship', ['ID1', 'Kinship'])
+
+    assert columns['ID1'].dtype == pd.read_excel(path, 'Kinship')['ID1'].dtype == np.int64
+    assert columns['Kinship'].tolist() == [0.5, 0.75, 1.0, 1.25]
@@ -0,0 +1,45 @@
+import os
+import json
+import qc_cache
+
+
+def result_files(cache_dir):
+    return sorted(name for name in os.listdir(cache_dir / 'results') if name.endswith('.pkl'))
+
+
+def test_store_tracks_size_without_scanning(tmp_path, monkeypatch):
+    monkeypatch.setattr(qc_cache, 'CACHE_DIR', str(tmp_path))
+    scans = []
+    monkeypatch.setattr(qc_cache, 'evict_results', lambda max_bytes: scans.append(max_bytes) or os.path.getsize(tmp_path / 'results' / 'key0.pkl'))
+
+    for i in range(5):
+        qc_cache.store_result(f'key{i}', 'x' * 100, max_bytes=10 ** 6)
+    # replacing a result does not add to the tracked size
+    qc_cache.store_result('key0', 'x' * 100, max_bytes=10 ** 6)
+
+    index = json.load(open(tmp_path / 'results' / 'index.json'))
+    # the first store scans the cache to find its size
+    assert scans == [10 ** 6]
+    assert index['stores'] == 5
+    assert index['bytes'] == sum(os.path.getsize(tmp_path / 'results' / name) for name in result_files(tmp_path))
+
+
+def test_evicts_least_recently_used_with_their_hashes(tmp_path, monkeypatch):
+    monkeypatch.setattr(qc_cache, 'CACHE_DIR', str(tmp_path))
+    old_input = tmp_path / 'old.xlsx'
+    old_input.write_text('old')
+    qc_cache.file_fingerprint(str(old_input))
+    qc_cache.store_result('old', 'x' * 100)
+    size = os.path.getsize(tmp_path / 'results' / 'old.pkl')
+
+    for path in [tmp_path / 'results' / 'old.pkl', *(tmp_path / 'hashes').iterdir()]:
+        os.utime(path, ns=(10 ** 9, 10 ** 9))
+    new_input = tmp_path / 'new.xlsx'
+    new_input.write_text('new')
+    qc_cache.file_fingerprint(str(new_input))
+    qc_cache.store_result('new', 'x' * 100, max_bytes=size)
+
+    assert result_files(tmp_path) == ['new.pkl']
+    assert qc_cache.stored_fingerprint(str(old_input)) == None
+    assert qc_cache.stored_fingerprint(str(new_input)) != None
+    assert json.load(open(tmp_path / 'results' / 'index.json')) == {'bytes': size, 'stores': 0}
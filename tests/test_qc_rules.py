@@ -0,0 +1,173 @@
+import numpy as np
+import pandas as pd
+import pytest
+import qc_rules
+
+
+def write_sheets(path, sheets):
+    '''
+    Write an xlsx with a sheet for each {sheet name: dataframe}.
+    '''
+    with pd.ExcelWriter(path) as writer:
+        for sheet, sheet_df in sheets.items():
+            sheet_df.to_excel(writer, sheet_name=sheet, index=False)
+
+    return str(path)
+
+
+def rule(**kwargs):
+    return qc_rules.compile_rule(dict({'name': 'Test', 'input': 'results', 'sheet': 'Sheet', 'column': 'Value'}, **kwargs))
+
+
+@pytest.mark.parametrize('op, failing', [('<', [1]), ('<=', [1, 2]), ('>', [3]), ('>=', [2, 3]), ('==', [2]), ('!=', [1, 3])])
+def test_fail_if(op, failing):
+    result, failures, note = qc_rules.evaluate_rule(rule(fail_if=op, threshold=2), None, {'Value': np.array([1, 2, 3])})
+
+    assert result == ('FAIL' if failing else 'PASS')
+    assert [failure['Value'] for failure in failures] == failing
+    # without a label rows are named by excel row number
+    assert [failure['Sample'] for failure in failures] == [f'Row {value + 1}' for value in failing]
+
+
+def test_text_threshold():
+    result, failures, note = qc_rules.evaluate_rule(rule(fail_if='==', threshold='FAIL'), None,
+                                                    {'Value': np.array(['PASS', 'FAIL', 'PASS'], dtype=object)})
+
+    assert result == 'FAIL'
+    assert failures == [{'Sample': 'Row 3', 'Value': 'FAIL'}]
+
+
+def test_fail_non_finite():
+    values = {'Value': np.array([0.1, np.nan, np.inf, 0.5, 'text'], dtype=object)}
+
+    # inf fails the comparison, nan and text (read as nan) do not
+    result, failures, note = qc_rules.evaluate_rule(rule(fail_if='>=', threshold=0.48), None, values)
+    assert [failure['Sample'] for failure in failures] == ['Row 4', 'Row 5']
+
+    result, failures, note = qc_rules.evaluate_rule(rule(fail_if='>=', threshold=0.48, fail_non_finite=True), None, values)
+    assert [failure['Sample'] for failure in failures] == ['Row 3', 'Row 4', 'Row 5', 'Row 6']
+
+
+@pytest.mark.parametrize('row_filter, failing', [
+    ({'column': 'Sample', 'op': 'not_contains', 'value': 'D00-00000'}, ['Row 2']),
+    ({'column': 'Sample', 'op': 'contains', 'value': 'D00-00000'}, ['Row 4']),
+    ({'column': 'Depth', 'op': '>', 'value': 10}, ['Row 4']),
+])
+def test_filters(row_filter, failing):
+    columns = {'Sample': np.array(['S1', 'S2', 'D00-00000'], dtype=object), 'Value': np.array([0.9, 0.99, 0.1]),
+               'Depth': np.array([5, 10, 15])}
+
+    result, failures, note = qc_rules.evaluate_rule(rule(fail_if='<', threshold=0.96, filter=[row_filter]), None, columns)
+
+    assert [failure['Sample'] for failure in failures] == failing
+
+
+def test_count():
+    vcf_rule = qc_rules.compile_rule({'name': 'VCFs', 'input': 'vcfs', 'aggregate': 'count', 'fail_if': '!=', 'threshold': 3})
+    assert qc_rules.evaluate_rule(vcf_rule, ['a.vcf', 'b.vcf', 'c.vcf'], None) == ('PASS', [], '')
+    assert qc_rules.evaluate_rule(vcf_rule, ['a.vcf', 'b.vcf'], None) == ('FAIL', [], '')
+
+    # a sheet count is taken after the filters
+    count_rule = rule(aggregate='count', fail_if='<', threshold=2, filter=[{'column': 'Value', 'op': '>', 'value': 1}])
+    assert qc_rules.evaluate_rule(count_rule, None, {'Value': np.array([1, 2, 3])})[0] == 'PASS'
+    assert qc_rules.evaluate_rule(count_rule, None, {'Value': np.array([1, 1, 3])})[0] == 'FAIL'
+
+
+@pytest.mark.parametrize('label, names', [
+    ('{ID1}/{ID2}', ['c/d']),
+    ('{0}', ['1']),
+    ('{id1} {Kinship}', ['c 0.49']),
+    ('{Sex}', ['Row 3']),
+    (None, ['Row 3']),
+])
+def test_labels(tmp_path, label, names):
+    path = write_sheets(tmp_path / 'kinship.xlsx', {'Kinship': pd.DataFrame({
+        'FID1': [0, 1], 'ID1': ['a', 'c'], 'ID2': ['b', 'd'], 'Kinship': [0.1, 0.49]})})
+    kinship_rule = rule(input='kinship', sheet='Kinship', column='Kinship', fail_if='>=', threshold=0.48, label=label)
+
+    result, failures, note = qc_rules.evaluate_rule(kinship_rule, path, qc_rules.read_columns(path, 'Kinship', ['Kinship']))
+
+    assert failures == [{'Sample': name, 'Value': 0.49} for name in names]
+
+
+def test_invalid_rules():
+    with pytest.raises(Exception, match='fail_if must be one of'):
+        rule(fail_if='=>', threshold=1)
+    with pytest.raises(Exception, match='only an unfiltered count'):
+        qc_rules.compile_rule({'name': 'VCFs', 'input': 'vcfs', 'fail_if': '!=', 'threshold': 48})
+
+
+def test_add_row():
+    check_result_df = pd.DataFrame(columns=['Worksheet', 'Check', 'Result', 'Cached', 'Failures'])
+
+    check_result_df = qc_rules.add_row(check_result_df, {'Check': 'A', 'Result': 'PASS', 'Worksheet': '000001', 'Failures': []})
+    check_result_df = qc_rules.add_row(check_result_df, {'Check': 'B', 'Result': 'FAIL', 'Worksheet': '000001',
+                                                         'Failures': [{'Sample': 'S1', 'Value': 4.2}], 'Note': 'x'})
+
+    assert check_result_df.columns.tolist() == ['Worksheet', 'Check', 'Result', 'Cached', 'Failures', 'Note']
+    assert check_result_df['Check'].tolist() == ['A', 'B']
+    assert check_result_df['Failures'].tolist() == [[], [{'Sample': 'S1', 'Value': 4.2}]]
+    assert check_result_df['Cached'].isna().all()
+
+
+SAMPLES = ['000001-01-D19-00101', '000001-02-D19-00102', '000001-48-D00-00000']
+
+
+def hyb_qc(coverage):
+    return pd.DataFrame({'Sample': SAMPLES, 'PCT_TARGET_BASES_20X': coverage})
+
+
+def verify_bam_id(contamination):
+    return pd.DataFrame({'SEQ_ID': SAMPLES, '%CONT': contamination})
+
+
+def coverage_exon(maxes):
+    return pd.DataFrame({'Gene': [f'GENE_exon{i}' for i in range(len(maxes))], 'Chr': '1', 'Start': 100,
+                         'End': 200, 'Max': maxes})
+
+
+def fastq_bam(results):
+    return pd.DataFrame({'Sample': SAMPLES, 'Result': results})
+
+
+def kinship(values):
+    return pd.DataFrame({'ID1': ['a', 'a', 'b'], 'ID2': ['b', 'c', 'c'], 'Kinship': values})
+
+
+# One case per TSHC rule: the sheets of its input and the result of the check before it was
+# moved to rules/TSHC.json (a PASS and a FAIL case for each rule, across the parametrised cases).
+TSHC_CASES = [
+    ('VerifyBamId check', 'results', {'Hyb-QC': hyb_qc([0.97] * 3), 'VerifyBamId': verify_bam_id([0.1, 2.99, 0.0])}, 'PASS'),
+    ('VerifyBamId check', 'results', {'Hyb-QC': hyb_qc([0.97] * 3), 'VerifyBamId': verify_bam_id([0.1, 3.0, 0.0])}, 'FAIL'),
+    # the negative control is not checked for coverage
+    ('20x coverage check', 'results', {'Hyb-QC': hyb_qc([0.96, 0.99, 0.0]), 'VerifyBamId': verify_bam_id([0.1] * 3)}, 'PASS'),
+    ('20x coverage check', 'results', {'Hyb-QC': hyb_qc([0.95, 0.99, 0.0]), 'VerifyBamId': verify_bam_id([0.1] * 3)}, 'FAIL'),
+    ('FASTQ-BAM check', 'fastq_bam', {'Check': fastq_bam(['PASS', 'PASS', 'PASS'])}, 'PASS'),
+    ('FASTQ-BAM check', 'fastq_bam', {'Check': fastq_bam(['PASS', 'FAIL', 'PASS'])}, 'FAIL'),
+    # without the coverage BED the number of exons is compared with 1209
+    ('Number of exons in negative sample', 'neg', {'Coverage-exon': coverage_exon([0] * 1209)}, 'PASS'),
+    ('Number of exons in negative sample', 'neg', {'Coverage-exon': coverage_exon([0] * 1208)}, 'FAIL'),
+    ('Contamination of negative sample', 'neg', {'Coverage-exon': coverage_exon([0] * 1209)}, 'PASS'),
+    ('Contamination of negative sample', 'neg', {'Coverage-exon': coverage_exon([0] * 1208 + [1])}, 'FAIL'),
+    ('Kinship check', 'kinship', {'Kinship': kinship([0.1, 0.47, -0.2])}, 'PASS'),
+    ('Kinship check', 'kinship', {'Kinship': kinship([0.1, 0.48, -0.2])}, 'FAIL'),
+    ('Kinship check', 'kinship', {'Kinship': kinship([0.1, np.inf, -0.2])}, 'FAIL'),
+]
+
+
+@pytest.mark.parametrize('check, input_name, sheets, expected', TSHC_CASES)
+def test_tshc_rules(tmp_path, check, input_name, sheets, expected):
+    rule_set = qc_rules.load_rules('TSHC')
+    path = write_sheets(tmp_path / 'report.xlsx', sheets)
+    check_result_df = pd.DataFrame(columns=['Worksheet', 'Check', 'Description', 'Result', 'Cached', 'Failures'])
+
+    check_result_df = qc_rules.evaluate(rule_set, input_name, path, '000001', check_result_df)
+
+    assert check_result_df.set_index('Check').loc[check, 'Result'] == expected
+
+
+def test_tshc_vcf_count():
+    vcf_rule = next(rule for rule in qc_rules.load_rules('TSHC').rules if rule.name == 'VCF file count check')
+
+    assert qc_rules.evaluate_rule(vcf_rule, [f'{i}.vcf' for i in range(48)], None)[0] == 'PASS'
+    assert qc_rules.evaluate_rule(vcf_rule, [f'{i}.vcf' for i in range(47)], None)[0] == 'FAIL'
@@ -0,0 +1,141 @@
+import os
+import gzip
+import mmap
+import zlib
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+
+# Empty BGZF block which bgzip/htslib write at the end of every complete .vcf.gz file (SAM spec 4.1.2)
+BGZF_EOF = bytes.fromhex('1f8b08040000000000ff0600424302001b0003000000000000000000')
+GZIP_MAGIC = b'\x1f\x8b'
+VCF_SUFFIXES = ('.vcf', '.vcf.gz')
+# fixed columns of the #CHROM header line
+VCF_COLUMNS = ['#CHROM', 'POS', 'ID', 'REF', 'ALT', 'QUAL', 'FILTER', 'INFO']
+
+
+def read_tail(path, size):
+    '''
+    Return the last size bytes of a file by memory-mapping only the page(s) at the end of the file.
+    Returns b'' for an empty file (which cannot be mapped).
+    '''
+    file_size = os.path.getsize(path)
+    if file_size == 0:
+        return b''
+
+    # mmap offsets must be a multiple of the allocation granularity
+    offset = max(file_size - size, 0) // mmap.ALLOCATIONGRANULARITY * mmap.ALLOCATIONGRANULARITY
+    with open(path, 'rb') as file:
+        with mmap.mmap(file.fileno(), file_size - offset, access=mmap.ACCESS_READ, offset=offset) as tail:
+            return tail[-size:]
+
+
+def open_vcf(path):
+    '''
+    Open a plain or gzipped VCF for reading bytes, depending on its first 2 bytes.
+    '''
+    with open(path, 'rb') as file:
+        magic = file.read(2)
+
+    if magic == GZIP_MAGIC:
+        return gzip.open(path, 'rb')
+
+    return open(path, 'rb')
+
+
+def check_header(vcf):
+    '''
+    Read the header of an open VCF up to the #CHROM line. The 1st line must be ##fileformat=VCF
+    and the #CHROM line must have the 8 fixed columns. Returns an error message (None if the header
+    is well formed) and the number of header lines.
+    '''
+    header_lines = 0
+    for line in vcf:
+        header_lines += 1
+        if header_lines == 1 and not line.startswith(b'##fileformat=VCF'):
+            return 'The 1st line is not ##fileformat=VCF', header_lines
+        if line.startswith(b'#CHROM'):
+            if line.rstrip(b'\r\n').split(b'\t')[:len(VCF_COLUMNS)] != [column.encode() for column in VCF_COLUMNS]:
+                return 'The #CHROM header line does not have the fixed VCF columns', header_lines
+            return None, header_lines
+        if not line.startswith(b'##'):
+            return 'The #CHROM header line is missing', header_lines
+
+    return 'The #CHROM header line is missing', header_lines
+
+
+def count_records(vcf):
+    '''
+    Count the records left in an open VCF (after check_header) by streaming it in 1MB blocks
+    and counting newlines. A final record without a newline is also counted.
+    '''
+    records = 0
+    last = b'\n'
+    for block in iter(lambda: vcf.read(1024 * 1024), b''):
+        records += block.count(b'\n')
+        last = block[-1:]
+
+    if last != b'\n':
+        records += 1
+
+    return records
+
+
+def check_vcf(path, records=False):
+    '''
+    Check a single VCF without reading the whole file:
+        1) The file is not empty
+        2) bgzipped files end with the BGZF EOF block and plain files end with a newline
+           (read from a memory-map of the file tail)
+        3) The header is well formed (only the header is read)
+    If records is True the records are also counted by streaming the whole file, which also
+    finds corrupt gzip blocks. Returns a dict with the file name, PASS/FAIL, error and record count.
+    '''
+    result = {'File': os.path.basename(path), 'Result': 'PASS', 'Error': '', 'Records': None}
+
+    try:
+        tail = read_tail(path, len(BGZF_EOF))
+        if tail == b'':
+            error = 'Empty file'
+        elif path.endswith('.gz') and tail != BGZF_EOF:
+            error = 'Missing BGZF EOF block (truncated file)'
+        elif not path.endswith('.gz') and tail[-1:] != b'\n':
+            error = 'No newline at end of file (truncated file)'
+        else:
+            with open_vcf(path) as vcf:
+                error, header_lines = check_header(vcf)
+                if error == None and records:
+                    result['Records'] = count_records(vcf)
+    except (OSError, EOFError, zlib.error) as e:
+        error = f'Unreadable file: {e}'
+
+    if error != None:
+        result['Result'] = 'FAIL'
+        result['Error'] = error
+
+    return result
+
+
+def check_vcfs(paths, records=False, workers=16):
+    '''
+    Check each VCF (.vcf or .vcf.gz, other files such as indexes are skipped) on a thread pool so
+    the small tail and header reads of all files overlap. Returns the results in path order.
+    '''
+    vcfs = [path for path in paths if path.endswith(VCF_SUFFIXES)]
+    if len(vcfs) == 0:
+        return []
+
+    with ThreadPoolExecutor(max_workers=min(workers, len(vcfs))) as ex:
+        return list(ex.map(lambda path: check_vcf(path, records), vcfs))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Check the VCFs in a folder are complete')
+    parser.add_argument('-vcf_dir', action='store', required=True, help='Path to a vcfs_<panel>_<ws> folder')
+    parser.add_argument('-records', action='store_true', help='Also count the records of each VCF (reads every file)')
+    parser.add_argument('-workers', action='store', type=int, default=16, help='Number of VCFs checked at once (default 16)')
+    args = parser.parse_args()
+
+    paths = sorted(os.path.join(args.vcf_dir, name) for name in os.listdir(args.vcf_dir))
+    for result in check_vcfs(paths, args.records, args.workers):
+        print('\t'.join(str(value) for value in result.values()))
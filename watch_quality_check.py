@@ -0,0 +1,213 @@
+import os
+import json
+import time
+import hashlib
+import argparse
+import quality_check
+import qc_cache
+import qc_rules
+from qc_cache import TSHC_DIR, build_manifest
+from batch_quality_check import resolve_pair, check_pair
+
+
+def scan_tree(root, dir_state):
+    '''
+    Find the TSHC output folders under root, returning a dict of worksheet number -> list of paths.
+    dir_state maps each folder walked to (mtime, sub folders) from the previous scan. A folder
+    is only listed again if its mtime has changed, so a rescan of an unchanged tree is one stat
+    per folder. The scan does not descend into TSHC output folders.
+    '''
+    tshc_dirs = {}
+    stack = [root]
+
+    while stack:
+        path = stack.pop()
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            dir_state.pop(path, None)
+            continue
+
+        if path in dir_state and dir_state[path][0] == mtime:
+            sub_dirs = dir_state[path][1]
+        else:
+            with os.scandir(path) as entries:
+                sub_dirs = sorted(entry.path for entry in entries if entry.is_dir())
+            dir_state[path] = (mtime, sub_dirs)
+
+        for sub_dir in sub_dirs:
+            run_info = TSHC_DIR.match(os.path.basename(sub_dir))
+            if run_info != None:
+                tshc_dirs.setdefault(run_info.group(2), []).append(os.path.join(sub_dir, ''))
+            else:
+                stack.append(sub_dir)
+
+    return tshc_dirs
+
+
+def output_complete(manifest):
+    '''
+    True if a TSHC output folder has a complete output set: the number of VCFs required by the
+    panel rules (48 for TSHC), the excel reports (results and fastq-bam-check) and the
+    commandline_usage_logfile. Folders of panels without a rule file are never complete.
+    '''
+    if not os.path.exists(qc_rules.rules_file(manifest.panel)):
+        return False
+
+    vcf_count = qc_rules.expected_count(qc_rules.load_rules(manifest.panel), 'vcfs')
+
+    return ((len(manifest.vcfs) == vcf_count if vcf_count != None else len(manifest.vcfs) != 0)
+            and len(manifest.results_reports) != 0
+            and len(manifest.fastq_bam_reports) != 0
+            and manifest.cmd_log != None)
+
+
+def complete_pairs(tshc_dirs, done):
+    '''
+    Return {(ws_1, ws_2): signature} for each pair not in done where ws_1 has the pair king file
+    and both worksheets have a complete output set. The signature is the folder mtimes of both
+    manifests, which changes while the pipeline is still writing to either folder.
+    Folders in done are skipped without being examined.
+    '''
+    pairs = {}
+    for ws_1_dirs in tshc_dirs.values():
+        for ws_1 in ws_1_dirs:
+            if ws_1 in done:
+                continue
+
+            manifest_1 = build_manifest(ws_1)
+            if not output_complete(manifest_1):
+                continue
+
+            for king_file in manifest_1.king_files:
+                ws_2 = resolve_pair(ws_1, king_file, tshc_dirs)
+                if ws_2 == None:
+                    continue
+
+                manifest_2 = build_manifest(ws_2)
+                if output_complete(manifest_2):
+                    pairs[(ws_1, ws_2)] = json.dumps([manifest_1.dir_mtimes, manifest_2.dir_mtimes], sort_keys=True)
+
+    return pairs
+
+
+def state_file(root):
+    '''
+    File used to record the TSHC folders which have already been checked for a watched root.
+    '''
+    return os.path.join(qc_cache.CACHE_DIR, 'watch', hashlib.sha1(os.path.abspath(root).encode()).hexdigest() + '.json')
+
+
+def load_done(root):
+    '''
+    Set of TSHC folders already checked (None if this root has not been watched before).
+    '''
+    try:
+        with open(state_file(root)) as file:
+            return set(json.load(file))
+    except (OSError, ValueError):
+        return None
+
+
+def save_done(root, done):
+    '''
+    Record the TSHC folders already checked so that a restarted watch does not re-check them.
+    '''
+    path = state_file(root)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + '.tmp', 'w') as file:
+        json.dump(sorted(done), file)
+    os.replace(path + '.tmp', path)
+
+
+def retry_delay(attempts, retry=300, max_retry=6 * 60 * 60):
+    '''
+    Seconds to wait before checking a pair again after attempts checks ended in ERROR: retry
+    seconds, doubled after each further error up to max_retry.
+    '''
+    return min(retry * 2 ** (attempts - 1), max_retry)
+
+
+def watch(root, out_dir=None, interval=60, debounce=300, run_existing=False, use_cache=True, db=None, cycles=None, retry=300):
+    '''
+    Poll root every interval seconds and run the quality checks for each pair once both of its
+    worksheets have a complete output set which has not changed for debounce seconds.
+    Each rescan only lists folders whose mtime changed and skips folders already checked.
+    A pair is only recorded as checked if its checks ran (PASS or FAIL). A pair ending in ERROR
+    (e.g. a network filesystem error or a report still being written) stays pending and is checked
+    again after retry seconds, doubling after each further error (see retry_delay), or after the
+    debounce period if either folder changes.
+    The first time a root is watched, pairs which are already complete are recorded as checked
+    without being run, unless run_existing is True. cycles limits the number of polls (None runs forever).
+    '''
+    done = load_done(root)
+    dir_state = {}
+    pending = {}
+    # pair -> (number of checks ending in ERROR, time of the next check)
+    retries = {}
+
+    if done == None:
+        done = set()
+        if not run_existing:
+            existing = complete_pairs(scan_tree(root, dir_state), done)
+            for ws_1, ws_2 in existing:
+                done.update([ws_1, ws_2])
+            save_done(root, done)
+            print(f'Watching {root} for the first time: {len(existing)} complete pairs recorded as already checked')
+
+    cycle = 0
+    while cycles == None or cycle < cycles:
+        start = time.perf_counter()
+        now = time.time()
+        tshc_dirs = scan_tree(root, dir_state)
+        ready = complete_pairs(tshc_dirs, done)
+
+        for pair, signature in ready.items():
+            # (re)start the debounce period whenever either folder changes
+            if pair not in pending or pending[pair][0] != signature:
+                pending[pair] = (signature, now)
+                retries.pop(pair, None)
+                continue
+            if now - pending[pair][1] < debounce or (pair in retries and now < retries[pair][1]):
+                continue
+
+            ws_1, ws_2 = pair
+            print(f'Running quality checks for {ws_1} and {ws_2}')
+            result = check_pair(ws_1, ws_2, out_dir, use_cache, db)
+            print(f'{os.path.basename(ws_1.rstrip("/"))} {os.path.basename(ws_2.rstrip("/"))}: {result["Status"]} {result["Error"]}')
+            if result['Status'] == 'ERROR':
+                attempts = retries.get(pair, (0, now))[0] + 1
+                retries[pair] = (attempts, time.time() + retry_delay(attempts, retry))
+                print(f'Retrying in {retry_delay(attempts, retry):.0f}s (attempt {attempts} failed)')
+                continue
+
+            done.update(pair)
+            save_done(root, done)
+            del pending[pair]
+            retries.pop(pair, None)
+
+        # forget pairs which are no longer complete (e.g. output folder removed)
+        for pair in set(pending) - set(ready):
+            del pending[pair]
+            retries.pop(pair, None)
+
+        print(f'Scanned {len(dir_state)} folders in {time.perf_counter() - start:.2f}s, {len(pending)} pairs waiting')
+        cycle += 1
+        if cycles == None or cycle < cycles:
+            time.sleep(interval)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-root', action='store', required=True, help='Path to a folder containing TSHC_<ws>_<version> output folders')
+    parser.add_argument('-out_dir', action='store', nargs='?', help='Specifing an output directory to store html reports')
+    parser.add_argument('-interval', action='store', type=float, default=60, help='Seconds between scans (default 60)')
+    parser.add_argument('-debounce', action='store', type=float, default=300, help='Seconds a complete pair must be unchanged before it is checked (default 300)')
+    parser.add_argument('-run_existing', action='store_true', help='On the first watch of a root also check pairs which are already complete')
+    parser.add_argument('-retry', action='store', type=float, default=300, help='Seconds before a pair ending in ERROR is checked again, doubled after each further error (default 300)')
+    parser.add_argument('-no_cache', '--no-cache', action='store_true', dest='no_cache', help='Re-run every check instead of using cached results')
+    parser.add_argument('-db', action='store', default=quality_check.DEFAULT_DB, help=f'Results database to add the results to (default {quality_check.DEFAULT_DB})')
+    parser.add_argument('-no_db', action='store_true', help='Do not add the results to the results database')
+    args = parser.parse_args()
+
+    watch(args.root, args.out_dir, args.interval, args.debounce, args.run_existing, not args.no_cache, None if args.no_db else args.db, retry=args.retry)